@@ -0,0 +1,83 @@
+"""
+Enrichment throughput with the process pool versus in-thread enrichment.
+
+Enriches translated METAR records from a generated snapshot with 0 (in the
+calling thread), 1, 2, ... worker processes and prints records/second per
+setting. Throughput should scale with workers up to the number of cores.
+
+Usage:
+    python benchmarks/bench_enrichment_pool.py [--records 200] [--workers 1,2,4]
+"""
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from multiprocessing import Queue
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+os.chdir(REPO_DIR)
+
+from feed_snapshots import metar_snapshot
+
+
+def translated_records(count):
+    from data_sources.metar_data import MetarDataSource
+    source = MetarDataSource(config_path='src/config/metar_config.json', queue=Queue())
+    records = []
+    for metar in ET.fromstring(metar_snapshot(count)).iter('METAR'):
+        records.append(source.translator.translate(source.decode_metar(metar)))
+    return records
+
+
+def in_thread(records, batch_size):
+    from enrichers.solar_system_influence import SolarSystemInfluence
+    from utils.record_batch import RecordBatch
+    enricher = SolarSystemInfluence()
+    enricher.planets
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        enricher.enrich_batch(RecordBatch.from_records(records[start:start + batch_size], source='metar'))
+    return time.perf_counter() - started
+
+
+def with_pool(records, workers, batch_size):
+    from enrichers.enrichment_pool import CONTEXT, EnrichmentPool
+    output = CONTEXT.Queue()
+    pool = EnrichmentPool(output, workers=workers, batch_size=batch_size).start()
+    try:
+        # Warm up: let the workers load their ephemeris before the timed run
+        for i in range(workers):
+            pool.submit(records[i:i + 1], 'metar')
+        for _ in range(workers):
+            output.get()
+        started = time.perf_counter()
+        pool.submit(records, 'metar')
+        received = 0
+        while received < len(records):
+            received += len(output.get())
+        return time.perf_counter() - started
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', default=','.join(str(n) for n in (1, 2, 4) if n <= (os.cpu_count() or 1)) or '1')
+    args = parser.parse_args()
+
+    records = translated_records(args.records)
+    seconds = in_thread(records, args.batch_size)
+    print(f"cores: {os.cpu_count()}")
+    print(f"{'in thread':<12} {len(records) / seconds:8.1f} records/s")
+    for workers in (int(n) for n in args.workers.split(',')):
+        seconds = with_pool(records, workers, args.batch_size)
+        print(f"{f'{workers} workers':<12} {len(records) / seconds:8.1f} records/s")
+
+
+if __name__ == '__main__':
+    main()
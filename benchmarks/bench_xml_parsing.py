@@ -0,0 +1,86 @@
+"""
+Compares the legacy find()-per-field extraction of METAR and AircraftReport
+elements against the single-pass element_to_dict extractor.
+
+Usage:
+    python benchmarks/bench_xml_parsing.py [--metar-snapshot metars.cache.xml.gz]
+                                           [--aircraft-snapshot aircraftreports.cache.xml.gz]
+
+Without snapshot paths a synthetic snapshot in the aviationweather.gov cache
+layout is generated (see feed_snapshots.py).
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from feed_snapshots import metar_snapshot, aircraft_snapshot
+from utils.helpers import element_to_dict
+from data_sources.aircraft_data import AIRCRAFT_REPORT_FIELDS
+from translators.aircraft_translator import translate_row
+
+METAR_FIELDS = (
+    'station_id', 'observation_time', 'latitude', 'longitude', 'visibility_statute_mi', 'wind_speed_kt',
+    'wind_dir_degrees', 'altim_in_hg', 'temp_c', 'dewpoint_c'
+)
+
+
+def legacy_extract(element, tags):
+    return {tag: element.find(tag).text if element.find(tag) is not None else None for tag in tags}
+
+
+def single_pass_extract(element, tags):
+    fields = element_to_dict(element)
+    return {tag: fields.get(tag) for tag in tags}
+
+
+def load_snapshot(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def time_extraction(elements, extract, tags, translate=None, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for element in elements:
+            row = extract(element, tags)
+            if translate:
+                translate(row)
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(elements), 1)
+
+
+def report(name, elements, tags, translate=None):
+    legacy = time_extraction(elements, legacy_extract, tags, translate)
+    single = time_extraction(elements, single_pass_extract, tags, translate)
+    print(f"{name:<10} reports={len(elements):<7} legacy={legacy * 1e6:8.2f} us/report "
+          f"single-pass={single * 1e6:8.2f} us/report speedup={legacy / single:5.2f}x")
+    return legacy / single
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--metar-snapshot', help='Recorded metars.cache.xml(.gz) file')
+    parser.add_argument('--aircraft-snapshot', help='Recorded aircraftreports.cache.xml(.gz) file')
+    parser.add_argument('--count', type=int, default=5000, help='Reports per synthetic snapshot')
+    args = parser.parse_args()
+
+    metar_xml = load_snapshot(args.metar_snapshot) if args.metar_snapshot else metar_snapshot(args.count)
+    aircraft_xml = load_snapshot(args.aircraft_snapshot) if args.aircraft_snapshot else aircraft_snapshot(args.count)
+
+    metars = list(ET.fromstring(metar_xml).iter('METAR'))
+    aircraft_reports = list(ET.fromstring(aircraft_xml).iter('AircraftReport'))
+
+    report('METAR', metars, METAR_FIELDS)
+    report('aircraft', aircraft_reports, AIRCRAFT_REPORT_FIELDS)
+    report('aircraft+tr', aircraft_reports, AIRCRAFT_REPORT_FIELDS, translate=translate_row)
+
+
+if __name__ == '__main__':
+    main()
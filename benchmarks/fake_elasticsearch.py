@@ -0,0 +1,301 @@
+"""
+Lightweight stand-in for an Elasticsearch node, for load testing the
+indexing path without a cluster.
+
+Implements GET /, /_cluster/health, index HEAD/PUT/DELETE, index settings
+(GET/PUT /<index>/_settings), POST /<index>/_refresh and /_bulk (PUT or
+POST, also /<index>/_bulk). Bulk requests can be slowed down
+(latency + jitter), rejected as a whole with 429 (throttle_rate, or when
+more than max_in_flight bulk requests run at once) and can fail individual
+items (failure_rate, failure_status). Accepted documents are only counted, not stored.
+Throughput counters are served on GET /_fake/stats.
+
+Usage:
+    python benchmarks/fake_elasticsearch.py --port 9200 --latency 0.05 --throttle-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCT_HEADERS = {
+    "X-Elastic-Product": "Elasticsearch",
+    "Content-Type": "application/json",
+}
+
+
+class FakeElasticsearch:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, latency_jitter=0.0, throttle_rate=0.0,
+                 failure_rate=0.0, failure_status=429, max_in_flight=0, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.max_in_flight = max_in_flight
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.indices = {}
+        # index -> {setting: value}, and the indices refreshed, in order
+        self.settings = {}
+        self.refreshed = []
+        self._in_flight = 0
+        self.reset_stats()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self._server.server_address[0]}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-elasticsearch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                "requests": 0,
+                "bulk_requests": 0,
+                "throttled_requests": 0,
+                "docs_indexed": 0,
+                "docs_failed": 0,
+                "bytes_received": 0,
+                "bulk_seconds": 0.0,
+            }
+            self._started = time.monotonic()
+            self._first_bulk = None
+            self._last_bulk = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            active = (self._last_bulk - self._first_bulk) if self._last_bulk is not None else 0.0
+        stats["elapsed_seconds"] = time.monotonic() - self._started
+        stats["active_seconds"] = active
+        stats["docs_per_second"] = stats["docs_indexed"] / active if active > 0 else 0.0
+        stats["mean_bulk_seconds"] = stats["bulk_seconds"] / stats["bulk_requests"] if stats["bulk_requests"] else 0.0
+        return stats
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _random_below(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def put_settings(self, index, body):
+        settings = body.get("settings", body) if body else {}
+        settings = settings.get("index", settings)
+        with self._lock:
+            current = self.settings.setdefault(index, {})
+            for name, value in settings.items():
+                name = name[len("index."):] if name.startswith("index.") else name
+                if value is None:
+                    current.pop(name, None)
+                else:
+                    current[name] = str(value)
+
+    def bulk(self, body, default_index=None):
+        """
+        Returns (status, response) for an NDJSON bulk body.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+            over_limit = self.max_in_flight and self._in_flight > self.max_in_flight
+            self._first_bulk = self._first_bulk if self._first_bulk is not None else started
+        try:
+            if over_limit or self._random_below(self.throttle_rate):
+                self._count(throttled_requests=1)
+                return 429, {
+                    "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution of bulk request (fake)"},
+                    "status": 429
+                }
+            delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+
+            items = []
+            failed = 0
+            per_index = {}
+            lines = body.splitlines()
+            for i in range(0, len(lines) - 1, 2):
+                if not lines[i].strip():
+                    continue
+                action, meta = next(iter(json.loads(lines[i]).items()))
+                index = meta.get("_index", default_index)
+                if self._random_below(self.failure_rate):
+                    failed += 1
+                    items.append({action: {
+                        "_index": index, "_id": meta.get("_id"), "status": self.failure_status,
+                        "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution of item (fake)"}
+                    }})
+                    continue
+                per_index[index] = per_index.get(index, 0) + 1
+                items.append({action: {
+                    "_index": index, "_id": meta.get("_id"), "_version": 1, "result": "created", "status": 201
+                }})
+            with self._lock:
+                for index, count in per_index.items():
+                    self.indices[index] = self.indices.get(index, 0) + count
+                self._last_bulk = time.monotonic()
+            took = time.monotonic() - started
+            self._count(bulk_requests=1, docs_indexed=len(items) - failed, docs_failed=failed, bulk_seconds=took)
+            return 200, {"took": int(took * 1000), "errors": failed > 0, "items": items}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                fake._count(requests=1, bytes_received=len(body))
+                return body
+
+            def _reply(self, status, payload=None):
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                for name, value in PRODUCT_HEADERS.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            def _bulk(self, body, path):
+                status, payload = fake.bulk(body, default_index=path[0] if len(path) == 2 else None)
+                self._reply(status, payload)
+
+            def _path(self):
+                return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+            def do_GET(self):
+                self._body()
+                path = self._path()
+                if not path:
+                    self._reply(200, {
+                        "name": "fake-elasticsearch",
+                        "cluster_name": "weather-lab-fake",
+                        "version": {"number": "9.0.0", "build_flavor": "default"},
+                        "tagline": "You Know, for Search"
+                    })
+                elif path == ["_cluster", "health"]:
+                    self._reply(200, {
+                        "cluster_name": "weather-lab-fake", "status": "green", "timed_out": False,
+                        "number_of_nodes": 1, "number_of_data_nodes": 1,
+                        "active_primary_shards": len(fake.indices), "active_shards": len(fake.indices)
+                    })
+                elif path == ["_fake", "stats"]:
+                    self._reply(200, fake.stats())
+                elif len(path) == 2 and path[1] == "_settings" and path[0] in fake.indices:
+                    with fake._lock:
+                        settings = dict(fake.settings.get(path[0], {}))
+                    self._reply(200, {path[0]: {"settings": {"index": settings}}})
+                else:
+                    self._reply(404, {"error": {"type": "illegal_argument_exception"}, "status": 404})
+
+            def do_HEAD(self):
+                self._body()
+                path = self._path()
+                self._reply(200 if len(path) == 1 and path[0] in fake.indices else 404)
+
+            def do_PUT(self):
+                body = self._body()
+                path = self._path()
+                if path and path[-1] == "_bulk":
+                    self._bulk(body, path)
+                    return
+                if len(path) == 2 and path[1] == "_settings":
+                    if path[0] not in fake.indices:
+                        self._reply(404, {"error": {"type": "index_not_found_exception", "index": path[0]}, "status": 404})
+                        return
+                    fake.put_settings(path[0], json.loads(body or b"{}"))
+                    self._reply(200, {"acknowledged": True})
+                    return
+                if len(path) != 1:
+                    self._reply(400, {"error": {"type": "illegal_argument_exception"}, "status": 400})
+                    return
+                with fake._lock:
+                    exists = path[0] in fake.indices
+                    fake.indices.setdefault(path[0], 0)
+                if exists:
+                    self._reply(400, {"error": {"type": "resource_already_exists_exception", "index": path[0]}, "status": 400})
+                else:
+                    fake.put_settings(path[0], json.loads(body or b"{}"))
+                    self._reply(200, {"acknowledged": True, "shards_acknowledged": True, "index": path[0]})
+
+            def do_DELETE(self):
+                self._body()
+                path = self._path()
+                with fake._lock:
+                    existed = fake.indices.pop(path[0], None) is not None if len(path) == 1 else False
+                self._reply(200 if existed else 404, {"acknowledged": True} if existed else {"status": 404})
+
+            def do_POST(self):
+                body = self._body()
+                path = self._path()
+                if path and path[-1] == "_bulk":
+                    self._bulk(body, path)
+                elif len(path) == 2 and path[1] == "_refresh":
+                    with fake._lock:
+                        fake.refreshed.append(path[0])
+                    self._reply(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+                else:
+                    self._reply(404, {"error": {"type": "illegal_argument_exception"}, "status": 404})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every bulk request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra latency up to this many seconds")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of bulk requests rejected with 429")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of bulk items that fail")
+    parser.add_argument('--failure-status', type=int, default=429, help="Status of failed bulk items")
+    parser.add_argument('--max-in-flight', type=int, default=0, help="Reject bulk requests beyond this concurrency, 0 is unlimited")
+    args = parser.parse_args()
+
+    fake = FakeElasticsearch(args.host, args.port, args.latency, args.jitter, args.throttle_rate,
+                             args.failure_rate, args.failure_status, args.max_in_flight).start()
+    print(f"Fake Elasticsearch listening on {fake.url}")
+    try:
+        while True:
+            time.sleep(10)
+            stats = fake.stats()
+            print(f"{stats['docs_indexed']} docs indexed ({stats['docs_per_second']:.0f}/s), "
+                  f"{stats['docs_failed']} failed, {stats['throttled_requests']} throttled requests")
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+In-process stand-in for a RabbitMQ broker, for testing the distributed
+mode without a broker.
+
+Implements the part of pika's BlockingConnection/BlockingChannel that
+RabbitMQStorage uses: durable queues, publisher confirms, basic_qos
+prefetch, basic_consume/start_consuming, ack and nack with requeue, and
+queues with an x-message-ttl that dead-letter expired messages to their
+x-dead-letter-routing-key. Unacknowledged messages are redelivered (flagged
+`redelivered`) when they are nacked with requeue or their channel is closed. Any number of
+connections, e.g. one per worker thread, can share a broker.
+
+Usage:
+    broker = FakeRabbitMQ(idle_timeout=0.2)
+    storage = RabbitMQStorage(connect=broker.connect)
+"""
+import collections
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeRabbitMQ:
+    def __init__(self, idle_timeout=None, publish_failures=0):
+        # start_consuming returns after idle_timeout seconds without a delivery (None waits for stop_consuming)
+        self.idle_timeout = idle_timeout
+        # The next publish_failures publishes raise, as a dropped connection would
+        self.publish_failures = publish_failures
+        self.queues = {}
+        # queue -> (TTL seconds, dead letter routing key) of queues declared with x-message-ttl
+        self.expiring = {}
+        self._condition = threading.Condition()
+        self._tags = itertools.count(1)
+        self._stats = collections.Counter()
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["depth"] = sum(len(queue) for queue in self.queues.values())
+            return stats
+
+    def depth(self, queue_name):
+        with self._condition:
+            return len(self.queues.get(queue_name, ()))
+
+    def _expire(self):
+        """Dead-letters the expired messages at the head of TTL queues; returns whether any are still waiting."""
+        now = time.monotonic()
+        waiting = False
+        for queue_name, (ttl, target) in self.expiring.items():
+            queue = self.queues[queue_name]
+            while queue and queue[0][3] <= now:
+                body, properties, _, _ = queue.popleft()
+                self.queues.setdefault(target, collections.deque()).append((body, properties, False))
+                self._stats["dead_lettered"] += 1
+            waiting = waiting or bool(queue)
+        return waiting
+
+    def _requeue(self, messages):
+        with self._condition:
+            for queue_name, body, properties in messages:
+                self.queues[queue_name].appendleft((body, properties, True))
+                self._stats["redelivered"] += 1
+            self._condition.notify_all()
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = []
+        self.is_open = True
+
+    def channel(self):
+        channel = FakeChannel(self.broker)
+        self.channels.append(channel)
+        return channel
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+        self.is_open = False
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.confirming = False
+        self.prefetch_count = 0
+        self.consumers = []
+        self.unacked = {}
+        self._consuming = False
+        self.is_open = True
+
+    def confirm_delivery(self):
+        self.confirming = True
+
+    def queue_declare(self, queue, durable=False, arguments=None):
+        arguments = arguments or {}
+        with self.broker._condition:
+            self.broker.queues.setdefault(queue, collections.deque())
+            if 'x-message-ttl' in arguments:
+                self.broker.expiring[queue] = (arguments['x-message-ttl'] / 1000.0, arguments.get('x-dead-letter-routing-key'))
+            self.broker._stats["declares"] += 1
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        broker = self.broker
+        with broker._condition:
+            if broker.publish_failures:
+                broker.publish_failures -= 1
+                raise ConnectionError("Connection reset by fake broker")
+            if routing_key not in broker.queues:
+                if mandatory and self.confirming:
+                    raise LookupError(f"Unroutable message for {routing_key}")
+                return
+            if routing_key in broker.expiring:
+                broker.queues[routing_key].append((body, properties, False, time.monotonic() + broker.expiring[routing_key][0]))
+            else:
+                broker.queues[routing_key].append((body, properties, False))
+            broker._stats["published"] += 1
+            broker._stats["published_bytes"] += len(body)
+            broker._condition.notify_all()
+
+    def basic_qos(self, prefetch_count=0):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        self.consumers.append((queue, on_message_callback))
+
+    def start_consuming(self):
+        broker = self.broker
+        self._consuming = True
+        while self._consuming:
+            delivery = None
+            with broker._condition:
+                deadline = None if broker.idle_timeout is None else time.monotonic() + broker.idle_timeout
+                while self._consuming:
+                    waiting = broker._expire()
+                    delivery = self._next_delivery()
+                    if delivery is not None:
+                        break
+                    if waiting:
+                        # Messages waiting to be dead-lettered keep the consumer from going idle
+                        deadline = None if broker.idle_timeout is None else time.monotonic() + broker.idle_timeout
+                        broker._condition.wait(0.005)
+                        continue
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return
+                    broker._condition.wait(remaining if remaining is not None else 0.1)
+            if delivery is not None:
+                callback, method, properties, body = delivery
+                callback(self, method, properties, body)
+
+    def _next_delivery(self):
+        if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+            return None
+        for queue_name, callback in self.consumers:
+            queue = self.broker.queues.get(queue_name)
+            if queue:
+                body, properties, redelivered = queue.popleft()
+                tag = next(self.broker._tags)
+                self.unacked[tag] = (queue_name, body, properties)
+                self.broker._stats["delivered"] += 1
+                method = SimpleNamespace(delivery_tag=tag, redelivered=redelivered, routing_key=queue_name)
+                return callback, method, properties, body
+        return None
+
+    def stop_consuming(self):
+        self._consuming = False
+        with self.broker._condition:
+            self.broker._condition.notify_all()
+
+    def basic_ack(self, delivery_tag):
+        with self.broker._condition:
+            del self.unacked[delivery_tag]
+            self.broker._stats["acked"] += 1
+            self.broker._condition.notify_all()
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        with self.broker._condition:
+            message = self.unacked.pop(delivery_tag)
+            self.broker._stats["nacked"] += 1
+        if requeue:
+            self.broker._requeue([message])
+
+    def close(self):
+        self._consuming = False
+        with self.broker._condition:
+            messages = list(self.unacked.values())
+            self.unacked.clear()
+        if messages:
+            self.broker._requeue(messages)
+        self.is_open = False
@@ -0,0 +1,137 @@
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+METAR_STATIONS = [
+    ("KJFK", 40.6392, -73.7639, 3),
+    ("KLAX", 33.9382, -118.3866, 38),
+    ("EGLL", 51.4775, -0.4614, 25),
+    ("EHAM", 52.3086, 4.7639, -3),
+    ("LFPG", 49.0128, 2.55, 119),
+    ("RJTT", 35.5523, 139.7797, 6),
+    ("YSSY", -33.9461, 151.1772, 6),
+    ("SBGR", -23.4356, -46.4731, 750),
+    ("FAOR", -26.1392, 28.246, 1694),
+    ("CYYZ", 43.6772, -79.6306, 173),
+]
+
+
+def _response(data_source, elements, generated_at):
+    body = "".join(elements)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<response xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="1.3">'
+        f'<request_index>{int(generated_at.timestamp())}</request_index>'
+        f'<data_source name="{data_source}"/><request type="retrieve"/><errors/><warnings/>'
+        '<time_taken_ms>42</time_taken_ms>'
+        f'<data num_results="{len(elements)}">{body}</data></response>'
+    )
+
+
+def metar_snapshot(count=5000, seed=26, generated_at=None):
+    """
+    Builds a METAR cache document in the layout served by aviationweather.gov
+    (metars.cache.xml), including the nested and repeated children that the
+    parser has to skip over.
+    """
+    rng = random.Random(seed)
+    generated_at = generated_at or datetime(2024, 6, 1, 12, 0, 0)
+    elements = []
+    for i in range(count):
+        station_id, lat, lon, elevation = METAR_STATIONS[i % len(METAR_STATIONS)]
+        lat = max(-90.0, min(90.0, lat + rng.uniform(-2, 2)))
+        lon = max(-180.0, min(180.0, lon + rng.uniform(-2, 2)))
+        observed = generated_at - timedelta(minutes=rng.randint(0, 90))
+        temp = round(rng.uniform(-30, 40), 1)
+        dewpoint = round(temp - rng.uniform(0, 15), 1)
+        wind_dir = rng.choice([str(rng.randint(0, 36) * 10), "VRB"])
+        wind_speed = rng.randint(0, 40)
+        altimeter = round(rng.uniform(29.2, 30.8), 2)
+        raw_text = f"{station_id} {observed:%d%H%M}Z {wind_dir.zfill(3)}{wind_speed:02d}KT 10SM FEW250 A{int(altimeter * 100)}"
+        elements.append(
+            "<METAR>"
+            f"<raw_text>{escape(raw_text)}</raw_text>"
+            f"<station_id>{station_id}</station_id>"
+            f"<observation_time>{observed:%Y-%m-%dT%H:%M:%SZ}</observation_time>"
+            f"<latitude>{lat:.4f}</latitude><longitude>{lon:.4f}</longitude>"
+            f"<temp_c>{temp}</temp_c><dewpoint_c>{dewpoint}</dewpoint_c>"
+            f"<wind_dir_degrees>{wind_dir}</wind_dir_degrees><wind_speed_kt>{wind_speed}</wind_speed_kt>"
+            "<visibility_statute_mi>10+</visibility_statute_mi>"
+            f"<altim_in_hg>{altimeter}</altim_in_hg>"
+            "<quality_control_flags><auto_station>TRUE</auto_station></quality_control_flags>"
+            '<sky_condition sky_cover="FEW" cloud_base_ft_agl="25000"/>'
+            '<sky_condition sky_cover="BKN" cloud_base_ft_agl="4500"/>'
+            "<flight_category>VFR</flight_category><metar_type>METAR</metar_type>"
+            f"<elevation_m>{elevation}</elevation_m>"
+            "</METAR>"
+        )
+    return _response("metars", elements, generated_at)
+
+
+def aircraft_snapshot(count=5000, seed=26, generated_at=None):
+    """
+    Builds an aircraft report cache document in the layout served by
+    aviationweather.gov (aircraftreports.cache.xml).
+    """
+    rng = random.Random(seed)
+    generated_at = generated_at or datetime(2024, 6, 1, 12, 0, 0)
+    elements = []
+    for i in range(count):
+        observed = generated_at - timedelta(minutes=rng.randint(0, 90))
+        lat = rng.uniform(20, 60)
+        lon = rng.uniform(-130, -60)
+        elements.append(
+            "<AircraftReport>"
+            f"<receipt_time>{generated_at:%Y-%m-%dT%H:%M:%SZ}</receipt_time>"
+            f"<observation_time>{observed:%Y-%m-%dT%H:%M:%SZ}</observation_time>"
+            "<quality_control_flags><no_time_stamp>FALSE</no_time_stamp></quality_control_flags>"
+            f"<aircraft_ref>B7{i % 100:02d}</aircraft_ref>"
+            f"<latitude>{lat:.3f}</latitude><longitude>{lon:.3f}</longitude>"
+            f"<altitude_ft_msl>{rng.randint(50, 410) * 100}</altitude_ft_msl>"
+            '<turbulence_condition turbulence_intensity="NEG"/>'
+            f"<visibility_statute_mi>{rng.randint(1, 10)}</visibility_statute_mi>"
+            f"<wind_dir_degrees>{rng.randint(0, 359)}</wind_dir_degrees>"
+            f"<wind_speed_kt>{rng.randint(0, 150)}</wind_speed_kt>"
+            f"<temp_c>{rng.randint(-60, 20)}</temp_c>"
+            f"<turbulence_code>{rng.randint(0, 8)}</turbulence_code>"
+            f"<icing_code>{rng.randint(0, 8)}</icing_code>"
+            "<report_type>AIREP</report_type>"
+            f"<raw_text>ARP B7{i % 100:02d} {lat:.1f}N {abs(lon):.1f}W</raw_text>"
+            "</AircraftReport>"
+        )
+    return _response("aircraftreports", elements, generated_at)
+
+
+def cmems_netcdf(path, count=500, depths=2, seed=26):
+    """
+    Writes a small in-situ NetCDF file laid out like the CMEMS
+    INSITU_GLO_PHYBGCWAV_DISCRETE_MYNRT profiles: TIME/LATITUDE/LONGITUDE
+    along TIME and per-depth measurements with *_QC companions.
+    """
+    import numpy as np
+    import netCDF4 as nc
+
+    rng = np.random.default_rng(seed)
+    with nc.Dataset(path, 'w') as ds:
+        ds.platform_code = "6202565"
+        ds.platform_name = "BENCHMARK BUOY"
+        ds.geospatial_lat_min = 42.0
+        ds.geospatial_lon_min = -30.0
+        ds.createDimension('TIME', count)
+        ds.createDimension('DEPTH', depths)
+        times = ds.createVariable('TIME', 'f8', ('TIME',))
+        times.units = "days since 1950-01-01T00:00:00Z"
+        times[:] = 27180.0 + np.arange(count) / 24.0
+        latitude = ds.createVariable('LATITUDE', 'f4', ('TIME',))
+        latitude[:] = 42.0 + rng.uniform(-0.5, 0.5, count)
+        longitude = ds.createVariable('LONGITUDE', 'f4', ('TIME',))
+        longitude[:] = -30.0 + rng.uniform(-0.5, 0.5, count)
+        for name, low, high in (('TEMP', 8.0, 24.0), ('PSAL', 34.0, 37.0), ('DEPH', 0.0, 10.0)):
+            variable = ds.createVariable(name, 'f4', ('TIME', 'DEPTH'), fill_value=99999.0)
+            variable[:] = rng.uniform(low, high, (count, depths))
+            qc = ds.createVariable(f"{name}_QC", 'i1', ('TIME', 'DEPTH'), fill_value=-127)
+            qc[:] = rng.choice([1, 1, 1, 1, 2, 4], (count, depths))
+        atms = ds.createVariable('ATMS', 'f4', ('TIME',), fill_value=99999.0)
+        atms[:] = rng.uniform(990.0, 1030.0, count)
+    return path
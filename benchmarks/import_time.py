@@ -0,0 +1,75 @@
+"""
+Import-time report for the pipeline entry point.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, prints
+the modules with the largest cumulative and self import times and checks
+the total against a budget. Heavy optional dependencies must not be
+imported by `import main` at all; they are loaded when a source or the
+enricher first needs them.
+
+Usage:
+    python benchmarks/import_time.py [--module main] [--budget 0.75] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_SECONDS = 0.75
+HEAVY_MODULES = ('skyfield', 'matplotlib', 'shapely', 'copernicusmarine', 'netCDF4', 'xarray', 'pandas', 'elasticsearch')
+
+
+def parse_importtime(output):
+    """
+    Parses `-X importtime` output into (module, self seconds, cumulative
+    seconds, depth) tuples in import order.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return entries
+
+
+def measure_import(module='main'):
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO_DIR, 'src'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def total_seconds(entries, module):
+    return next(cumulative for name, _, cumulative, depth in entries if name == module and depth == 0)
+
+
+def heavy_imports(entries):
+    return sorted({name.split('.')[0] for name, _, _, _ in entries if name.split('.')[0] in HEAVY_MODULES})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_SECONDS, help="Allowed seconds for the import")
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    entries = measure_import(args.module)
+    for title, column in (("cumulative", 2), ("self", 1)):
+        print(f"Top {args.top} by {title} time:")
+        for entry in sorted(entries, key=lambda entry: entry[column], reverse=True)[:args.top]:
+            print(f"  {entry[column] * 1000:8.1f} ms  {'  ' * entry[3]}{entry[0]}")
+
+    total = total_seconds(entries, args.module)
+    heavy = heavy_imports(entries)
+    print(f"import {args.module}: {total * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    if heavy:
+        print(f"Heavy modules imported eagerly: {', '.join(heavy)}")
+    return 1 if total > args.budget or heavy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
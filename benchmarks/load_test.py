@@ -0,0 +1,169 @@
+"""
+Load test for the indexing path: drives WeatherLab.run against the fake
+Elasticsearch server (or --es-url) with a synthetic source producing
+records at a fixed rate.
+
+The records are decoded and translated METAR reports from a generated
+snapshot with fixed enrichment fields, so the test measures queueing,
+flushing, serialization and retries rather than the feeds or skyfield.
+
+Usage:
+    python benchmarks/load_test.py --rate 5000 --duration 20 --bulk-size 1000 \\
+        --flush-concurrency 2 --latency 0.05 --throttle-rate 0.1 --failure-rate 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+os.chdir(REPO_DIR)
+
+from fake_elasticsearch import FakeElasticsearch
+from feed_snapshots import metar_snapshot
+from data_sources.base import DataSource
+
+ENRICHMENT_FIELDS = {
+    "light_intensity": 0.42,
+    "sun_distance": 1.0,
+    "moon_distance": 0.00257,
+    "sun_influence": 0.5,
+    "moon_influence": 0.25,
+}
+
+
+class LoadSource(DataSource):
+    """
+    One-shot source that puts records on the queue at `rate` records/second
+    for `duration` seconds, then the end-of-stream marker.
+    """
+    name = 'load'
+
+    def __init__(self, queue, templates, rate, duration, tick=0.01):
+        self.load_schedule({'poll_interval': 0})
+        self.queue = queue
+        self.templates = templates
+        self.rate = rate
+        self.duration = duration
+        self.tick = tick
+        self.produced = 0
+        self.finished_at = None
+
+    def poll(self):
+        started = time.monotonic()
+        deadline = started + self.duration
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            due = int((now - started) * self.rate)
+            while self.produced < due:
+                record = dict(self.templates[self.produced % len(self.templates)])
+                # Unique document ids: the id is built from the position and timestamp
+                record["latitude"] = round(record["latitude"] + (self.produced // len(self.templates)) * 1e-6, 6)
+                self.queue.put(record)
+                self.produced += 1
+            time.sleep(self.tick)
+        self.finished_at = time.monotonic()
+        self.queue.put(None)
+
+
+def build_templates(queue, count=1000):
+    from data_sources.metar_data import MetarDataSource
+    source = MetarDataSource(config_path='src/config/metar_config.json', queue=queue)
+    templates = []
+    for metar in ET.fromstring(metar_snapshot(count)).iter('METAR'):
+        record = source.translator.translate(source.decode_metar(metar))
+        record.update(ENRICHMENT_FIELDS)
+        templates.append(record)
+    return templates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=2000, help="Records per second put on the queue")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds to produce records for")
+    parser.add_argument('--bulk-size', type=int, default=1000)
+    parser.add_argument('--flush-interval', type=float, default=1.0, help="Seconds before a partial bulk is flushed")
+    parser.add_argument('--flush-concurrency', type=int, default=1)
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--retry-backoff', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.02, help="Fake server latency per bulk request")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--max-in-flight', type=int, default=0)
+    parser.add_argument('--es-url', help="Use this Elasticsearch instead of starting the fake server")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format='%(asctime)s %(levelname)s %(message)s')
+    os.environ.setdefault('CMEMS_USERNAME', 'load-test')
+    os.environ.setdefault('CMEMS_PASSWORD', 'load-test')
+
+    from main import WeatherLab
+    from storage.elasticsearch import ElasticsearchStorage
+    from utils.metrics import METRICS
+
+    fake = None
+    es_url = args.es_url
+    if not es_url:
+        fake = FakeElasticsearch(latency=args.latency, latency_jitter=args.jitter, throttle_rate=args.throttle_rate,
+                                 failure_rate=args.failure_rate, max_in_flight=args.max_in_flight).start()
+        es_url = fake.url
+
+    storage = ElasticsearchStorage(es_url=es_url, bulk_size=args.bulk_size, max_retries=args.max_retries,
+                                   retry_backoff=args.retry_backoff, flush_concurrency=args.flush_concurrency)
+    weather_lab = WeatherLab(elasticsearch_storage=storage)
+    weather_lab.bulk_size = args.bulk_size
+    weather_lab.flush_interval = args.flush_interval
+    weather_lab.flush_concurrency = args.flush_concurrency
+
+    load_source = LoadSource(weather_lab.queue, build_templates(weather_lab.queue), args.rate, args.duration)
+    weather_lab.data_sources = {'load': load_source}
+
+    max_queue_depth = 0
+    stop = threading.Event()
+
+    def watch_queue():
+        nonlocal max_queue_depth
+        while not stop.wait(0.1):
+            try:
+                max_queue_depth = max(max_queue_depth, weather_lab.queue.qsize())
+            except NotImplementedError:
+                return
+
+    threading.Thread(target=watch_queue, daemon=True).start()
+    started = time.monotonic()
+    asyncio.run(weather_lab.run())
+    finished = time.monotonic()
+    stop.set()
+
+    indexed = METRICS.value('records_indexed_total') or 0
+    failed = METRICS.value('bulk_failed_records_total') or 0
+    flushes, flush_seconds = METRICS.value('bulk_flush_seconds') or (0, 0.0)
+    retries = sum(METRICS.value('bulk_retries_total', reason=reason) or 0 for reason in ('items', '429', '502', '503', '504', 'connection'))
+    print(f"produced            {load_source.produced} records in {load_source.finished_at - started:.1f}s "
+          f"({load_source.produced / (load_source.finished_at - started):.0f}/s)")
+    print(f"indexed             {indexed} records ({indexed / (finished - started):.0f}/s end to end)")
+    print(f"failed              {failed} records")
+    print(f"drain time          {finished - load_source.finished_at:.2f}s after the last record")
+    print(f"max queue depth     {max_queue_depth}")
+    print(f"bulk flushes        {flushes} (mean {flush_seconds / flushes * 1000 if flushes else 0:.1f} ms incl. retries)")
+    print(f"retries             {retries} (records resent: {METRICS.value('bulk_retried_records_total') or 0})")
+    print(f"flush errors        {METRICS.value('bulk_flush_errors_total') or 0}")
+    if fake:
+        stats = fake.stats()
+        print(f"server              {stats['bulk_requests']} bulk requests, {stats['throttled_requests']} throttled, "
+              f"{stats['docs_indexed']} docs, {stats['bytes_received'] / 2**20:.1f} MiB received")
+        fake.stop()
+    storage.executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Offline benchmark suite for the ingestion pipeline.
+
+Runs each source's parse -> translate -> enrich path and the bulk serializer on
+fixtures, reports records/second and peak traced memory per stage and compares
+them against benchmarks/baseline.json.
+
+Fixtures:
+    benchmarks/fixtures/ace-magnetometer.txt         ACE magnetometer feed sample
+    benchmarks/fixtures/meteostat/stations.json      Meteostat station list sample
+    benchmarks/fixtures/meteostat/hourly/*.csv       Meteostat hourly CSV samples
+    METAR / aircraft cache XML and a CMEMS NetCDF file are generated
+    (see feed_snapshots.py). Point --fixtures-dir at a directory with recorded
+    metars.cache.xml(.gz), aircraftreports.cache.xml(.gz), ace-magnetometer.txt,
+    meteostat/ and *.nc files to benchmark real feed captures instead.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--update-baseline] [--tolerance 0.35]
+
+Exits with status 1 when a stage is slower or uses more memory than the
+baseline allows.
+"""
+import argparse
+import csv
+import gc
+import glob
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from multiprocessing import Queue
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+
+from feed_snapshots import metar_snapshot, aircraft_snapshot, cmems_netcdf
+
+DEFAULT_FIXTURES = os.path.join(BENCHMARK_DIR, 'fixtures')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+METEOSTAT_HEADERS = ['date', 'hour', 'temp', 'dewpt', 'rhum', 'precipitation', 'snow', 'wind_dir', 'wind_speed', 'wind_gust', 'pressure', 'tsun', 'coco']
+MEMORY_SLACK_BYTES = 256 * 1024
+
+
+def config_path(name):
+    return os.path.join(REPO_DIR, 'src', 'config', f'{name}_config.json')
+
+
+def read_text(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def find_fixture(fixtures_dir, *names):
+    for name in names:
+        for candidate in (name, f'{name}.gz'):
+            path = os.path.join(fixtures_dir, candidate)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+class Stage:
+    def __init__(self, key, run, count):
+        self.key = key
+        self.run = run
+        self.count = count
+
+
+def measure(stage, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = stage.run()
+        best = min(best, time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    stage.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    records = stage.count(result)
+    return result, {
+        "records": records,
+        "seconds": best,
+        "records_per_second": records / best if best > 0 else 0.0,
+        "peak_bytes": peak
+    }
+
+
+def decode_all(decode, items):
+    records = []
+    for item in items:
+        try:
+            records.append(decode(item))
+        except (ValueError, TypeError):
+            continue
+    return records
+
+
+def enrich_all(stage, source, records):
+    """Enriches records with the source's enrichment plan, as the source does."""
+    return stage.enrich([dict(record) for record in records], source).to_records()
+
+
+def redate_meteostat_rows(rows):
+    # Shift the fixture so its last day falls inside format_record's one-day window
+    latest = max(datetime.strptime(f"{row['date']} {row['hour']}", "%Y-%m-%d %H") for row in rows)
+    shift = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - latest
+    redated = []
+    for row in rows:
+        moment = datetime.strptime(f"{row['date']} {row['hour']}", "%Y-%m-%d %H") + shift
+        redated.append(dict(row, date=moment.strftime("%Y-%m-%d"), hour=str(moment.hour)))
+    return redated
+
+
+def build_pipelines(args, workdir):
+    from data_sources.metar_data import MetarDataSource
+    from data_sources.aircraft_data import AircraftDataSource
+    from data_sources.space_weather_data import SpaceWeatherDataSource, parse_ace_lines
+    from data_sources.meteostat_data import MeteostatDataSource
+    from data_sources.cmems_data import CmemsDataSource
+    from data_sources.station_catalog import StationCatalog
+    from translators.aircraft_translator import translate_row
+
+    os.environ.setdefault('CMEMS_USERNAME', 'benchmark')
+    os.environ.setdefault('CMEMS_PASSWORD', 'benchmark')
+    queue = Queue()
+    fixtures = args.fixtures_dir
+    pipelines = {}
+
+    metar = MetarDataSource(config_path=config_path('metar'), queue=queue)
+    metar_path = find_fixture(fixtures, 'metars.cache.xml')
+    metar_xml = read_text(metar_path) if metar_path else metar_snapshot(args.count)
+    pipelines['metar'] = (
+        lambda: decode_all(metar.decode_metar, ET.fromstring(metar_xml).iter('METAR')),
+        lambda records: [metar.translator.translate(record) for record in records],
+    )
+
+    aircraft = AircraftDataSource(config_path=config_path('aircraft'), queue=queue)
+    aircraft_path = find_fixture(fixtures, 'aircraftreports.cache.xml')
+    aircraft_xml = read_text(aircraft_path) if aircraft_path else aircraft_snapshot(args.count)
+    pipelines['aircraft'] = (
+        lambda: decode_all(aircraft.decode_aircraft_report, ET.fromstring(aircraft_xml).iter('AircraftReport')),
+        lambda records: [translate_row(record) for record in records],
+    )
+
+    space_weather = SpaceWeatherDataSource(config_path=config_path('space_weather'), queue=queue)
+    ace_text = read_text(find_fixture(fixtures, 'ace-magnetometer.txt'))
+    ace_lines = [line for line in ace_text.splitlines() if line.strip() and not line.startswith(('#', ':'))]
+    pipelines['space_weather'] = (
+        lambda: parse_ace_lines(ace_lines)[0],
+        lambda records: [space_weather.translator.translate(record) for record in records],
+    )
+
+    meteostat_config = os.path.join(workdir, 'meteostat_config.json')
+    with open(meteostat_config, 'w') as f:
+        json.dump({"output_directory": workdir}, f)
+    meteostat = MeteostatDataSource(config_path=meteostat_config, queue=queue)
+    stations = StationCatalog.from_stations(json.loads(read_text(os.path.join(fixtures, 'meteostat', 'stations.json'))))
+    station_rows = []
+    for path in sorted(glob.glob(os.path.join(fixtures, 'meteostat', 'hourly', '*.csv*'))):
+        station_id = os.path.basename(path).split('.')[0]
+        rows = [dict(zip(METEOSTAT_HEADERS, row)) for row in csv.reader(read_text(path).splitlines())]
+        station_rows.extend((stations.get(station_id), row) for row in redate_meteostat_rows(rows))
+
+    def meteostat_parse():
+        records = []
+        for station, row in station_rows:
+            record = meteostat.format_record(station, row)
+            if record:
+                record["source"] = "meteostat"
+                records.append(record)
+        return records
+    pipelines['meteostat'] = (meteostat_parse, None)
+
+    cmems = CmemsDataSource(config_path=config_path('cmems'), queue=queue)
+    netcdf_paths = sorted(glob.glob(os.path.join(fixtures, '*.nc'))) or [cmems_netcdf(os.path.join(workdir, 'cmems.nc'), args.count // 10)]
+
+    def cmems_parse():
+        return [cmems.netcdf_to_dict(path) for path in netcdf_paths]
+
+    def cmems_translate(parsed):
+        records = []
+        for data_dict, ds in parsed:
+            records.extend(cmems.combine_measurements(cmems.translator.translate(data_dict), ds))
+            ds.close()
+        return records
+    pipelines['cmems'] = (cmems_parse, cmems_translate)
+    stages = {source.name: source.enrichment_stage for source in (metar, aircraft, space_weather, meteostat, cmems)}
+    return pipelines, stages
+
+
+def run_suite(args):
+    from storage.bulk_serializer import BulkBodySerializer
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        pipelines, stages = build_pipelines(args, workdir)
+        # The ephemeris is loaded on first use, keep that out of the timed enrich runs
+        for source, stage in stages.items():
+            stage.enricher(source).planets
+        serializer = BulkBodySerializer()
+        serialize_input = []
+        for source, (parse, translate) in pipelines.items():
+            if source not in args.sources:
+                continue
+            parsed, results[f'{source}.parse'] = measure(Stage(f'{source}.parse', parse, len), args.repeat)
+            if source == 'cmems':
+                # NetCDF datasets are closed by translate, so parse again for the timed translate runs
+                translated, results[f'{source}.translate'] = measure(
+                    Stage(f'{source}.translate', lambda: translate(parse()), len), args.repeat)
+            elif translate:
+                translated, results[f'{source}.translate'] = measure(
+                    Stage(f'{source}.translate', lambda: translate(parsed), len), args.repeat)
+            else:
+                translated = parsed
+            if args.enrich_limit:
+                subset = translated[:args.enrich_limit]
+                enriched, results[f'{source}.enrich'] = measure(
+                    Stage(f'{source}.enrich', lambda: enrich_all(stages[source], source, subset), len), 1)
+                serialize_input.extend(enriched)
+            else:
+                serialize_input.extend(translated)
+        _, results['bulk.serialize'] = measure(
+            Stage('bulk.serialize', lambda: serializer.serialize(serialize_input), lambda result: result[1]), args.repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if not expected or expected['records'] != result['records']:
+            # Different fixtures or options, the numbers are not comparable
+            continue
+        if result['records_per_second'] < expected['records_per_second'] * (1 - tolerance):
+            regressions.append(f"{key}: {result['records_per_second']:.0f} records/s < baseline {expected['records_per_second']:.0f}")
+        if result['peak_bytes'] > expected['peak_bytes'] * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            regressions.append(f"{key}: peak {result['peak_bytes'] / 2**20:.2f} MiB > baseline {expected['peak_bytes'] / 2**20:.2f} MiB")
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'stage':<24} {'records':>8} {'records/s':>12} {'baseline':>12} {'peak MiB':>9}")
+    for key, result in results.items():
+        expected = baseline.get(key, {}).get('records_per_second')
+        expected = f"{expected:12.0f}" if expected else f"{'-':>12}"
+        print(f"{key:<24} {result['records']:>8} {result['records_per_second']:>12.0f} {expected} {result['peak_bytes'] / 2**20:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.35, help="Allowed relative regression per stage")
+    parser.add_argument('--count', type=int, default=2000, help="Reports per generated METAR/aircraft snapshot")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage, the best one is reported")
+    parser.add_argument('--enrich-limit', type=int, default=10, help="Records per source to enrich, 0 skips enrichment")
+    parser.add_argument('--sources', default='metar,aircraft,space_weather,meteostat,cmems')
+    args = parser.parse_args()
+    args.sources = args.sources.split(',')
+    if args.fixtures_dir != DEFAULT_FIXTURES and not os.path.exists(os.path.join(args.fixtures_dir, 'meteostat')):
+        parser.error("--fixtures-dir needs the same layout as benchmarks/fixtures")
+
+    results = run_suite(args)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
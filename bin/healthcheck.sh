@@ -1,9 +1,25 @@
 #!/bin/bash
 
-# Check if the main process is running
+METRICS_URL="http://127.0.0.1:${METRICS_PORT:-9108}/health"
+
+# Ask the metrics endpoint whether any pipeline stage has stalled
+HEALTH=$(curl -s -w '\n%{http_code}' "$METRICS_URL")
+if [ $? -eq 0 ]
+then
+  STATUS=$(echo "$HEALTH" | tail -n 1)
+  if [ "$STATUS" = "200" ]
+  then
+    echo "Weather Lab is running"
+    exit 0
+  fi
+  echo "Weather Lab is stalled: $(echo "$HEALTH" | head -n 1)"
+  exit 1
+fi
+
+# Metrics endpoint not reachable (yet), fall back to checking the process
 if pgrep -f "python src/main.py" > /dev/null
 then
-  echo "Weather Lab is running"
+  echo "Weather Lab is running (metrics endpoint unavailable)"
   exit 0
 else
   echo "Weather Lab is not running"
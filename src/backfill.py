@@ -0,0 +1,326 @@
+"""
+Historical backfill: loads a date range of Meteostat and CMEMS data into the
+store, to rebuild indices after an outage or to populate a new cluster.
+
+    python src/backfill.py --start 2022-01-01 --end 2023-12-31 --sources meteostat,cmems
+
+The range is split into units of work, a Meteostat station or a CMEMS file
+filter of a dataset (a day by default, see "backfill_filter"), which a pool
+of worker threads downloads, parses, enriches and writes in bulks of
+BACKFILL_BULK_SIZE, throttled to BACKFILL_MAX_RECORDS_PER_SECOND apart from
+the live pipeline. Downloads go to a "backfill" directory below the
+source's output_directory, apart from the live source's files. A unit is
+added to the checkpoint once all of its records are written (a bulk with
+records the store did not take fails the unit), so a stopped backfill
+resumes with the units not done yet and failed units are tried again by the
+next run.
+
+On Elasticsearch the daily indices of the range are switched to
+refresh_interval -1 and no replicas while loading and put back afterwards.
+The checkpoint keeps their original settings, so a resumed run restores
+those. Today's and yesterday's indices, which the live pipeline writes to,
+keep their settings.
+"""
+from data_sources import registry
+from utils.metrics import METRICS
+from config import Config
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+SOURCES = ('meteostat', 'cmems')
+DATE_FORMAT = "%Y-%m-%d"
+
+
+class Checkpoint:
+    """
+    Append-only log of JSON lines of a backfill: the units done, and the
+    index settings to put back when it ends.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.index_settings = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r') as log_file:
+                for line in log_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    if 'done' in entry:
+                        self.done.add(entry['done'])
+                    for index_name, settings in entry.get('index_settings', {}).items():
+                        self.index_settings.setdefault(index_name, settings)
+                    for index_name in entry.get('restored', ()):
+                        self.index_settings.pop(index_name, None)
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, unit):
+        return unit in self.done
+
+    def _append(self, entry):
+        with self._lock:
+            with open(self.path, 'a') as log_file:
+                log_file.write(json.dumps(entry) + '\n')
+                log_file.flush()
+                os.fsync(log_file.fileno())
+
+    def mark_done(self, unit):
+        self._append({'done': unit})
+        self.done.add(unit)
+
+    def save_index_settings(self, settings):
+        """Keeps the original settings of indices, the first ones saved win."""
+        settings = {name: value for name, value in settings.items() if name not in self.index_settings}
+        if settings:
+            self._append({'index_settings': settings})
+            self.index_settings.update(settings)
+
+    def mark_restored(self, index_names):
+        self._append({'restored': list(index_names)})
+        for index_name in index_names:
+            self.index_settings.pop(index_name, None)
+
+
+class Throttle:
+    """Spaces writes out to at most rate records per second over all workers, 0 is unthrottled."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, count):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count / self.rate
+        if start > now:
+            METRICS.inc('backfill_throttled_seconds_total', start - now)
+            time.sleep(start - now)
+
+
+class BulkWriter:
+    """
+    Stands in for the queue of a worker's sources: writes the batches they
+    emit in bulks of bulk_size records. write raises when a bulk failed.
+    """
+
+    def __init__(self, write, bulk_size, throttle):
+        self.write = write
+        self.bulk_size = bulk_size
+        self.throttle = throttle
+        self.batches = []
+        self.count = 0
+
+    def put(self, batch):
+        for part in batch.split(self.bulk_size):
+            self.batches.append(part)
+            self.count += part.count_valid()
+            if self.count >= self.bulk_size:
+                self.flush()
+
+    def flush(self):
+        batches, count = self.batches, self.count
+        self.discard()
+        if not count:
+            return
+        self.throttle.wait(count)
+        self.write(batches)
+        METRICS.inc('backfill_records_total', count)
+
+    def discard(self):
+        self.batches = []
+        self.count = 0
+
+
+def days(since, until):
+    day = since
+    while day < until:
+        yield day
+        day += timedelta(days=1)
+
+
+class Backfill:
+    """
+    Loads [start, end] (whole days, UTC) of the given sources, see the
+    module docstring. Sources are configured by their config files in
+    config_dir like the live ones.
+    """
+
+    def __init__(self, start, end, sources=SOURCES, storage=None, config_dir=None, workers=None, bulk_size=None,
+                 max_records_per_second=None, checkpoint_path=None, bulk_settings=True):
+        unknown = sorted(set(sources) - set(SOURCES))
+        if unknown:
+            raise ValueError(f"Cannot backfill {', '.join(unknown)}, expected some of {', '.join(SOURCES)}")
+        if end < start:
+            raise ValueError(f"The backfill ends ({end:%Y-%m-%d}) before it starts ({start:%Y-%m-%d})")
+        self.since = datetime(start.year, start.month, start.day)
+        self.until = datetime(end.year, end.month, end.day) + timedelta(days=1)
+        self.sources = list(sources)
+        self.config_dir = config_dir or Config.CONFIG_DIR
+        self.workers = max(1, workers or Config.BACKFILL_WORKERS)
+        self.bulk_size = bulk_size or Config.BACKFILL_BULK_SIZE
+        self.throttle = Throttle(Config.BACKFILL_MAX_RECORDS_PER_SECOND if max_records_per_second is None else max_records_per_second)
+        if checkpoint_path is None:
+            os.makedirs(Config.BACKFILL_CHECKPOINT_DIR, exist_ok=True)
+            checkpoint_path = os.path.join(Config.BACKFILL_CHECKPOINT_DIR,
+                                           f"{'-'.join(self.sources)}-{start:%Y%m%d}-{end:%Y%m%d}.log")
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.bulk_settings = bulk_settings
+        if storage is None:
+            from main import create_storage
+            storage = create_storage()
+        self.storage = storage
+        from main import store_writer
+        self.write = store_writer(storage)
+        configs = registry.discover(self.config_dir)
+        missing = [name for name in self.sources if name not in configs]
+        if missing:
+            raise ValueError(f"No config for {', '.join(missing)} in {self.config_dir}")
+        self.configs = {name: configs[name] for name in self.sources}
+        self._local = threading.local()
+
+    def source(self, name, queue=None):
+        class_path, config_path, _ = self.configs[name]
+        return registry.load_class(class_path)(config_path=config_path, queue=queue)
+
+    def worker(self, name):
+        """The calling worker thread's instance of a source, and the writer it emits to."""
+        sources = getattr(self._local, 'sources', None)
+        if sources is None:
+            sources = self._local.sources = {}
+        if name not in sources:
+            writer = BulkWriter(self.write, self.bulk_size, self.throttle)
+            sources[name] = (self.source(name, writer), writer)
+        return sources[name]
+
+    def units(self):
+        """The (key, source, item) units of the range, those in the checkpoint included."""
+        units = []
+        if 'meteostat' in self.sources:
+            stations = self.source('meteostat').fetch_station_list()
+            if stations is None:
+                raise RuntimeError("Failed to fetch the Meteostat station list")
+            units += [(f"meteostat:{station.id}", 'meteostat', station) for station in stations]
+        if 'cmems' in self.sources:
+            cmems = self.source('cmems')
+            cmems.login()
+            filters = list(dict.fromkeys(cmems.backfill_filter.format(date=day) for day in days(self.since, self.until)))
+            units += [(f"cmems:{dataset_id}:{date_filter}", 'cmems', (dataset_id, date_filter))
+                      for dataset_id in cmems.dataset_ids for date_filter in filters]
+        return units
+
+    def backfill_meteostat(self, source, station):
+        # Not the live source's directory, both would download to <station>.csv.gz
+        directory = os.path.join(source.output_directory, 'backfill', 'meteostat')
+        os.makedirs(directory, exist_ok=True)
+        data = source.fetch_weather_data(station, directory)
+        if data is None:
+            return False
+        source.emit_station_data(station, data, self.since, self.until)
+        return True
+
+    def backfill_cmems(self, source, item):
+        dataset_id, date_filter = item
+        # Every unit downloads into its own directory, process_data reads all files in it
+        directory = os.path.join(source.output_directory, 'backfill', f"{dataset_id}-{date_filter.strip('*')}")
+        os.makedirs(directory, exist_ok=True)
+        try:
+            source.fetch_dataset(dataset_id, [date_filter], directory, source.backfill_dataset_part, self.since, self.until)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+    def run_unit(self, unit):
+        key, name, item = unit
+        source, writer = self.worker(name)
+        try:
+            with METRICS.timer('backfill_unit_seconds', source=name):
+                ok = getattr(self, f"backfill_{name}")(source, item)
+                writer.flush()
+        except Exception as e:
+            writer.discard()
+            logging.error(f"Backfill of {key} failed: {e}")
+            ok = False
+        if not ok:
+            METRICS.inc('backfill_units_total', source=name, status='failed')
+            return False
+        self.checkpoint.mark_done(key)
+        METRICS.inc('backfill_units_total', source=name, status='done')
+        return True
+
+    def index_names(self):
+        """The daily indices of the range that are not live, the ones bulk settings apply to."""
+        prefix = self.storage.serializer.index_prefix
+        live = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        return [f"{prefix}-{day:%Y-%m-%d}" for day in days(self.since, min(self.until, live))]
+
+    def run(self):
+        """Backfills the units not in the checkpoint. Returns the number of units that failed."""
+        units = self.units()
+        pending = [unit for unit in units if unit[0] not in self.checkpoint]
+        logging.info(f"Backfilling {len(pending)} of {len(units)} units from {self.since:%Y-%m-%d} to {self.until:%Y-%m-%d}")
+        bulk_load = self.bulk_settings and pending and hasattr(self.storage, 'begin_bulk_load')
+        failed = 0
+        try:
+            if bulk_load:
+                for index_name in self.index_names():
+                    if index_name not in self.checkpoint.index_settings:
+                        self.checkpoint.save_index_settings(self.storage.begin_bulk_load([index_name]))
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill") as pool:
+                for done, ok in enumerate(pool.map(self.run_unit, pending), 1):
+                    failed += not ok
+                    if done % 100 == 0 or done == len(pending):
+                        logging.info(f"Backfilled {done} of {len(pending)} units, {failed} failed")
+        finally:
+            if self.checkpoint.index_settings and hasattr(self.storage, 'end_bulk_load'):
+                restore = dict(self.checkpoint.index_settings)
+                self.storage.end_bulk_load(restore)
+                self.checkpoint.mark_restored(restore)
+        return failed
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather Lab historical backfill")
+    parser.add_argument('--start', type=parse_date, required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument('--end', type=parse_date, required=True, help="Last day (included), YYYY-MM-DD")
+    parser.add_argument('--sources', default=','.join(SOURCES),
+                        help=f"Comma separated sources to backfill, some of {', '.join(SOURCES)}")
+    parser.add_argument('--workers', type=int, default=Config.BACKFILL_WORKERS,
+                        help="Units downloaded and parsed at once (env BACKFILL_WORKERS)")
+    parser.add_argument('--bulk-size', type=int, default=Config.BACKFILL_BULK_SIZE,
+                        help="Records per bulk request (env BACKFILL_BULK_SIZE)")
+    parser.add_argument('--max-records-per-second', type=float, default=Config.BACKFILL_MAX_RECORDS_PER_SECOND,
+                        help="Write throttle, 0 is unthrottled (env BACKFILL_MAX_RECORDS_PER_SECOND)")
+    parser.add_argument('--checkpoint', default=None,
+                        help="Checkpoint file, by default one per sources and range in BACKFILL_CHECKPOINT_DIR")
+    parser.add_argument('--keep-index-settings', action='store_true',
+                        help="Do not switch off refreshes and replicas of the indices while loading")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+    backfill = Backfill(args.start, args.end, sources=[name.strip() for name in args.sources.split(',') if name.strip()],
+                        workers=args.workers, bulk_size=args.bulk_size, max_records_per_second=args.max_records_per_second,
+                        checkpoint_path=args.checkpoint, bulk_settings=not args.keep_index_settings)
+    raise SystemExit(1 if backfill.run() else 0)
@@ -4,25 +4,36 @@ import gzip
 import csv
 from io import BytesIO
 from multiprocessing import Queue
-import time
 import json
 from translators.aircraft_translator import translate_row
 import io
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.helpers import element_to_dict
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from data_sources.base import DataSource
+
+AIRCRAFT_REPORT_FIELDS = (
+    'observation_time', 'latitude', 'longitude', 'altitude_ft_msl', 'wind_speed_kt', 'wind_dir_degrees',
+    'temp_c', 'turbulence_code', 'icing_code', 'visibility_statute_mi', 'aircraft_ref'
+)
+
+class AircraftDataSource(DataSource):
+    name = 'aircraft'
 
-class AircraftDataSource:
     def __init__(self, config_path, queue: Queue):
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
+        self.load_schedule(config)
         self.url = config['base_url']
         self.queue = queue
-        self.solar_system_influence = SolarSystemInfluence()
         logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
     def fetch_data(self):
-        response = requests.get(self.url)
+        with METRICS.timer('fetch_seconds', source='aircraft'):
+            response = requests.get(self.url)
+        METRICS.inc('fetch_bytes_total', len(response.content), source='aircraft')
         if response.status_code == 200:
             try:
                 with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as gz:
@@ -32,47 +43,33 @@ class AircraftDataSource:
         else:
             raise Exception(f"Failed to fetch aircraft data: {response.status_code}")
 
+    def decode_aircraft_report(self, aircraft_report):
+        fields = element_to_dict(aircraft_report)
+        return {tag: fields.get(tag) for tag in AIRCRAFT_REPORT_FIELDS}
+
     def parse_data(self, data):
         root = ET.fromstring(data)
-        for aircraft_report in root.findall('.//AircraftReport'):
-            try:
-                row = {
-                    'observation_time': aircraft_report.find('observation_time').text if aircraft_report.find('observation_time') is not None else None,
-                    'latitude': aircraft_report.find('latitude').text if aircraft_report.find('latitude') is not None else None,
-                    'longitude': aircraft_report.find('longitude').text if aircraft_report.find('longitude') is not None else None,
-                    'altitude_ft_msl': aircraft_report.find('altitude_ft_msl').text if aircraft_report.find('altitude_ft_msl') is not None else None,
-                    'wind_speed_kt': aircraft_report.find('wind_speed_kt').text if aircraft_report.find('wind_speed_kt') is not None else None,
-                    'wind_dir_degrees': aircraft_report.find('wind_dir_degrees').text if aircraft_report.find('wind_dir_degrees') is not None else None,
-                    'temp_c': aircraft_report.find('temp_c').text if aircraft_report.find('temp_c') is not None else None,
-                    'turbulence_code': aircraft_report.find('turbulence_code').text if aircraft_report.find('turbulence_code') is not None else None,
-                    'icing_code': aircraft_report.find('icing_code').text if aircraft_report.find('icing_code') is not None else None,
-                    'visibility_statute_mi': aircraft_report.find('visibility_statute_mi').text if aircraft_report.find('visibility_statute_mi') is not None else None,
-                    'aircraft_ref': aircraft_report.find('aircraft_ref').text if aircraft_report.find('aircraft_ref') is not None else None
-                }
-                translated_data = translate_row(row)
-                # Set light_intensity
-
-                light_intensity = self.solar_system_influence.get_light_intensity_at_location(translated_data)
-                
-                translated_data["light_intensity"] = float(light_intensity)  # Ensure float
+        rows = [self.decode_aircraft_report(aircraft_report) for aircraft_report in root.iter('AircraftReport')]
+        records = []
+        with PROFILER.span('translate', 'aircraft'):
+            for row in self.filter_region(rows):
+                try:
+                    records.append(translate_row(row))
+                except Exception as e:
+                    METRICS.inc('records_dropped_total', source='aircraft', reason=type(e).__name__)
+                    logging.debug(f"Error parsing aircraft data: {e}")
+        METRICS.inc('records_parsed_total', len(records), source='aircraft')
+        self.emit(records)
 
-                logging.debug(f"Enriched record: {translated_data}")
-
-                # Add gravitational influence enrichment
-                influence_data = self.solar_system_influence.get_influence_at_location(translated_data)
-                translated_data.update(influence_data)
-
-                self.queue.put(translated_data)
-            except Exception as e:
-                logging.debug(f"Error parsing aircraft data: {e}")
-
-    def run(self):
-        while True:
-            try:
+    def poll(self):
+        try:
+            with PROFILER.span('fetch', 'aircraft'):
                 raw_data = self.fetch_data()
-                logging.info("Aircraft weather data fetched successfully.")
-                if raw_data:
+            logging.info("Aircraft weather data fetched successfully.")
+            if raw_data:
+                with PROFILER.span('parse', 'aircraft'):
                     self.parse_data(raw_data)
-            except Exception as e:
-                logging.info(f"Error fetching or parsing aircraft data: {e}")
-            time.sleep(60)  # Wait for 60 seconds before fetching data again
+            METRICS.mark_progress('source:aircraft')
+        except Exception as e:
+            METRICS.inc('fetch_errors_total', source='aircraft')
+            logging.info(f"Error fetching or parsing aircraft data: {e}")
@@ -0,0 +1,85 @@
+import logging
+import time
+from config import Config
+from enrichers.enrichment_stage import EnrichmentStage
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from utils.regions import load_regions
+
+DEFAULT_POLL_INTERVAL = 60
+
+
+class DataSource:
+    """
+    Base class for data sources. A source implements poll(), which fetches
+    and processes one round of data; the scheduler calls it every
+    poll_interval seconds (plus up to jitter seconds) on a shared worker
+    pool, so an idle source holds no thread.
+
+    Schedule settings come from the source's config file:
+        enabled        (bool, default true)
+        poll_interval  seconds between the end of one poll and the next,
+                       0 polls once
+        jitter         random extra delay, spreads sources over time
+        concurrency    threads the source may use inside one poll
+
+    and what its records are enriched with from "enrichment", see
+    enrichers/enrichment_stage.py. Records outside the REGIONS_FILE regions
+    are dropped right after parsing unless "region_filter" is false.
+    """
+
+    name = None
+    default_poll_interval = DEFAULT_POLL_INTERVAL
+    # When set (an EnrichmentPool, or the broker on a fetcher node), sources
+    # submit translated records to it instead of enriching them on their own thread
+    enrichment_pool = None
+
+    def load_schedule(self, config):
+        self.enabled = config.get('enabled', True)
+        self.poll_interval = float(config.get('poll_interval', self.default_poll_interval))
+        self.jitter = float(config.get('jitter', 0))
+        self.concurrency = max(1, int(config.get('concurrency', 1)))
+        self.enrichment_plan = config.get('enrichment')
+        self.enrichment_stage = EnrichmentStage({self.name: self.enrichment_plan})
+        self.regions = load_regions(Config.REGIONS_FILE) if config.get('region_filter', True) else None
+
+    def filter_region(self, records, latitude='latitude', longitude='longitude'):
+        """Drops the parsed records outside the regions of interest, counting them per source."""
+        if self.regions is None:
+            return records
+        kept, dropped = self.regions.filter(records, latitude, longitude)
+        if dropped:
+            METRICS.inc('records_dropped_total', dropped, source=self.name, reason='out_of_region')
+        return kept
+
+    def emit(self, records):
+        """
+        Hands translated records to the enrichment pool (or broker) when set,
+        otherwise enriches them here with the source's plan and puts them on
+        the queue as one RecordBatch.
+        """
+        if not records:
+            return
+        if self.enrichment_pool:
+            with PROFILER.span('enqueue', self.name):
+                self.enrichment_pool.submit(records, self.name)
+        else:
+            batch = self.enrichment_stage.enrich(records, self.name)
+            with PROFILER.span('enqueue', self.name):
+                self.queue.put(batch)
+        METRICS.inc('records_enqueued_total', len(records), source=self.name)
+
+    def poll(self):
+        raise NotImplementedError
+
+    def run(self):
+        """
+        Polls on the calling thread until interrupted, for running a single
+        source without the scheduler.
+        """
+        while True:
+            self.poll()
+            if not self.poll_interval:
+                return
+            logging.debug(f"{self.name} sleeping {self.poll_interval}s")
+            time.sleep(self.poll_interval)
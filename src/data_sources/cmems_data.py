@@ -2,19 +2,22 @@ import logging
 import os
 import time
 from datetime import datetime, timedelta
-import copernicusmarine as cm
-import netCDF4 as nc
 import numpy as np
-from botocore.exceptions import ClientError
 from multiprocessing import Queue
 import json
 from translators.cmems_translator import CmemsTranslator
-from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from data_sources.base import DataSource
+
+class CmemsDataSource(DataSource):
+    name = 'cmems'
+    default_poll_interval = 3600
 
-class CmemsDataSource:
     def __init__(self, config_path, queue: Queue):
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
+        self.load_schedule(config)
         
         self.username = os.environ.get('CMEMS_USERNAME')
         self.password = os.environ.get('CMEMS_PASSWORD')
@@ -24,95 +27,113 @@ class CmemsDataSource:
         
         self.dataset_ids = config['dataset_ids']
         self.output_directory = config['output_directory']
+        # Files a backfill loads per unit: the dataset part, and a file name filter formatted per day
+        # (days with the same filter are one unit, "*{date:%Y%m}*" loads monthly files)
+        self.backfill_dataset_part = config.get('backfill_dataset_part', 'latest')
+        self.backfill_filter = config.get('backfill_filter', '*{date:%Y%m%d}*')
         self.queue = queue
         self.translator = CmemsTranslator()
         logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-        self.solar_system_influence = SolarSystemInfluence() 
 
     def read_secret(self, path):
         with open(path, 'r') as f:
             return f.read().strip()
 
-    def fetch_data(self):
+    def login(self):
+        # copernicusmarine takes seconds to import, only pay for it when fetching
+        import copernicusmarine as cm
         logging.debug("Logging in to Copernicus Marine")
         cm.login(username=self.username, password=self.password, force_overwrite=True)
 
+    def fetch_data(self):
+        self.login()
         logging.debug("Checking available CMEMS data")
         current_day = datetime.utcnow().strftime("%Y%m%d")
         yesterday = (datetime.utcnow() - timedelta(days=1)).strftime("%Y%m%d")
         date_filters = [f"*{current_day}*", f"*{yesterday}*"]
-
         for dataset_id in self.dataset_ids:
-            retry_attempts = 3
-            for attempt in range(retry_attempts):
-                try:
-                    for date_filter in date_filters:
-                        logging.debug(f"Attempting to fetch data for dataset: {dataset_id} with filter {date_filter}, attempt: {attempt + 1}")
-                        output_files = cm.get(
-                            dataset_id=dataset_id,
-                            filter=date_filter,
-                            output_directory=self.output_directory,
-                            sync=True,
-                            dataset_version="202311",
-                            dataset_part="latest"
-                        )
-                        if output_files:
-                            logging.info(f"Files available for {dataset_id} with filter {date_filter}: {output_files}")
-                            for file_name in output_files:
-                                file_path = os.path.join(self.output_directory, file_name)
-                                if os.path.exists(file_path):
-                                    logging.info(f"File already exists, skipping download: {file_path}")
-                                else:
-                                    logging.info(f"Downloading file: {file_name}")
-                                    cm.get(
-                                        dataset_id=dataset_id,
-                                        output_directory=self.output_directory,
-                                        filter=date_filter,
-                                        sync=True,
-                                        dataset_version="202311",
-                                        dataset_part="latest"
-                                    )
-                                self.process_data(self.output_directory)
-                        else:
-                            logging.info(f"No files available for {dataset_id} with filter {date_filter}")
-                    break
-                except ClientError as e:
-                    logging.error(f"ClientError encountered: {e}")
-                    if e.response['Error']['Code'] == '408' and attempt < retry_attempts - 1:
-                        logging.warning(f"Request Timeout. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
-                        time.sleep(5)
+            self.fetch_dataset(dataset_id, date_filters)
+
+    def fetch_dataset(self, dataset_id, date_filters, output_directory=None, dataset_part="latest", since=None, until=None):
+        """
+        Downloads the files of a dataset matching the date filters into
+        output_directory (the configured one by default) and processes them,
+        keeping the records in [since, until).
+        """
+        import copernicusmarine as cm
+        from botocore.exceptions import ClientError
+
+        output_directory = output_directory or self.output_directory
+        retry_attempts = 3
+        for attempt in range(retry_attempts):
+            try:
+                for date_filter in date_filters:
+                    logging.debug(f"Attempting to fetch data for dataset: {dataset_id} with filter {date_filter}, attempt: {attempt + 1}")
+                    output_files = cm.get(
+                        dataset_id=dataset_id,
+                        filter=date_filter,
+                        output_directory=output_directory,
+                        sync=True,
+                        dataset_version="202311",
+                        dataset_part=dataset_part
+                    )
+                    if output_files:
+                        logging.info(f"Files available for {dataset_id} with filter {date_filter}: {output_files}")
+                        for file_name in output_files:
+                            file_path = os.path.join(output_directory, file_name)
+                            if os.path.exists(file_path):
+                                logging.info(f"File already exists, skipping download: {file_path}")
+                            else:
+                                logging.info(f"Downloading file: {file_name}")
+                                cm.get(
+                                    dataset_id=dataset_id,
+                                    output_directory=output_directory,
+                                    filter=date_filter,
+                                    sync=True,
+                                    dataset_version="202311",
+                                    dataset_part=dataset_part
+                                )
+                            self.process_data(output_directory, since, until)
                     else:
-                        logging.error(f"Failed to fetch data for {dataset_id} after {retry_attempts}")
-                        raise
-                except Exception as e:
-                    logging.error(f"Unexpected error encountered: {e}")
+                        logging.info(f"No files available for {dataset_id} with filter {date_filter}")
+                break
+            except ClientError as e:
+                logging.error(f"ClientError encountered: {e}")
+                if e.response['Error']['Code'] == '408' and attempt < retry_attempts - 1:
+                    logging.warning(f"Request Timeout. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
+                    time.sleep(5)
+                else:
+                    logging.error(f"Failed to fetch data for {dataset_id} after {retry_attempts}")
                     raise
+            except Exception as e:
+                logging.error(f"Unexpected error encountered: {e}")
+                raise
 
-    def process_data(self, directory):
+    def process_data(self, directory, since=None, until=None):
         logging.info(f"Processing directory: {directory}")
         for root, _, files in os.walk(directory):
             for file in files:
                 if file.endswith('.nc'):
                     file_path = os.path.join(root, file)
                     logging.info(f"Processing file: {file_path}")
-                    data_dict, ds = self.netcdf_to_dict(file_path)
+                    METRICS.inc('fetch_bytes_total', os.path.getsize(file_path), source='cmems')
+                    with PROFILER.span('parse', 'cmems'):
+                        data_dict, ds = self.netcdf_to_dict(file_path)
                     if data_dict and ds:
-                        translated_data = self.translator.translate(data_dict)
-                        combined_results = self.combine_measurements(translated_data, ds)
-                        for result in combined_results:
-                            # Set light_intensity
-
-                            light_intensity = self.solar_system_influence.get_light_intensity_at_location(result)
-                            
-                            translated_data["light_intensity"] = float(light_intensity)  # Ensure float
-
-                            logging.debug(f"Enriched record: {result}")
-
-                            # Add gravitational influence enrichment
-                            influence_data = self.solar_system_influence.get_influence_at_location(result)
-                            result.update(influence_data)
-                            self.queue.put(result)
+                        if self.outside_regions(ds):
+                            logging.info(f"Skipping file outside the regions of interest: {file_path}")
+                            METRICS.inc('records_dropped_total', self.row_count(data_dict), source='cmems', reason='out_of_region')
+                        else:
+                            with PROFILER.span('translate', 'cmems'):
+                                translated_data = self.translator.translate(data_dict)
+                            with PROFILER.span('parse', 'cmems'):
+                                combined_results = self.filter_region(self.combine_measurements(translated_data, ds))
+                                if since or until:
+                                    combined_results = self.filter_window(combined_results, since, until)
+                            METRICS.inc('records_parsed_total', len(combined_results), source='cmems')
+                            self.emit(combined_results)
                         ds.close()
+                        METRICS.mark_progress('source:cmems')
                         # Remove the file after processing
                         try:
                             os.remove(file_path)
@@ -130,6 +151,7 @@ class CmemsDataSource:
         # ...existing code...
 
     def netcdf_to_dict(self, file_path):
+        import netCDF4 as nc
         logging.info(f"Converting NetCDF file to dictionary: {file_path}")
         try:
             ds = nc.Dataset(file_path, 'r')
@@ -159,24 +181,27 @@ class CmemsDataSource:
     def combine_measurements(self, data, ds):
         combined_results = []
         keys = list(data.keys())
+        # QC flags are kept under the name of the field they flag (temp_qc -> temperature_qc), the
+        # validation stage masks the values with bad flags and removes them
+        names = [self.translator.translations.get(key[:-3], key[:-3]) + "_qc" if key.endswith("_qc") else key for key in keys]
         length = min(len(data[key]) for key in keys if isinstance(data[key], list))
         fallback_lat, fallback_lon = self.get_fallback_lat_lon(ds)
         fallback_station = self.get_fallback_station(ds)
         for i in range(length):
             combined_result = {}
-            for key in keys:
-                if key.endswith("_qc"):
-                    continue
+            for key, name in zip(keys, names):
                 if isinstance(data[key], list) and len(data[key]) > 0:
                     if isinstance(data[key][0], list):
                         if i < len(data[key]) and len(data[key][i]) > 0:
-                            combined_result[key] = data[key][i][0]
+                            combined_result[name] = data[key][i][0]
                         else:
-                            combined_result[key] = None
+                            combined_result[name] = None
                     else:
-                        combined_result[key] = data[key][i]
+                        combined_result[name] = data[key][i]
+                elif name.endswith("_qc"):
+                    continue
                 else:
-                    combined_result[key] = data[key]
+                    combined_result[name] = data[key]
             if "latitude" not in combined_result and fallback_lat is not None:
                 combined_result["latitude"] = fallback_lat
             if "longitude" not in combined_result and fallback_lon is not None:
@@ -201,6 +226,32 @@ class CmemsDataSource:
             combined_results.append(combined_result)
         return combined_results
 
+    def filter_window(self, records, since=None, until=None):
+        """Drops the records with a timestamp outside [since, until), for backfills of whole files."""
+        since = since.isoformat() if since else None
+        until = until.isoformat() if until else None
+        kept = [record for record in records
+                if not record.get("timestamp")
+                or ((since is None or record["timestamp"] >= since) and (until is None or record["timestamp"] < until))]
+        if len(kept) < len(records):
+            METRICS.inc('records_dropped_total', len(records) - len(kept), source='cmems', reason='out_of_window')
+        return kept
+
+    def row_count(self, data):
+        return min((len(value) for value in data.values() if isinstance(value, list)), default=0)
+
+    def outside_regions(self, ds):
+        """Whether the geospatial bounds of a file miss every region of interest."""
+        if self.regions is None:
+            return False
+        names = ('geospatial_lat_min', 'geospatial_lon_min', 'geospatial_lat_max', 'geospatial_lon_max')
+        if not all(name in ds.ncattrs() for name in names):
+            return False
+        try:
+            return not self.regions.intersects(*(float(ds.getncattr(name)) for name in names))
+        except (TypeError, ValueError):
+            return False
+
     def get_fallback_lat_lon(self, ds):
         lat = ds.getncattr('geospatial_lat_min') if 'geospatial_lat_min' in ds.ncattrs() else None
         lon = ds.getncattr('geospatial_lon_min') if 'geospatial_lon_min' in ds.ncattrs() else None
@@ -257,10 +308,12 @@ class CmemsDataSource:
             return cleaned_list
         return ""
     
-    def run(self):
-        while True:
-            try:
-                self.process_data(self.output_directory)
+    def poll(self):
+        try:
+            self.process_data(self.output_directory)
+            with METRICS.timer('fetch_seconds', source='cmems'), PROFILER.span('fetch', 'cmems'):
                 self.fetch_data()
-            except Exception as e:
-                logging.error(f"Error in run method: {e}")
\ No newline at end of file
+            METRICS.mark_progress('source:cmems')
+        except Exception as e:
+            METRICS.inc('fetch_errors_total', source='cmems')
+            logging.error(f"Error in poll: {e}")
\ No newline at end of file
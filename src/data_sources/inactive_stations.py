@@ -0,0 +1,121 @@
+"""
+Persistent record of the Meteostat stations whose data could not be
+downloaded, with an exponential re-probe schedule.
+
+Changes are kept in memory and appended to a log of JSON lines (one per
+failure or recovery) by flush(), once per pass, with a single fsync; the
+log is rewritten from memory when it holds many superseded lines. An
+inactive station is probed again retry_seconds after its first failure,
+then after twice that, and so on up to max_retry_seconds, so stations that
+come back online are picked up again.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+
+class InactiveStations:
+    def __init__(self, path, retry_seconds=86400, max_retry_seconds=30 * 86400, legacy_path=None):
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        # station id -> (failures, time of the last failure)
+        self.stations = {}
+        self._pending = []
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+        if legacy_path and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as log_file:
+                for line in log_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self._log_lines += 1
+                    if entry.get('failures'):
+                        self.stations[entry['id']] = (entry['failures'], entry['last_failure'])
+                    else:
+                        self.stations.pop(entry['id'], None)
+        except FileNotFoundError:
+            pass
+
+    def _import_legacy(self, legacy_path):
+        """Takes over the JSON list of inactive stations the source used to rewrite on every failure."""
+        with open(legacy_path, 'r') as legacy_file:
+            station_ids = json.load(legacy_file)
+        failed_at = os.path.getmtime(legacy_path)
+        for station_id in station_ids:
+            self.stations.setdefault(station_id, (1, failed_at))
+        self.compact()
+        os.remove(legacy_path)
+        logging.info(f"Moved {len(station_ids)} inactive stations from {legacy_path} to {self.path}")
+
+    def __contains__(self, station_id):
+        return station_id in self.stations
+
+    def __len__(self):
+        return len(self.stations)
+
+    def next_probe(self, station_id):
+        """When an inactive station is tried again, or None for an active one."""
+        entry = self.stations.get(station_id)
+        if entry is None:
+            return None
+        failures, last_failure = entry
+        return last_failure + min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+
+    def due(self, station_id, now=None):
+        """Whether a station should be polled: it is active, or due for a re-probe."""
+        next_probe = self.next_probe(station_id)
+        return next_probe is None or (time.time() if now is None else now) >= next_probe
+
+    def mark_failed(self, station_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            failures = self.stations.get(station_id, (0, 0))[0] + 1
+            self.stations[station_id] = (failures, now)
+            self._pending.append({'id': station_id, 'failures': failures, 'last_failure': now})
+
+    def mark_active(self, station_id):
+        with self._lock:
+            if self.stations.pop(station_id, None) is not None:
+                self._pending.append({'id': station_id, 'failures': 0})
+                logging.info(f"Station {station_id} is active again")
+
+    def flush(self):
+        """Appends the changes since the last flush to the log, compacting it when mostly superseded."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            if self._log_lines + len(pending) > 2 * len(self.stations) + 1000:
+                self._compact()
+                return
+            with open(self.path, 'a') as log_file:
+                log_file.write(''.join(json.dumps(entry) + '\n' for entry in pending))
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            self._log_lines += len(pending)
+
+    def compact(self):
+        with self._lock:
+            self._pending = []
+            self._compact()
+
+    def _compact(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as log_file:
+            for station_id, (failures, last_failure) in self.stations.items():
+                log_file.write(json.dumps({'id': station_id, 'failures': failures, 'last_failure': last_failure}) + '\n')
+            log_file.flush()
+            os.fsync(log_file.fileno())
+        os.replace(temporary, self.path)
+        self._log_lines = len(self.stations)
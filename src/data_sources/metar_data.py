@@ -3,25 +3,30 @@ import requests
 import gzip
 import io
 import xml.etree.ElementTree as ET
-from datetime import datetime
 from multiprocessing import Queue
 import json
 from translators.metar_translator import MetarTranslator
-import time
-from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from data_sources.base import DataSource
+from utils.helpers import element_to_dict, utc_isoformat
+
+class MetarDataSource(DataSource):
+    name = 'metar'
 
-class MetarDataSource:
     def __init__(self, config_path, queue: Queue):
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
+        self.load_schedule(config)
         self.url = config['url']
         self.queue = queue
         self.translator = MetarTranslator()
-        self.solar_system_influence = SolarSystemInfluence()
         logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
     def fetch_data(self):
-        response = requests.get(self.url)
+        with METRICS.timer('fetch_seconds', source='metar'):
+            response = requests.get(self.url)
+        METRICS.inc('fetch_bytes_total', len(response.content), source='metar')
         if response.status_code == 200:
             try:
                 with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as gz:
@@ -31,67 +36,72 @@ class MetarDataSource:
         else:
             raise Exception(f"Failed to fetch METAR data: {response.status_code}")
 
+    def decode_metar(self, metar):
+        fields = element_to_dict(metar)
+        observation_time = fields.get('observation_time')
+        time_iso = utc_isoformat(observation_time) if observation_time else None
+        latitude = self.convert_to_float(fields.get('latitude'))
+        longitude = self.convert_to_float(fields.get('longitude'))
+
+        pressure = self.convert_to_float(fields.get('altim_in_hg'))
+        return {
+            "time": time_iso,
+            "station_id": fields.get('station_id'),
+            "latitude": latitude,
+            "longitude": longitude,
+            "visibility": self.convert_to_float(fields.get('visibility_statute_mi')),
+            "wind_speed": self.convert_to_int(fields.get('wind_speed_kt')),
+            "wind_dir": self.convert_to_int(fields.get('wind_dir_degrees')),
+            "pressure": pressure * 33.8639 if pressure is not None else None,
+            "temperature": self.convert_to_float(fields.get('temp_c')),
+            "dewpoint": self.convert_to_float(fields.get('dewpoint_c')),
+        }
+
     def parse_data(self, data):
         root = ET.fromstring(data)
-        for metar in root.findall('.//METAR'):
+        records = []
+        for metar in root.iter('METAR'):
             try:
-                station_id = metar.find('station_id').text if metar.find('station_id') is not None else None
-                observation_time = metar.find('observation_time').text if metar.find('observation_time') is not None else None
-                time_iso = datetime.strptime(observation_time, "%Y-%m-%dT%H:%M:%SZ").isoformat() if observation_time else None
-                latitude = self.convert_to_float(metar.find('latitude').text) if metar.find('latitude') is not None else None
-                longitude = self.convert_to_float(metar.find('longitude').text) if metar.find('longitude') is not None else None
-                
-                if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
-                    raise ValueError(f"Invalid latitude or longitude: {latitude}, {longitude}")
-
-                record = {
-                    "time": time_iso,
-                    "station_id": station_id,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "visibility": self.convert_to_float(metar.find('visibility_statute_mi').text) if metar.find('visibility_statute_mi') is not None else None,
-                    "wind_speed": self.convert_to_int(metar.find('wind_speed_kt').text) if metar.find('wind_speed_kt') is not None else None,
-                    "wind_dir": self.convert_to_int(metar.find('wind_dir_degrees').text) if metar.find('wind_dir_degrees') is not None else None,
-                    "pressure": self.convert_to_float(metar.find('altim_in_hg').text) * 33.8639 if metar.find('altim_in_hg') is not None else None,
-                    "temperature": self.convert_to_float(metar.find('temp_c').text) if metar.find('temp_c') is not None else None,
-                    "dewpoint": self.convert_to_float(metar.find('dewpoint_c').text) if metar.find('dewpoint_c') is not None else None,
-                }
-                translated_data = self.translator.translate(record)
-                # Set light_intensity
-
-                light_intensity = self.solar_system_influence.get_light_intensity_at_location(translated_data)
-                
-                translated_data["light_intensity"] = float(light_intensity)  # Ensure float
-
-                logging.debug(f"Enriched record: {translated_data}")
-
-                # Add gravitational influence enrichment
-                influence_data = self.solar_system_influence.get_influence_at_location(translated_data)
-                translated_data.update(influence_data)
-
-                self.queue.put(translated_data)
+                records.append(self.decode_metar(metar))
             except Exception as e:
+                METRICS.inc('records_dropped_total', source='metar', reason=type(e).__name__)
                 logging.debug(f"Error parsing METAR data: {e}")
+        batch_records = []
+        with PROFILER.span('translate', 'metar'):
+            for record in self.filter_region(records):
+                try:
+                    batch_records.append(self.translator.translate(record))
+                except Exception as e:
+                    METRICS.inc('records_dropped_total', source='metar', reason=type(e).__name__)
+                    logging.debug(f"Error parsing METAR data: {e}")
+        METRICS.inc('records_parsed_total', len(batch_records), source='metar')
+        self.emit(batch_records)
 
     def convert_to_float(self, value):
+        if value is None:
+            return None
         try:
             return float(value.replace('+', '').replace('M', '-'))
         except ValueError:
             return None
 
     def convert_to_int(self, value):
+        if value is None:
+            return None
         try:
             return int(value.replace('+', '').replace('M', '-'))
         except ValueError:
             return None
 
-    def run(self):
-        while True:
-            try:
+    def poll(self):
+        try:
+            with PROFILER.span('fetch', 'metar'):
                 raw_data = self.fetch_data()
-                logging.info("METAR weather data fetched successfully.")
-                if raw_data:
+            logging.info("METAR weather data fetched successfully.")
+            if raw_data:
+                with PROFILER.span('parse', 'metar'):
                     self.parse_data(raw_data)
-            except Exception as e:
-                logging.info(f"Error fetching or parsing METAR data: {e}")
-            time.sleep(60)  # Wait for 60 seconds before fetching data again
\ No newline at end of file
+            METRICS.mark_progress('source:metar')
+        except Exception as e:
+            METRICS.inc('fetch_errors_total', source='metar')
+            logging.info(f"Error fetching or parsing METAR data: {e}")
\ No newline at end of file
@@ -5,10 +5,18 @@ import csv
 import io
 import json
 import math
+import numpy as np
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from multiprocessing import Queue
-from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from utils.validation import in_range
+from data_sources.base import DataSource
+from data_sources.inactive_stations import InactiveStations
+from data_sources.station_catalog import StationCatalog
 
 METEOSTAT_COCO_MAPPING = {
     0: "Clear",
@@ -47,8 +55,10 @@ def translate_coco(coco):
 def download_and_extract_gzip(url, output_dir):
     try:
         file_name = url.split("/")[-1]
-        response = requests.get(url)
+        with METRICS.timer('fetch_seconds', source='meteostat'):
+            response = requests.get(url)
         response.raise_for_status()
+        METRICS.inc('fetch_bytes_total', len(response.content), source='meteostat')
         file_path = os.path.join(output_dir, file_name)
         with open(file_path, 'wb') as f:
             f.write(response.content)
@@ -60,51 +70,132 @@ def download_and_extract_gzip(url, output_dir):
         os.remove(file_path)
         return data
     except Exception as e:
+        METRICS.inc('fetch_errors_total', source='meteostat')
         logging.error(f"Error downloading or extracting {url}: {e}")
         return None
 
-class MeteostatDataSource:
+class MeteostatDataSource(DataSource):
+    name = 'meteostat'
+    default_poll_interval = 3600
+
     def __init__(self, config_path, queue: Queue):
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
+        self.load_schedule(config)
+        # max_workers predates the scheduler's concurrency setting
+        self.concurrency = max(1, int(config.get('concurrency', config.get('max_workers', 1))))
         self.queue = queue
         self.base_url = config.get("base_url", "https://bulk.meteostat.net/v2")
         self.stations_url = config.get("stations_url", f"{self.base_url}/stations/lite.json.gz")
         self.output_directory = config.get("output_directory", "/tmp")
-        self.inactive_stations_file = os.path.join(self.output_directory, "inactive_stations.json")
-        self.inactive_stations = self.load_inactive_stations()
+        # The station catalog is cached in the output directory and revalidated once it is older than this
+        self.station_catalog_ttl = float(config.get("station_catalog_ttl", 86400))
+        # [min_lat, min_lon, max_lat, max_lon], and/or {"latitude", "longitude", "count"}
+        self.station_region = config.get("station_region")
+        self.nearest_stations = config.get("nearest_stations")
+        self.station_catalog_file = os.path.join(self.output_directory, "station_catalog.npz")
+        self.station_catalog_meta_file = os.path.join(self.output_directory, "station_catalog.json")
+        self.station_catalog = None
+        self.station_catalog_meta = {}
+        # Stations without data are probed again after inactive_retry_seconds, doubling up to inactive_retry_max_seconds
+        self.inactive_stations = InactiveStations(
+            os.path.join(self.output_directory, "inactive_stations.log"),
+            retry_seconds=float(config.get("inactive_retry_seconds", 86400)),
+            max_retry_seconds=float(config.get("inactive_retry_max_seconds", 30 * 86400)),
+            legacy_path=os.path.join(self.output_directory, "inactive_stations.json"))
         logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-        self.solar_system_influence = SolarSystemInfluence() 
 
-    def load_inactive_stations(self):
-        if os.path.exists(self.inactive_stations_file):
-            with open(self.inactive_stations_file, 'r') as f:
-                return set(json.load(f))
-        return set()
+    def load_cached_station_catalog(self):
+        try:
+            with open(self.station_catalog_meta_file, 'r') as f:
+                meta = json.load(f)
+            catalog = StationCatalog.load(self.station_catalog_file)
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.station_catalog_meta_file):
+                logging.warning(f"Ignoring unreadable station catalog cache: {e}")
+            return
+        self.station_catalog, self.station_catalog_meta = catalog, meta
 
-    def save_inactive_stations(self):
-        with open(self.inactive_stations_file, 'w') as f:
-            json.dump(list(self.inactive_stations), f)
+    def save_station_catalog_meta(self):
+        with open(self.station_catalog_meta_file + '.tmp', 'w') as f:
+            json.dump(self.station_catalog_meta, f)
+        os.replace(self.station_catalog_meta_file + '.tmp', self.station_catalog_meta_file)
 
-    def fetch_station_list(self):
+    def fetch_station_catalog(self):
+        """
+        The station catalog: the cached one while it is younger than
+        station_catalog_ttl, else revalidated with its ETag/Last-Modified and
+        downloaded again only when it changed. A failed refresh keeps the
+        cached catalog.
+        """
+        if self.station_catalog is None:
+            self.load_cached_station_catalog()
+        now = time.time()
+        if self.station_catalog is not None and now - self.station_catalog_meta.get('fetched_at', 0) < self.station_catalog_ttl:
+            return self.station_catalog
+
+        headers = {}
+        if self.station_catalog is not None:
+            if self.station_catalog_meta.get('etag'):
+                headers['If-None-Match'] = self.station_catalog_meta['etag']
+            if self.station_catalog_meta.get('last_modified'):
+                headers['If-Modified-Since'] = self.station_catalog_meta['last_modified']
         try:
-            response = requests.get(self.stations_url)
-            response.raise_for_status()
-            with gzip.open(io.BytesIO(response.content), 'rt', encoding='utf-8') as f:
-                stations = json.load(f)
-            logging.info(f"Fetched {len(stations)} stations")
-            return stations
-        except requests.exceptions.RequestException as e:
+            with METRICS.timer('fetch_seconds', source='meteostat_stations'):
+                response = requests.get(self.stations_url, headers=headers)
+            if response.status_code == 304 and self.station_catalog is not None:
+                logging.info("Station catalog unchanged")
+            else:
+                response.raise_for_status()
+                METRICS.inc('fetch_bytes_total', len(response.content), source='meteostat_stations')
+                with gzip.open(io.BytesIO(response.content), 'rt', encoding='utf-8') as f:
+                    catalog = StationCatalog.from_stations(json.load(f))
+                catalog.save(self.station_catalog_file)
+                self.station_catalog = catalog
+                self.station_catalog_meta = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+                logging.info(f"Fetched {len(catalog)} stations")
+            self.station_catalog_meta['fetched_at'] = now
+            self.save_station_catalog_meta()
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            METRICS.inc('fetch_errors_total', source='meteostat_stations')
             logging.error(f"Error fetching station list: {e}")
-            return None
+        return self.station_catalog
+
+    def select_stations(self, catalog):
+        """
+        Rows of the stations to poll: those in station_region and/or the
+        nearest_stations, else all, less the stations outside the regions of
+        interest (their records would all be dropped).
+        """
+        rows = None
+        if self.station_region:
+            rows = catalog.within_bbox(*self.station_region)
+        if self.nearest_stations:
+            near = catalog.nearest(self.nearest_stations['latitude'], self.nearest_stations['longitude'],
+                                   self.nearest_stations.get('count', 10))
+            rows = near if rows is None else near[np.isin(near, rows)]
+        if self.regions is not None:
+            rows = np.arange(len(catalog)) if rows is None else rows
+            inside = self.regions.contains(catalog.latitudes[rows], catalog.longitudes[rows])
+            if not inside.all():
+                METRICS.inc('stations_dropped_total', int((~inside).sum()), source='meteostat', reason='out_of_region')
+            rows = rows[inside]
+        return rows
 
-    def fetch_weather_data(self, station):
-        station_id = station['id']
-        if station_id in self.inactive_stations:
-            logging.info(f"Skipping inactive station {station_id}")
+    def fetch_station_list(self):
+        catalog = self.fetch_station_catalog()
+        if catalog is None:
             return None
+        return catalog.stations(self.select_stations(catalog))
+
+    def fetch_weather_data(self, station, directory=None):
+        station_id = station.id
         station_url = f"{self.base_url}/hourly/{station_id}.csv.gz"
-        return download_and_extract_gzip(station_url, self.output_directory)
+        # The backfill downloads elsewhere, the live source may fetch the same station at the same time
+        return download_and_extract_gzip(station_url, directory or self.output_directory)
 
     def compute_dew_point(self, temp, rhum):
         if temp is None or rhum is None:
@@ -114,27 +205,27 @@ class MeteostatDataSource:
         alpha = ((a * temp) / (b + temp)) + math.log(rhum / 100.0)
         return (b * alpha) / (a - alpha)
 
-    def is_valid_temperature(self, temp):
-        return -90 <= temp <= 60
-
-    def is_valid_pressure(self, pressure):
-        return 870 <= pressure <= 1085
-
-    def format_record(self, station, record):
+    def format_record(self, station, record, since=None, until=None):
+        """
+        A record of a station file as a flat dict, or None when it lies
+        outside [since, until). since defaults to a day ago, the live window.
+        """
         if 'date' not in record or 'hour' not in record:
             return None
         record_datetime = datetime.strptime(f"{record['date']} {record['hour']}", "%Y-%m-%d %H")
-        if record_datetime < datetime.utcnow() - timedelta(days=1):
+        if record_datetime < (since or datetime.utcnow() - timedelta(days=1)):
+            return None
+        if until is not None and record_datetime >= until:
             return None
         formatted_record = {
-            "station_id": station["id"],
-            "latitude": station["location"]["latitude"],
-            "longitude": station["location"]["longitude"],
+            "station_id": station.id,
+            "latitude": station.latitude,
+            "longitude": station.longitude,
             "timestamp": f"{record['date']}T{int(record['hour']):02d}:00:00",
-            "location": f"{station['location']['latitude']},{station['location']['longitude']}",
-            "elevation": station["location"].get("elevation"),
-            "station_name": station["name"].get("en") or next(iter(station["name"].values())),
-            "country": station["country"]
+            "location": station.location,
+            "elevation": station.elevation,
+            "station_name": station.name,
+            "country": station.country
         }
         optional_fields = ["temp","dewpt","rhum","precipitation","snow","wind_dir","wind_speed","wind_gust","pressure","tsun","coco"]
         for field in optional_fields:
@@ -143,22 +234,20 @@ class MeteostatDataSource:
                 try:
                     parsed_val = float(val)
                     if field == "temp":
-                        if not self.is_valid_temperature(parsed_val):
-                            continue
                         formatted_record["temperature"] = parsed_val
                         continue
                     if field == "dewpt":
                         formatted_record["dewpoint"] = parsed_val
                         continue
-                    if field == "pressure" and not self.is_valid_pressure(parsed_val):
-                        continue
                     formatted_record[field] = parsed_val
                 except ValueError:
                     try:
                         formatted_record[field] = int(val)
                     except ValueError:
                         formatted_record[field] = val
-        if "dewpoint" not in formatted_record and "temperature" in formatted_record and "rhum" in formatted_record:
+        # Out of range values are dropped by the validation stage, a dew point is not derived from them
+        if ("dewpoint" not in formatted_record and "temperature" in formatted_record and "rhum" in formatted_record
+                and in_range("temperature", formatted_record["temperature"])):
             formatted_record["dewpoint"] = self.compute_dew_point(formatted_record["temperature"], formatted_record["rhum"])
         if "rhum" in formatted_record:
             del formatted_record["rhum"]
@@ -170,37 +259,61 @@ class MeteostatDataSource:
         return {k: v for k, v in formatted_record.items() if v is not None}
 
     def fetch_data(self):
-        stations = self.fetch_station_list()
+        with PROFILER.span('fetch', 'meteostat'):
+            stations = self.fetch_station_list()
         if not stations:
             logging.error("Failed to fetch station list")
             return
 
-        for station in stations:
+        try:
+            if self.concurrency > 1:
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="meteostat") as pool:
+                    for _ in pool.map(self.process_station, stations):
+                        pass
+            else:
+                for station in stations:
+                    self.process_station(station)
+        finally:
+            self.inactive_stations.flush()
+            METRICS.set('meteostat_inactive_stations', len(self.inactive_stations))
+
+    def process_station(self, station):
+        if not self.inactive_stations.due(station.id):
+            logging.debug(f"Skipping inactive station {station.id}")
+            return
+        with PROFILER.span('fetch', 'meteostat'):
             data = self.fetch_weather_data(station)
-            logging.info(f"Meteostat file fetched successfully station {station['id']}.")
-            if data:
-                for record in data:
-                    formatted_record = self.format_record(station, record)
-                    if formatted_record:
-                        formatted_record["source"] = "meteostat"
-                        # Set light_intensity
-
-                        light_intensity = self.solar_system_influence.get_light_intensity_at_location(formatted_record)
-                        
-                        formatted_record["light_intensity"] = float(light_intensity)  # Ensure float
-
-                        logging.debug(f"Enriched record: {formatted_record}")
-
-                        # Add gravitational influence enrichment
-                        influence_data = self.solar_system_influence.get_influence_at_location(formatted_record)
-                        formatted_record.update(influence_data)
-                        self.queue.put(formatted_record)
+        logging.info(f"Meteostat file fetched successfully station {station.id}.")
+        if data:
+            self.inactive_stations.mark_active(station.id)
+            self.emit_station_data(station, data)
+        else:
+            logging.warning(f"Data unavailable for station {station.id}")
+            self.inactive_stations.mark_failed(station.id)
+        METRICS.mark_progress('source:meteostat')
+
+    def emit_station_data(self, station, data, since=None, until=None):
+        """Formats the rows of a station file in [since, until) and emits them, see format_record."""
+        out_of_window = 0
+        records = []
+        for record in data:
+            try:
+                with PROFILER.span('parse', 'meteostat'):
+                    formatted_record = self.format_record(station, record, since, until)
+            except Exception as e:
+                METRICS.inc('records_dropped_total', source='meteostat', reason=type(e).__name__)
+                logging.debug(f"Error formatting Meteostat record: {e}")
+                continue
+            if formatted_record:
+                METRICS.inc('records_parsed_total', source='meteostat')
+                formatted_record["source"] = "meteostat"
+                records.append(formatted_record)
             else:
-                logging.warning(f"Data unavailable for station {station['id']}")
-                self.inactive_stations.add(station['id'])
-                self.save_inactive_stations()
-
-    def run(self):
-        while True:
-            self.fetch_data()
-            logging.info("Meteostat weather data fetched successfully.")
\ No newline at end of file
+                out_of_window += 1
+        self.emit(records)
+        METRICS.inc('records_dropped_total', out_of_window, source='meteostat', reason='out_of_window')
+        return len(records)
+
+    def poll(self):
+        self.fetch_data()
+        logging.info("Meteostat weather data fetched successfully.")
\ No newline at end of file
@@ -0,0 +1,63 @@
+import glob
+import importlib
+import json
+import logging
+import os
+
+CONFIG_SUFFIX = '_config.json'
+
+# Built-in sources by name; the config file for a source is <name>_config.json.
+# A config file can name another implementation with "class": "module:ClassName".
+DATA_SOURCES = {
+    'cmems': 'data_sources.cmems_data:CmemsDataSource',
+    'metar': 'data_sources.metar_data:MetarDataSource',
+    'space_weather': 'data_sources.space_weather_data:SpaceWeatherDataSource',
+    'meteostat': 'data_sources.meteostat_data:MeteostatDataSource',
+    'aircraft': 'data_sources.aircraft_data:AircraftDataSource',
+}
+
+
+def load_class(path):
+    module_name, class_name = path.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def discover(config_dir):
+    """
+    Returns {name: (class path, config path, config)} for every
+    <name>_config.json in config_dir that belongs to a known source or names
+    its own class.
+    """
+    sources = {}
+    for config_path in sorted(glob.glob(os.path.join(config_dir, f'*{CONFIG_SUFFIX}'))):
+        name = os.path.basename(config_path)[:-len(CONFIG_SUFFIX)]
+        with open(config_path, 'r') as config_file:
+            config = json.load(config_file)
+        class_path = config.get('class', DATA_SOURCES.get(name))
+        if class_path is None:
+            logging.warning(f"No data source registered for {config_path}")
+            continue
+        sources[name] = (class_path, config_path, config)
+    return sources
+
+
+def enrichment_plans(config_dir):
+    """
+    Returns {name: enrichment plan} of every source in config_dir, for
+    enriching their batches outside the source (pool workers, worker nodes).
+    """
+    return {name: config.get('enrichment') for name, (_, _, config) in discover(config_dir).items()}
+
+
+def load_sources(config_dir, queue):
+    """
+    Instantiates the enabled sources found in config_dir. Disabled sources
+    are never imported.
+    """
+    sources = {}
+    for name, (class_path, config_path, config) in discover(config_dir).items():
+        if not config.get('enabled', True):
+            logging.info(f"Data source {name} is disabled")
+            continue
+        sources[name] = load_class(class_path)(config_path=config_path, queue=queue)
+    return sources
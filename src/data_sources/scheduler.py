@@ -0,0 +1,89 @@
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from utils.metrics import METRICS
+
+
+class Scheduler:
+    """
+    Runs data source polls on a bounded worker pool. Every source is in a
+    heap keyed by its next due time; a source is rescheduled when its poll
+    finishes, so polls of one source never overlap and a slow poll delays
+    only that source.
+    """
+
+    def __init__(self, sources, max_workers=4, stall_seconds=None):
+        self.sources = sources
+        self.max_workers = max_workers
+        self.stall_seconds = stall_seconds
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = 0
+        self._stopped = False
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="source")
+        now = time.monotonic()
+        with self._condition:
+            for name, source in self.sources.items():
+                self._push(now + random.uniform(0, getattr(source, 'jitter', 0)), name)
+                if self.stall_seconds is not None:
+                    # A source that polls rarely is not stalled between polls
+                    METRICS.expect_progress(f'source:{name}', self.stall_seconds + source.poll_interval + source.jitter)
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+        logging.info(f"Scheduling {len(self.sources)} data sources on {self.max_workers} workers")
+        return self
+
+    def stop(self, wait=False):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def idle(self):
+        """True when no poll is running or scheduled."""
+        with self._condition:
+            return not self._heap and not self._running
+
+    def _push(self, due, name):
+        heapq.heappush(self._heap, (due, next(self._sequence), name))
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, name = heapq.heappop(self._heap)
+                self._running += 1
+                # Under the lock, so stop() cannot shut the executor down in between
+                self._executor.submit(self._poll, name)
+
+    def _poll(self, name):
+        source = self.sources[name]
+        started = time.monotonic()
+        try:
+            source.poll()
+        except Exception as e:
+            METRICS.inc('fetch_errors_total', source=name)
+            logging.error(f"Poll of {name} failed: {e}")
+        finally:
+            finished = time.monotonic()
+            METRICS.inc('polls_total', source=name)
+            METRICS.observe('poll_seconds', finished - started, source=name)
+            with self._condition:
+                self._running -= 1
+                if source.poll_interval > 0:
+                    self._push(finished + source.poll_interval + random.uniform(0, source.jitter), name)
+                self._condition.notify_all()
@@ -1,25 +1,104 @@
 import logging
 import requests
-import re
-from datetime import datetime
 from multiprocessing import Queue
 import json
+import numpy as np
 from translators.space_weather_translator import SpaceWeatherTranslator
-import time
-from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from data_sources.base import DataSource
+
+# A data line starts with "YYYY MM DD  HHMM", which sorts like the times
+TIME_KEY_WIDTH = 16
+# Fields of a data line: date and time, Julian day, seconds of the day,
+# status, Bx, By, Bz, Bt, latitude and longitude
+FIELDS = 13
+
+
+def _to_floats(rows):
+    """Rows of numeric strings as an array, with the rows that are not numbers all NaN."""
+    try:
+        return np.array(rows, dtype=float)
+    except ValueError:
+        values = np.full((len(rows), FIELDS), np.nan)
+        for index, row in enumerate(rows):
+            try:
+                values[index] = [float(field) for field in row]
+            except ValueError:
+                pass
+        return values
+
+
+def parse_ace_lines(lines):
+    """
+    Decodes data lines of the ACE magnetometer file a column at a time.
+
+    Returns:
+        tuple: (records, time keys of the lines with a valid time, number of invalid lines).
+    """
+    rows, row_keys = [], []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= FIELDS:
+            rows.append(fields[:FIELDS])
+            row_keys.append(line[:TIME_KEY_WIDTH])
+    if not rows:
+        return [], [], len(lines)
+    values = _to_floats(rows)
+    year, month, day, hhmm = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+    hours, minutes = np.floor_divide(hhmm, 100), np.mod(hhmm, 100)
+    timed = ((month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+             & (hours < 24) & (minutes < 60) & (np.mod(values[:, :4], 1) == 0).all(axis=1))
+    # Days that do not exist in their month (e.g. 02 30) roll over into the next
+    months = np.where(timed, (year - 1970) * 12 + month - 1, 0).astype(np.int64).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.where(timed, day - 1, 0).astype(np.int64).astype('timedelta64[D]')
+    timed &= dates.astype('datetime64[M]') == months
+    times = dates.astype('datetime64[s]') + np.where(timed, hours * 3600 + minutes * 60, 0).astype(np.int64).astype('timedelta64[s]')
+
+    latitude = values[:, 11]
+    longitude = values[:, 12] - 180
+    valid = timed & (latitude >= -90) & (latitude <= 90) & (longitude >= -180) & (longitude <= 180)
+
+    keys = [key for key, ok in zip(row_keys, timed) if ok]
+    timestamps = np.datetime_as_string(times[valid], unit='s').tolist()
+    status = values[valid, 6].astype(int).tolist()
+    columns = [values[valid, column].tolist() for column in (7, 8, 9, 10)]
+    latitudes, longitudes = latitude[valid].tolist(), longitude[valid].tolist()
+    records = [
+        {
+            "time": time,
+            "status": status[index],
+            "bx": columns[0][index],
+            "by": columns[1][index],
+            "bz": columns[2][index],
+            "bt": columns[3][index],
+            "latitude": latitudes[index],
+            "longitude": longitudes[index],
+            "location": f"{latitudes[index]},{longitudes[index]}"
+        }
+        for index, time in enumerate(timestamps)
+    ]
+    return records, keys, len(lines) - len(records)
+
+
+class SpaceWeatherDataSource(DataSource):
+    name = 'space_weather'
 
-class SpaceWeatherDataSource:
     def __init__(self, config_path, queue: Queue):
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
+        self.load_schedule(config)
         self.url = config['url']
         self.queue = queue
         self.translator = SpaceWeatherTranslator()
-        self.solar_system_influence = SolarSystemInfluence() 
+        # Time key of the newest line parsed so far
+        self.last_time_key = ''
         logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
     def fetch_data(self):
-        response = requests.get(self.url)
+        with METRICS.timer('fetch_seconds', source='space_weather'):
+            response = requests.get(self.url)
+        METRICS.inc('fetch_bytes_total', len(response.content), source='space_weather')
         if response.status_code == 200:
             try:
                 return response.json()
@@ -29,65 +108,39 @@ class SpaceWeatherDataSource:
             raise Exception(f"Failed to fetch space weather data: {response.status_code}")
 
     def parse_data(self, data):
-        lines = data.splitlines()
-        for line in lines:
-            if line.startswith("#") or line.startswith(":") or not line.strip():
-                continue
-            try:
-                record = self.decode_space_weather_line(line)
-                translated_data = self.translator.translate(record)
-                # Set light_intensity
-
-                light_intensity = self.solar_system_influence.get_light_intensity_at_location(translated_data)
-                
-                translated_data["light_intensity"] = float(light_intensity)  # Ensure float
-
-                logging.debug(f"Enriched record: {translated_data}")
-
-                # Add gravitational influence enrichment
-                influence_data = self.solar_system_influence.get_influence_at_location(translated_data)
-                translated_data.update(influence_data)
-
-                self.queue.put(translated_data)
-            except ValueError as ve:
-                logging.debug(f"Skipping line due to invalid data: {line}")
-                logging.debug(f"Exception: {ve}")
+        """
+        Emits the lines of the ACE file that are newer than the last poll's.
+        The file is a rolling window of one-minute lines in time order, so
+        lines already emitted are skipped by comparing their leading
+        "YYYY MM DD  HHMM" with the last one seen, before any parsing.
+        """
+        last_key = self.last_time_key
+        lines = []
+        for line in data.splitlines():
+            if line[:TIME_KEY_WIDTH] > last_key and line[:1].isdigit():
+                lines.append(line)
+        if not lines:
+            return
+        records, keys, dropped = parse_ace_lines(lines)
+        if keys:
+            self.last_time_key = max(keys)
+        if dropped:
+            METRICS.inc('records_dropped_total', dropped, source='space_weather', reason='ValueError')
+            logging.debug(f"Skipped {dropped} invalid space weather lines")
+        with PROFILER.span('translate', 'space_weather'):
+            batch_records = [self.translator.translate(record) for record in records]
+        METRICS.inc('records_parsed_total', len(batch_records), source='space_weather')
+        self.emit(batch_records)
 
-    def decode_space_weather_line(self, line):
-        line = re.sub(r'[ \t]+', ' ', line.strip())
-        parts = line.split(' ')
-        if len(parts) < 13:
-            raise ValueError(f"Insufficient parts or invalid data: {line}")
-
-        time_str = f"{parts[0]}-{parts[1]}-{parts[2]} {parts[3][:2]}:{parts[3][2:]}:00"
-        time_iso = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").isoformat()
-        latitude = float(parts[11])
-        longitude = float(parts[12]) - 180
-        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
-            raise ValueError(f"Invalid latitude or longitude: {latitude}, {longitude}")
-        if latitude == -999.9 or longitude == -999.9:
-            raise ValueError(f"Invalid latitude or longitude: {latitude}, {longitude}")
-
-        record = {
-            "time": time_iso,
-            "status": int(parts[6]),
-            "bx": float(parts[7]),
-            "by": float(parts[8]),
-            "bz": float(parts[9]),
-            "bt": float(parts[10]),
-            "latitude": latitude,
-            "longitude": longitude,
-            "location": f"{latitude},{longitude}"
-        }
-        return record
-
-    def run(self):
-        while True:
-            try:
+    def poll(self):
+        try:
+            with PROFILER.span('fetch', 'space_weather'):
                 raw_data = self.fetch_data()
-                logging.info("Space weather data fetched successfully.")
-                if raw_data:
+            logging.info("Space weather data fetched successfully.")
+            if raw_data:
+                with PROFILER.span('parse', 'space_weather'):
                     self.parse_data(raw_data)
-            except Exception as e:
-                logging.info(f"Error fetching space weather data: {e}")
-            time.sleep(60)  # Wait for 60 seconds before fetching data again
\ No newline at end of file
+            METRICS.mark_progress('source:space_weather')
+        except Exception as e:
+            METRICS.inc('fetch_errors_total', source='space_weather')
+            logging.info(f"Error fetching space weather data: {e}")
\ No newline at end of file
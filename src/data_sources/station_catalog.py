@@ -0,0 +1,188 @@
+"""
+The Meteostat station catalog as arrays, with a grid index for spatial
+queries.
+
+The catalog keeps one array per field (ids, latitudes, longitudes,
+elevations, names and countries, the strings interned) instead of the
+nested dicts of stations/lite.json.gz, and saves them to an .npz file so a
+poll loads the cache instead of downloading and parsing the JSON. Stations
+are bucketed into cells of `cell_degrees`, sorted by cell, so a bounding
+box or radius query only looks at the stations of the cells it overlaps.
+"""
+import math
+import os
+import sys
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_DEGREES = 1.0
+ARRAYS = ('ids', 'latitudes', 'longitudes', 'elevations', 'names', 'countries')
+
+
+class Station:
+    """The fields of one station that records are formatted with."""
+    __slots__ = ('id', 'latitude', 'longitude', 'elevation', 'name', 'country', 'location')
+
+    def __init__(self, id, latitude, longitude, elevation, name, country):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elevation = elevation
+        self.name = name
+        self.country = country
+        self.location = f"{latitude},{longitude}"
+
+    def __repr__(self):
+        return f"Station({self.id!r}, {self.name!r}, {self.location})"
+
+
+def station_name(names):
+    """The English name of a station, else its first one."""
+    if not names:
+        return ''
+    return names.get('en') or next(iter(names.values()))
+
+
+def distances_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points."""
+    lat1, lat2 = math.radians(latitude), np.radians(latitudes)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin(np.radians(longitudes - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationCatalog:
+    def __init__(self, ids, latitudes, longitudes, elevations, names, countries, cell_degrees=CELL_DEGREES):
+        self.ids = [sys.intern(str(station_id)) for station_id in ids]
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        # NaN where the elevation is unknown
+        self.elevations = np.asarray(elevations, dtype=float)
+        self.names = [sys.intern(str(name)) for name in names]
+        self.countries = [sys.intern(str(country)) for country in countries]
+        self._rows = {station_id: row for row, station_id in enumerate(self.ids)}
+        self._build_index(cell_degrees)
+
+    @classmethod
+    def from_stations(cls, stations, cell_degrees=CELL_DEGREES):
+        """Builds the catalog from the station dicts of stations/lite.json.gz, skipping stations without a location."""
+        fields = []
+        for station in stations:
+            location = station.get('location') or {}
+            if location.get('latitude') is None or location.get('longitude') is None:
+                continue
+            elevation = location.get('elevation')
+            fields.append((station['id'], location['latitude'], location['longitude'],
+                           np.nan if elevation is None else elevation,
+                           station_name(station.get('name')), station.get('country') or ''))
+        columns = list(zip(*fields)) or [()] * len(ARRAYS)
+        return cls(*columns, cell_degrees=cell_degrees)
+
+    @classmethod
+    def load(cls, path, cell_degrees=CELL_DEGREES):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(*(arrays[name].tolist() for name in ARRAYS), cell_degrees=cell_degrees)
+
+    def save(self, path):
+        """Writes the arrays to an .npz file; `path` is replaced only once the file is complete."""
+        temporary = path + '.tmp.npz'
+        np.savez(temporary, ids=np.array(self.ids, dtype=str), latitudes=self.latitudes,
+                 longitudes=self.longitudes, elevations=self.elevations,
+                 names=np.array(self.names, dtype=str), countries=np.array(self.countries, dtype=str))
+        os.replace(temporary, path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build_index(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self._index_rows = int(math.ceil(180.0 / cell_degrees))
+        self._index_columns = int(math.ceil(360.0 / cell_degrees))
+        rows, columns = self._cells(self.latitudes, self.longitudes)
+        keys = rows * self._index_columns + columns
+        self._order = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[self._order]
+
+    def _cells(self, latitudes, longitudes):
+        rows = np.clip(np.floor((np.asarray(latitudes) + 90.0) / self.cell_degrees), 0, self._index_rows - 1)
+        columns = np.clip(np.floor((np.asarray(longitudes) + 180.0) / self.cell_degrees), 0, self._index_columns - 1)
+        return rows.astype(np.int64), columns.astype(np.int64)
+
+    def row(self, station_id):
+        """Position of a station in the arrays, or None."""
+        return self._rows.get(station_id)
+
+    def station(self, row):
+        elevation = self.elevations[row]
+        return Station(self.ids[row], float(self.latitudes[row]), float(self.longitudes[row]),
+                       None if np.isnan(elevation) else float(elevation), self.names[row], self.countries[row] or None)
+
+    def get(self, station_id):
+        """The station with this id, or None."""
+        row = self.row(station_id)
+        return None if row is None else self.station(row)
+
+    def stations(self, rows=None):
+        """Stations at the given rows (all of them by default), in that order."""
+        if rows is None:
+            rows = range(len(self))
+        return [self.station(int(row)) for row in rows]
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Rows of the stations in the cells a box overlaps."""
+        (first_row, last_row), (first_column, last_column) = self._cells([min_lat, max_lat], [min_lon, max_lon])
+        parts = []
+        for row in range(first_row, last_row + 1):
+            start = np.searchsorted(self._sorted_keys, row * self._index_columns + first_column, side='left')
+            end = np.searchsorted(self._sorted_keys, row * self._index_columns + last_column, side='right')
+            parts.append(self._order[start:end])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Rows of the stations inside a bounding box, in catalog order. A box
+        with min_lon > max_lon crosses the antimeridian.
+        """
+        if min_lat > max_lat:
+            raise ValueError("Bounding box must have min_lat <= max_lat")
+        if min_lon > max_lon:
+            return np.union1d(self.within_bbox(min_lat, min_lon, max_lat, 180.0),
+                              self.within_bbox(min_lat, -180.0, max_lat, max_lon))
+        rows = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        latitudes, longitudes = self.latitudes[rows], self.longitudes[rows]
+        inside = (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+        return np.sort(rows[inside])
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Rows of the stations within radius_km of a point, in catalog order."""
+        angle = radius_km / EARTH_RADIUS_KM
+        min_lat, max_lat = latitude - math.degrees(angle), latitude + math.degrees(angle)
+        if min_lat <= -90.0 or max_lat >= 90.0 or angle >= math.pi / 2:
+            # The circle reaches a pole: every longitude
+            rows = self.within_bbox(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)
+        else:
+            # Longitude half-width of the bounding box of a spherical cap
+            spread = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+            west, east = longitude - spread, longitude + spread
+            if spread >= 90.0:
+                west, east = -180.0, 180.0
+            # Past the antimeridian the box wraps around (west > east)
+            rows = self.within_bbox(min_lat, west + 360.0 if west < -180.0 else west,
+                                    max_lat, east - 360.0 if east > 180.0 else east)
+        close = distances_km(latitude, longitude, self.latitudes[rows], self.longitudes[rows]) <= radius_km
+        return rows[close]
+
+    def nearest(self, latitude, longitude, count):
+        """Rows of the `count` stations closest to a point, closest first."""
+        count = min(int(count), len(self))
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        # Widen the search until it holds enough stations; all of them lie within the radius
+        radius = 100.0
+        while True:
+            rows = self.within_radius(latitude, longitude, radius)
+            if len(rows) >= count or radius >= math.pi * EARTH_RADIUS_KM:
+                break
+            radius *= 2
+        distances = distances_km(latitude, longitude, self.latitudes[rows], self.longitudes[rows])
+        return rows[np.argsort(distances, kind='stable')[:count]]
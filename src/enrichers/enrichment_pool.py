@@ -0,0 +1,172 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+
+# Workers are spawned rather than forked: the parent runs scheduler, flush and
+# metrics threads, and a fork only copies the calling thread
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+def enrichment_worker(tasks, results, done, plans=None, reports=None, current=None):
+    """
+    Worker process loop: enriches (batch id, RecordBatch) tasks with the plan
+    of their source, with its own enrichers (and ephemeris), and puts the
+    batches on `results`. `current` holds the id of the batch being enriched,
+    so the parent can account for it if the process dies. After every batch
+    the metrics it recorded (enrichment time, cache hits and misses, ...) are
+    put on `reports` for the parent's registry.
+    """
+    from enrichers.enrichment_stage import EnrichmentStage
+    stage = EnrichmentStage(plans)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch_id, batch = task
+        if current is not None:
+            current.value = batch_id
+        try:
+            stage.enrich_batch(batch)
+            results.put(batch)
+        except Exception as e:
+            METRICS.inc('records_dropped_total', batch.count_valid(), source=batch.source, reason='enrichment_error')
+            logging.error(f"Enrichment worker failed on a {batch.source} batch, dropped {batch.count_valid()} records: {e}")
+        finally:
+            with done.get_lock():
+                done.value += 1
+                if current is not None:
+                    current.value = 0
+            if reports is not None:
+                reports.put((batch_id, METRICS.take_deltas()))
+
+
+class EnrichmentPool:
+    """
+    Shards enrichment over N processes so it is not limited to one core by
+    the GIL. Sources submit translated, unenriched records; they are cut into
+    RecordBatches of batch_size rows, enriched by whichever worker is free and
+    put on the indexer queue. Order across batches is not preserved.
+
+    A worker that dies (e.g. killed for memory) is replaced. The batch it was
+    enriching is counted as done and its records in records_dropped_total, so
+    pending() still drains.
+
+    The output queue must come from CONTEXT. plans maps source names to
+    their enrichment plans (see enrichers/enrichment_stage.py).
+    """
+
+    def __init__(self, output_queue, workers=2, batch_size=256, backlog=4, plans=None):
+        self.output_queue = output_queue
+        self.plans = plans
+        self.workers = workers
+        self.batch_size = batch_size
+        # Bounded, so sources block instead of piling up batches when the workers fall behind
+        self.tasks = CONTEXT.Queue(maxsize=workers * backlog)
+        self._done = CONTEXT.Value('l', 0)
+        self._submitted = 0
+        self._submitted_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # Batch id -> (source, records) until the batch is reported done
+        self._in_flight = {}
+        self._processes = []
+        # Per worker slot, the id of the batch it is enriching (0 when idle)
+        self._current = []
+        # Metrics the workers recorded, merged into this process's registry
+        self.reports = CONTEXT.Queue()
+        self._reporter = None
+        self._stopping = False
+        self.check_interval = 1.0
+        METRICS.register_collector(self.collect)
+
+    def _start_worker(self, slot):
+        process = CONTEXT.Process(target=enrichment_worker,
+                                  args=(self.tasks, self.output_queue, self._done, self.plans, self.reports,
+                                        self._current[slot]),
+                                  name=f"enrichment-{slot}", daemon=True)
+        process.start()
+        return process
+
+    def start(self):
+        self._stopping = False
+        self._current = [CONTEXT.Value('q', 0) for _ in range(self.workers)]
+        self._processes = [self._start_worker(slot) for slot in range(self.workers)]
+        self._reporter = threading.Thread(target=self._merge_reports, name="enrichment-metrics", daemon=True)
+        self._reporter.start()
+        logging.info(f"Started {self.workers} enrichment workers")
+        return self
+
+    def submit(self, records, source):
+        """
+        Queues translated records (dicts) of one source for enrichment.
+
+        Returns:
+            int: Number of records submitted.
+        """
+        for start in range(0, len(records), self.batch_size):
+            batch = RecordBatch.from_records(records[start:start + self.batch_size], source=source)
+            with self._submitted_lock:
+                self._submitted += 1
+                batch_id = next(self._ids)
+                self._in_flight[batch_id] = (source, len(batch))
+            self.tasks.put((batch_id, batch))
+        return len(records)
+
+    def _merge_reports(self):
+        while True:
+            try:
+                report = self.reports.get(timeout=self.check_interval)
+            except queue.Empty:
+                self._replace_dead_workers()
+                continue
+            if report is None:
+                return
+            batch_id, deltas = report
+            with self._submitted_lock:
+                self._in_flight.pop(batch_id, None)
+            METRICS.merge(deltas)
+            self._replace_dead_workers()
+
+    def _replace_dead_workers(self):
+        for slot, process in enumerate(self._processes):
+            if self._stopping or process.exitcode is None:
+                continue
+            current = self._current[slot]
+            with self._done.get_lock():
+                batch_id, current.value = current.value, 0
+                if batch_id:
+                    self._done.value += 1
+            with self._submitted_lock:
+                source, count = self._in_flight.pop(batch_id, (None, 0))
+            if source is not None:
+                METRICS.inc('records_dropped_total', count, source=source, reason='enrichment_worker_died')
+            METRICS.inc('enrichment_worker_restarts_total')
+            logging.error(f"Enrichment worker {process.name} died with exit code {process.exitcode}, "
+                          f"dropped {count} records it was enriching; starting a new one")
+            self._processes[slot] = self._start_worker(slot)
+
+    def pending(self):
+        """Batches submitted but not yet enriched."""
+        return self._submitted - self._done.value
+
+    def collect(self):
+        return [('enrichment_pending_batches', {}, self.pending()),
+                ('enrichment_workers_alive', {}, sum(process.is_alive() for process in self._processes))]
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        for _ in self._processes:
+            self.tasks.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if self._reporter is not None:
+            # After the workers' last reports
+            self.reports.put(None)
+            self._reporter.join(timeout)
+            self._reporter = None
+        self._processes = []
@@ -0,0 +1,125 @@
+"""
+Per-source enrichment plans, and the stage that applies them to batches.
+
+A source's config file declares what its records are enriched with under
+"enrichment", e.g. for hourly backfill:
+
+    "enrichment": {
+        "light_intensity": {"mode": "fast"},
+        "influence": {"mode": "grid", "grid_degrees": 5, "bucket_seconds": 3600,
+                      "bodies": ["Sun", "Moon"], "conjunctions": false}
+    }
+
+light_intensity: false or influence: false skips that enrichment; a missing
+plan or key enriches as before the plans existed (light intensity, all ten
+bodies and the conjunction check, in the LIGHT_INTENSITY_MODE and
+INFLUENCE_MODE defaults). See SolarSystemInfluence for the modes.
+"""
+import json
+import logging
+from enrichers.solar_system_influence import INFLUENCE_MODES, LIGHT_MODES, SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from utils.record_batch import RecordBatch
+from utils.validation import Validator
+
+LIGHT_INTENSITY_KEYS = ('mode',)
+INFLUENCE_KEYS = ('mode', 'grid_degrees', 'bucket_seconds', 'grid_cache_size', 'bodies', 'conjunctions')
+
+
+def _step(value, keys, name):
+    """A plan entry as a dict of settings, or None when the enrichment is off."""
+    if value is None or value is True:
+        return {}
+    if value is False:
+        return None
+    if not isinstance(value, dict):
+        raise ValueError(f"Enrichment {name} must be true, false or an object, got {value!r}")
+    unknown = sorted(set(value) - set(keys))
+    if unknown:
+        raise ValueError(f"Unknown {name} settings {', '.join(unknown)}, expected some of {', '.join(keys)}")
+    return dict(value)
+
+
+def resolve_plan(plan):
+    """
+    Validates a plan from a source config.
+
+    Returns:
+        dict: {'light_intensity': settings or None, 'influence': settings or None}.
+    """
+    plan = plan or {}
+    unknown = sorted(set(plan) - {'light_intensity', 'influence'})
+    if unknown:
+        raise ValueError(f"Unknown enrichments {', '.join(unknown)}, expected light_intensity and/or influence")
+    resolved = {
+        'light_intensity': _step(plan.get('light_intensity'), LIGHT_INTENSITY_KEYS, 'light_intensity'),
+        'influence': _step(plan.get('influence'), INFLUENCE_KEYS, 'influence'),
+    }
+    light = resolved['light_intensity'] or {}
+    if light.get('mode') is not None and light['mode'] not in LIGHT_MODES:
+        raise ValueError(f"Unknown light intensity mode {light['mode']}, expected one of {', '.join(LIGHT_MODES)}")
+    influence = resolved['influence'] or {}
+    if influence.get('mode') is not None and influence['mode'] not in INFLUENCE_MODES:
+        raise ValueError(f"Unknown influence mode {influence['mode']}, expected one of {', '.join(INFLUENCE_MODES)}")
+    if influence.get('bodies') is not None:
+        SolarSystemInfluence().body_indices(influence['bodies'])
+    return resolved
+
+
+class EnrichmentStage:
+    """
+    Validates RecordBatches and enriches them according to the plan of
+    their source. Sources with the same modes and precision share one
+    SolarSystemInfluence (and its caches); it is created on first use.
+    """
+
+    def __init__(self, plans=None):
+        self.plans = {source: resolve_plan(plan) for source, plan in (plans or {}).items()}
+        self._default_plan = resolve_plan(None)
+        self._enrichers = {}
+        self.validator = Validator()
+
+    def plan(self, source):
+        return self.plans.get(source, self._default_plan)
+
+    def enricher(self, source):
+        plan = self.plan(source)
+        influence = plan['influence'] or {}
+        settings = {
+            'light_mode': (plan['light_intensity'] or {}).get('mode'),
+            'influence_mode': influence.get('mode'),
+            'grid_degrees': influence.get('grid_degrees'),
+            'grid_bucket_seconds': influence.get('bucket_seconds'),
+            'grid_cache_size': influence.get('grid_cache_size'),
+        }
+        key = json.dumps(settings, sort_keys=True)
+        enricher = self._enrichers.get(key)
+        if enricher is None:
+            enricher = self._enrichers[key] = SolarSystemInfluence(**settings)
+            logging.info(f"Enricher for {source}: {settings}")
+        return enricher
+
+    def enrich_batch(self, batch):
+        """
+        Validates a batch, dropping its invalid rows (see utils/validation.py),
+        then enriches it in place with its source's plan, and returns it.
+        """
+        with PROFILER.span('validate', batch.source):
+            self.validator.validate(batch)
+        if not len(batch):
+            return batch
+        plan = self.plan(batch.source)
+        influence = plan['influence'] or {}
+        with METRICS.timer('enrich_batch_seconds', source=batch.source), PROFILER.span('enrich', batch.source):
+            self.enricher(batch.source).enrich_batch(
+                batch,
+                light_intensity=plan['light_intensity'] is not None,
+                influence=plan['influence'] is not None,
+                bodies=influence.get('bodies'),
+                conjunctions=influence.get('conjunctions', True))
+        return batch
+
+    def enrich(self, records, source):
+        """Enriches translated records (dicts) of one source as a RecordBatch."""
+        return self.enrich_batch(RecordBatch.from_records(records, source=source))
@@ -0,0 +1,124 @@
+"""
+Precomputed geocentric body positions, so enrichment reads them from a
+memory-mapped table instead of evaluating the SPK ephemeris per record.
+
+    PYTHONPATH=src python -m enrichers.ephemeris_table --start 2024-01-01 --end 2025-01-01 --step 60 --output ephemeris.tbl
+
+The file is a small JSON header followed by float64 positions in km,
+shaped (times, bodies, 3), of every body in SolarSystemInfluence.planet_names
+as seen from the Earth's centre (astrometric, ICRF axes). Opened tables are
+mapped read-only, so all processes enriching from the same file share one
+copy in the page cache. Positions between steps are interpolated linearly:
+at a 60 s step that is within MAX_POSITION_ERROR_KM of skyfield for every
+body, which tests/test_ephemeris_table.py checks.
+"""
+import argparse
+import json
+import logging
+import struct
+import numpy as np
+
+MAGIC = b'WLEPHEM1'
+# Magic, header length; the JSON header is padded so the positions are 8-byte aligned
+PREFIX = struct.Struct('<8sI')
+MAX_POSITION_ERROR_KM = 0.1
+SECONDS_PER_DAY = 86400
+
+
+def skyfield_times(ts, seconds):
+    """Skyfield times for seconds since 1970 UTC (POSIX time, without leap seconds)."""
+    seconds = np.asarray(seconds, dtype=float)
+    days = np.floor(seconds / SECONDS_PER_DAY)
+    return ts.utc(1970, 1, 1 + days, 0, 0, seconds - days * SECONDS_PER_DAY)
+
+
+def build_table(path, start, end, step=60, bodies=None, ephemeris='de421.bsp', chunk=1440):
+    """
+    Writes the positions of bodies (default: SolarSystemInfluence.planet_names)
+    from start to end (seconds since 1970 UTC, end included) every step seconds.
+
+    Returns:
+        EphemerisTable: The table, opened.
+    """
+    from skyfield.api import load
+    if bodies is None:
+        from enrichers.solar_system_influence import SolarSystemInfluence
+        bodies = SolarSystemInfluence().planet_names
+    ts = load.timescale()
+    planets = load(ephemeris)
+    earth = planets['earth']
+    count = int((end - start) // step) + 1
+    header = json.dumps({'start': start, 'step': step, 'count': count, 'bodies': list(bodies)}).encode()
+    header += b' ' * (-(PREFIX.size + len(header)) % 8)
+    with open(path, 'wb') as table_file:
+        table_file.write(PREFIX.pack(MAGIC, len(header)))
+        table_file.write(header)
+    positions = np.memmap(path, dtype='<f8', mode='r+', offset=PREFIX.size + len(header), shape=(count, len(bodies), 3))
+    for first in range(0, count, chunk):
+        last = min(first + chunk, count)
+        times = skyfield_times(ts, start + np.arange(first, last) * step)
+        origin = earth.at(times)
+        for index, body in enumerate(bodies):
+            positions[first:last, index] = origin.observe(planets[body]).position.km.T
+    positions.flush()
+    del positions
+    logging.info(f"Wrote {count} steps of {len(bodies)} bodies to {path}")
+    return EphemerisTable(path)
+
+
+class EphemerisTable:
+    """A table written by build_table(), memory-mapped read-only."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as table_file:
+            magic, length = PREFIX.unpack(table_file.read(PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an ephemeris table")
+            header = json.loads(table_file.read(length))
+        self.start = float(header['start'])
+        self.step = float(header['step'])
+        self.bodies = header['bodies']
+        self.end = self.start + (header['count'] - 1) * self.step
+        self.positions = np.memmap(path, dtype='<f8', mode='r', offset=PREFIX.size + length,
+                                   shape=(header['count'], len(self.bodies), 3))
+
+    def covers(self, seconds):
+        """Mask of the times (seconds since 1970 UTC) inside the table."""
+        seconds = np.asarray(seconds, dtype=float)
+        return (seconds >= self.start) & (seconds <= self.end)
+
+    def positions_at(self, seconds):
+        """
+        Geocentric positions in km at the given times, interpolated linearly.
+
+        Returns:
+            numpy.ndarray: (len(seconds), bodies, 3).
+
+        Raises:
+            ValueError: When a time is outside the table.
+        """
+        seconds = np.asarray(seconds, dtype=float)
+        if not self.covers(seconds).all():
+            raise ValueError(f"Times outside the ephemeris table {self.path}")
+        offset = (seconds - self.start) / self.step
+        index = np.minimum(np.floor(offset).astype(np.int64), len(self.positions) - 2)
+        fraction = (offset - index)[:, None, None]
+        return self.positions[index] * (1 - fraction) + self.positions[index + 1] * fraction
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build an ephemeris table for enrichment")
+    parser.add_argument('--start', required=True, help='First day, e.g. 2024-01-01')
+    parser.add_argument('--end', required=True, help='Last time, e.g. 2025-01-01')
+    parser.add_argument('--step', type=int, default=60, help='Seconds between positions')
+    parser.add_argument('--ephemeris', default='de421.bsp')
+    parser.add_argument('--output', default='ephemeris.tbl')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    start, end = (float(np.datetime64(value, 's').astype(np.int64)) for value in (args.start, args.end))
+    build_table(args.output, start, end, args.step, ephemeris=args.ephemeris)
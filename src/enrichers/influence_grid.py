@@ -0,0 +1,74 @@
+"""
+Influence fields of one time bucket on a global latitude/longitude grid.
+
+The per-body influence vectors vary smoothly with the observer's position,
+so SolarSystemInfluence computes them once per bucket at the grid nodes and
+interpolates them bilinearly for every record. Records are first rotated
+with the Earth to the bucket's time (their longitude shifted by the
+sidereal rotation in between), so only the slow motion of the bodies within
+a bucket is not accounted for. The spatial interpolation error is estimated
+when a grid is built, by evaluating the fields exactly at a sample of cell
+centres, where bilinear interpolation is worst.
+"""
+import numpy as np
+
+# Degrees the Earth turns per second relative to the stars
+SIDEREAL_DEGREES_PER_SECOND = 360.98564736629 / 86400.0
+
+
+def grid_nodes(degrees):
+    """Latitudes from -90 to 90 and longitudes from -180 to 180 (both included) every `degrees`."""
+    latitudes = np.linspace(-90.0, 90.0, int(round(180.0 / degrees)) + 1)
+    longitudes = np.linspace(-180.0, 180.0, int(round(360.0 / degrees)) + 1)
+    return latitudes, longitudes
+
+
+def cell_centres(degrees, count, seed=0):
+    """A sample of `count` cell centres, as (latitudes, longitudes)."""
+    latitudes, longitudes = grid_nodes(degrees)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(latitudes) - 1, count)
+    columns = rng.integers(0, len(longitudes) - 1, count)
+    return (latitudes[rows] + latitudes[rows + 1]) / 2, (longitudes[columns] + longitudes[columns + 1]) / 2
+
+
+class InfluenceGrid:
+    """
+    Influence vectors (latitudes, longitudes, bodies, 3) and pairwise body
+    separations (latitudes, longitudes, pairs) at the nodes of a grid, for
+    the time `seconds` (since 1970 UTC).
+    """
+
+    def __init__(self, seconds, degrees, vectors, separations, error=None):
+        self.seconds = seconds
+        self.degrees = degrees
+        self.latitudes, self.longitudes = grid_nodes(degrees)
+        self.vectors = vectors
+        self.separations = separations
+        # Largest relative error of an interpolated influence vector at the sampled cell centres
+        self.error = error
+
+    def interpolate(self, latitudes, longitudes, seconds):
+        """
+        Interpolated influence vectors (n, bodies, 3) and separations (n, pairs)
+        at the given positions and times.
+        """
+        latitudes = np.clip(np.asarray(latitudes, dtype=float), -90.0, 90.0)
+        rotated = np.asarray(longitudes, dtype=float) + (np.asarray(seconds, dtype=float) - self.seconds) * SIDEREAL_DEGREES_PER_SECOND
+        longitudes = (rotated + 180.0) % 360.0 - 180.0
+
+        row_offset = (latitudes + 90.0) / (self.latitudes[1] - self.latitudes[0])
+        column_offset = (longitudes + 180.0) / (self.longitudes[1] - self.longitudes[0])
+        rows = np.minimum(np.floor(row_offset).astype(np.int64), len(self.latitudes) - 2)
+        columns = np.minimum(np.floor(column_offset).astype(np.int64), len(self.longitudes) - 2)
+        row_fraction = row_offset - rows
+        column_fraction = column_offset - columns
+
+        def bilinear(field):
+            shape = (-1,) + (1,) * (field.ndim - 2)
+            v = row_fraction.reshape(shape)
+            u = column_fraction.reshape(shape)
+            return ((1 - v) * (1 - u) * field[rows, columns] + (1 - v) * u * field[rows, columns + 1]
+                    + v * (1 - u) * field[rows + 1, columns] + v * u * field[rows + 1, columns + 1])
+
+        return bilinear(self.vectors), bilinear(self.separations)
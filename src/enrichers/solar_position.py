@@ -0,0 +1,94 @@
+"""
+Vectorized analytic solar position (the NOAA solar calculator equations,
+after Meeus) for arrays of latitude, longitude and time.
+
+Against skyfield's apparent altitude (de421, no refraction) the altitude
+error stays below MAX_ALTITUDE_ERROR_DEGREES for 1950-2050, so light
+intensity (altitude / 90) is within MAX_ALTITUDE_ERROR_DEGREES / 90; the
+test in tests/test_solar_position.py enforces both.
+"""
+import numpy as np
+
+MAX_ALTITUDE_ERROR_DEGREES = 0.1
+SECONDS_PER_DAY = 86400.0
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+J2000_JULIAN_DAY = 2451545.0
+
+
+def epoch_seconds(timestamps):
+    """
+    Converts ISO 8601 strings (a trailing Z or UTC offset is ignored, as the
+    skyfield path does), datetimes or datetime64 values to float seconds
+    since 1970 UTC, NaN where a value cannot be parsed.
+    """
+    values = np.asarray(timestamps)
+    if values.dtype.kind == 'M':
+        parsed = values.astype('datetime64[s]')
+    else:
+        texts = [value[:19] if isinstance(value, str) else value for value in values.tolist()]
+        try:
+            parsed = np.array(texts, dtype='datetime64[s]')
+        except (ValueError, TypeError):
+            parsed = np.array([_parse_one(value) for value in texts], dtype='datetime64[s]')
+    seconds = parsed.astype(np.int64).astype(float)
+    seconds[np.isnat(parsed)] = np.nan
+    return seconds
+
+
+def _parse_one(value):
+    try:
+        return np.datetime64(value, 's')
+    except (ValueError, TypeError):
+        return np.datetime64('NaT')
+
+
+def solar_altitude(latitudes, longitudes, seconds):
+    """
+    Geometric solar altitude in degrees (no atmospheric refraction).
+
+    Args:
+        latitudes, longitudes: Degrees, arrays or scalars.
+        seconds: Seconds since 1970 UTC, see epoch_seconds().
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.asarray(longitudes, dtype=float)
+    seconds = np.asarray(seconds, dtype=float)
+
+    julian_century = (seconds / SECONDS_PER_DAY + UNIX_EPOCH_JULIAN_DAY - J2000_JULIAN_DAY) / 36525.0
+    t = julian_century
+    mean_longitude = np.radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360.0)
+    mean_anomaly = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    center = (np.sin(mean_anomaly) * (1.914602 - t * (0.004817 + 0.000014 * t))
+              + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * t)
+              + np.sin(3 * mean_anomaly) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_longitude = np.radians(np.degrees(mean_longitude) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23.0 + (26.0 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60.0) / 60.0
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude))
+
+    y = np.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * np.degrees(
+        y * np.sin(2 * mean_longitude)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_longitude)
+        - 0.5 * y * y * np.sin(4 * mean_longitude)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly))
+
+    minutes = (seconds % SECONDS_PER_DAY) / 60.0
+    true_solar_minutes = (minutes + equation_of_time + 4.0 * longitudes) % 1440.0
+    hour_angle = np.radians(true_solar_minutes / 4.0 - 180.0)
+    cos_zenith = (np.sin(latitudes) * np.sin(declination)
+                  + np.cos(latitudes) * np.cos(declination) * np.cos(hour_angle))
+    return 90.0 - np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
+
+
+def light_intensity(latitudes, longitudes, timestamps):
+    """
+    Light intensity from 0.0 (sun below the horizon) to 1.0 (sun at the
+    zenith), as altitude / 90. Rows with a missing position or time get 0.0.
+    """
+    altitude = solar_altitude(latitudes, longitudes, epoch_seconds(timestamps))
+    intensity = np.clip(altitude / 90.0, 0.0, 1.0)
+    return np.where(np.isnan(intensity), 0.0, intensity)
@@ -1,15 +1,56 @@
+from __future__ import annotations
+
 import numpy as np
-import matplotlib.pyplot as plt
-from shapely.geometry import Polygon, Point, mapping
 from datetime import datetime
-from skyfield.api import load, Topos, wgs84, load_constellation_map, load_constellation_names
-from skyfield.timelib import Time
+from typing import TYPE_CHECKING
 import json
 import logging
+import threading
+from collections import OrderedDict
+from config import Config
+from enrichers import solar_position
+from enrichers.ephemeris_table import EphemerisTable, skyfield_times
+from enrichers.influence_grid import InfluenceGrid, cell_centres, grid_nodes
+from utils.metrics import METRICS
+
+# skyfield, matplotlib and shapely are imported on first use, they dominate
+# the import time of every data source
+if TYPE_CHECKING:
+    from skyfield.api import Topos
+    from skyfield.timelib import Time
+
+# How light_intensity is computed: 'fast' uses the analytic solar position
+# (enrichers/solar_position.py), 'skyfield' the full ephemeris
+LIGHT_MODES = ('fast', 'skyfield')
+# How the influence fields are computed: 'exact' per record, 'grid' interpolated
+# from a global grid computed once per time bucket (enrichers/influence_grid.py),
+# 'batch' exactly once per distinct location and time bucket of a batch, shared
+# by the rows there
+INFLUENCE_MODES = ('exact', 'grid', 'batch')
+
 
 class SolarSystemInfluence:
     
-    def __init__(self, grid_size=100, field_size=1e7, levels=np.linspace(0, 1e-6, 10)):
+    def __init__(self, grid_size=100, field_size=1e7, levels=np.linspace(0, 1e-6, 10), light_mode=None,
+                 ephemeris_table=None, influence_mode=None, grid_degrees=None, grid_bucket_seconds=None,
+                 grid_cache_size=None):
+        light_mode = light_mode or Config.LIGHT_INTENSITY_MODE
+        if light_mode not in LIGHT_MODES:
+            raise ValueError(f"Unknown light intensity mode {light_mode}, expected one of {', '.join(LIGHT_MODES)}")
+        influence_mode = influence_mode or Config.INFLUENCE_MODE
+        if influence_mode not in INFLUENCE_MODES:
+            raise ValueError(f"Unknown influence mode {influence_mode}, expected one of {', '.join(INFLUENCE_MODES)}")
+        self.light_mode = light_mode
+        self.influence_mode = influence_mode
+        self.grid_degrees = grid_degrees or Config.INFLUENCE_GRID_DEGREES
+        self.grid_bucket_seconds = grid_bucket_seconds or Config.INFLUENCE_GRID_BUCKET_SECONDS
+        self.grid_error_samples = 64
+        # Least recently used grids are evicted beyond this, one 2.5 degree grid takes about 5.6 MB
+        self.grid_cache_size = grid_cache_size or Config.INFLUENCE_GRID_CACHE_SIZE
+        self._grids = OrderedDict()
+        # Precomputed positions (enrichers/ephemeris_table.py) for enrich_batch, instead of the SPK ephemeris
+        self.ephemeris_table_path = ephemeris_table if ephemeris_table is not None else Config.EPHEMERIS_TABLE
+        self._ephemeris_table = None
         self.grid_size = grid_size
         self.field_size = field_size
         self.levels = levels
@@ -38,16 +79,90 @@ class SolarSystemInfluence:
             'Sun', 'Mercury', 'Venus', 'Earth', 'Mars', 'Jupiter', 
             'Saturn', 'Uranus', 'Neptune', 'Moon'
         ]
-        self.planets = load('de421.bsp')
-        self.earth = self.planets['earth']
-        self.ts = load.timescale()
-        self.constellation_at = load_constellation_map()  # Load constellation boundaries
-        self.constellation_names = dict(load_constellation_names())  # Abbreviation to full name mapping
+        self._planets = None
+        self._earth = None
+        self._ts = None
+        self._constellation_at = None
+        self._constellation_names = None
+        self._load_lock = threading.Lock()
+        self.time_cache_size = 4096
+        self._time_cache = {}
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
-    def get_distances(self, time: datetime) -> list:
+    def _load_ephemeris(self):
+        with self._load_lock:
+            if self._planets is None:
+                from skyfield.api import load
+                self.logger.info("Loading ephemeris de421.bsp")
+                self._ts = self._ts or load.timescale()
+                planets = load('de421.bsp')
+                self._earth = planets['earth']
+                self._planets = planets
+
+    @property
+    def planets(self):
+        if self._planets is None:
+            self._load_ephemeris()
+        return self._planets
+
+    @property
+    def earth(self):
+        if self._planets is None:
+            self._load_ephemeris()
+        return self._earth
+
+    @property
+    def ts(self):
+        if self._ts is None:
+            with self._load_lock:
+                if self._ts is None:
+                    from skyfield.api import load
+                    self._ts = load.timescale()
+        return self._ts
+
+    @property
+    def ephemeris_table(self):
+        if self._ephemeris_table is None and self.ephemeris_table_path:
+            with self._load_lock:
+                if self._ephemeris_table is None:
+                    table = EphemerisTable(self.ephemeris_table_path)
+                    if table.bodies != self.planet_names:
+                        raise ValueError(f"Ephemeris table {self.ephemeris_table_path} has bodies {table.bodies}, "
+                                         f"expected {self.planet_names}")
+                    self.logger.info(f"Using ephemeris table {self.ephemeris_table_path}")
+                    self._ephemeris_table = table
+        return self._ephemeris_table
+
+    @property
+    def constellation_at(self):
+        if self._constellation_at is None:
+            from skyfield.api import load_constellation_map
+            self._constellation_at = load_constellation_map()  # Load constellation boundaries
+        return self._constellation_at
+
+    @property
+    def constellation_names(self):
+        if self._constellation_names is None:
+            from skyfield.api import load_constellation_names
+            self._constellation_names = dict(load_constellation_names())  # Abbreviation to full name mapping
+        return self._constellation_names
+
+    def skyfield_time(self, time: datetime) -> Time:
+        # Records of one poll share few distinct timestamps, and every record looks its time up several times
+        skyfield_time = self._time_cache.get(time)
+        if skyfield_time is not None:
+            METRICS.inc('enricher_cache_hits_total', cache='skyfield_time')
+            return skyfield_time
+        METRICS.inc('enricher_cache_misses_total', cache='skyfield_time')
+        if len(self._time_cache) >= self.time_cache_size:
+            self._time_cache.clear()
         skyfield_time = self.ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+        self._time_cache[time] = skyfield_time
+        return skyfield_time
+
+    def get_distances(self, time: datetime) -> list:
+        skyfield_time = self.skyfield_time(time)
         distances = []
         try:
             for planet_name in self.planet_names:
@@ -137,6 +252,8 @@ class SolarSystemInfluence:
         ]
 
     def create_geo_shapes(self, X: np.ndarray, Y: np.ndarray, Z: np.ndarray) -> list:
+        import matplotlib.pyplot as plt
+        from shapely.geometry import Polygon
         c_filled = plt.contourf(X, Y, Z, levels=self.levels)
         shapes = []
         try:
@@ -154,6 +271,7 @@ class SolarSystemInfluence:
         return shapes
 
     def plot_isobaric_fields(self, X: np.ndarray, Y: np.ndarray, Z: np.ndarray, title: str) -> None:
+        import matplotlib.pyplot as plt
         try:
             plt.contourf(X, Y, Z, levels=self.levels)
             plt.colorbar()
@@ -164,11 +282,26 @@ class SolarSystemInfluence:
         except Exception as e:
             self.logger.error(f"Error in plot_isobaric_fields: {e}")
 
-    def check_conjunction(self, time: datetime, observer: Topos = None, threshold: float = 10.0) -> list:
-        skyfield_time = self.ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+    def body_indices(self, bodies=None) -> list:
+        """
+        Indices into planet_names of bodies given by planet or output name
+        (case insensitive, e.g. 'Moon' or 'jupiter barycenter'), all when None.
+        """
+        if bodies is None:
+            return list(range(len(self.planet_names)))
+        names = {name.lower(): index for index, name in enumerate(self.planet_names)}
+        names.update((name.lower(), index) for index, name in enumerate(self.output_names))
+        unknown = [body for body in bodies if body.lower() not in names]
+        if unknown:
+            raise ValueError(f"Unknown bodies {', '.join(unknown)}, expected some of {', '.join(self.output_names)}")
+        return sorted({names[body.lower()] for body in bodies})
+
+    def check_conjunction(self, time: datetime, observer: Topos = None, threshold: float = 10.0, bodies=None) -> list:
+        skyfield_time = self.skyfield_time(time)
         conjunctions = []
         # Exclude Earth from conjunction checks by ensuring names are lowercase and not 'earth'
-        non_earth_planets = [name for name in self.planet_names if name.lower() != 'earth']
+        non_earth_planets = [self.planet_names[index] for index in self.body_indices(bodies)
+                             if self.planet_names[index].lower() != 'earth']
         # self.logger.info(f"Non-Earth Planets for Conjunction Check: {non_earth_planets}")  # Replaced print with logging
         try:
             for i, planet_name1 in enumerate(non_earth_planets):
@@ -198,6 +331,7 @@ class SolarSystemInfluence:
         return datetime(2020, 12, 21, 0, 0, 0)
 
     def query_gravity_influence_at_time(self, time: datetime, conjunction_threshold: float = 10.0) -> dict:
+        from shapely.geometry import mapping
         distances = self.get_distances(time)
         results = []
         try:
@@ -249,18 +383,27 @@ class SolarSystemInfluence:
             "results": results
         }
 
-    def get_influence_at_location(self, location: dict, conjunction_threshold: float = 10.0) -> dict:
+    def get_influence_at_location(self, location: dict, conjunction_threshold: float = 10.0, bodies=None,
+                                  conjunctions: bool = True) -> dict:
+        """
+        Gravitational influence vectors of the bodies (all, or those named in
+        bodies) at a location and time, their total without the Sun, and the
+        combined influence of bodies in conjunction unless conjunctions is False.
+        """
+        from skyfield.api import wgs84
+        selected = self.body_indices(bodies)
         lat = float(location['latitude'])
         lon = float(location['longitude'])
         influence_data = {}
         try:    
             time = datetime.fromisoformat(location['timestamp'])
-            skyfield_time = self.ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+            skyfield_time = self.skyfield_time(time)
             # Combine Earth with the observer's location
             location_topos = self.earth + wgs84.latlon(lat, lon)
             total_influence = np.array([0.0, 0.0, 0.0], dtype=float)  # Ensure float type
             try:
-                for mass, planet_name, output_name in zip(self.masses, self.planet_names, self.output_names):
+                for mass, planet_name, output_name in ((self.masses[index], self.planet_names[index], self.output_names[index])
+                                                       for index in selected):
                     planet = self.planets[planet_name]
                     astrometric = location_topos.at(skyfield_time).observe(planet)
                     distance = astrometric.distance().m
@@ -298,6 +441,9 @@ class SolarSystemInfluence:
                     't': float(np.linalg.norm(total_influence))
                 }
 
+                if not conjunctions:
+                    return influence_data
+
                 # Check for conjunctions and adjust influence
                 conjunctions_combined = {
                     "planets": [],
@@ -306,8 +452,8 @@ class SolarSystemInfluence:
                     "z": 0.0,
                     "t": 0.0
                 }
-                conjunctions = self.check_conjunction(time, observer=location_topos, threshold=conjunction_threshold)
-                for planet1, planet2 in conjunctions:
+                for planet1, planet2 in self.check_conjunction(time, observer=location_topos, threshold=conjunction_threshold,
+                                                               bodies=[self.planet_names[index] for index in selected]):
                     conjunctions_combined["planets"].append(f"{self.output_names[self.planet_names.index(planet1)].capitalize()}-"
                                                             f"{self.output_names[self.planet_names.index(planet2)].capitalize()}")
                     conjunctions_combined["x"] += float(influence_data[self.output_names[self.planet_names.index(planet1)]]['x'] +
@@ -336,6 +482,175 @@ class SolarSystemInfluence:
             self.logger.error(f"Error in get_influence_at_location: {e}")
             return influence_data
 
+    def get_influences_from_table(self, latitudes, longitudes, seconds, conjunction_threshold: float = 10.0, bodies=None,
+                                  conjunctions: bool = True) -> list:
+        """
+        get_influence_at_location() for arrays of locations, with the body
+        positions read from the ephemeris table. Directions are astrometric
+        rather than apparent, which differs by the aberration of light
+        (about 1e-4 rad).
+
+        Args:
+            latitudes, longitudes: Observer positions in degrees.
+            seconds: Times in seconds since 1970 UTC, inside the table.
+
+        Returns:
+            list: One influence dict per location.
+        """
+        seconds = np.asarray(seconds, dtype=float)
+        if not len(seconds):
+            return []
+        positions = self.ephemeris_table.positions_at(seconds) - self.observer_positions(latitudes, longitudes, seconds)[:, None, :]
+        return self.influence_documents(*self.influence_fields(positions), conjunction_threshold, bodies, conjunctions)
+
+    def get_influences_from_grid(self, latitudes, longitudes, seconds, conjunction_threshold: float = 10.0, bodies=None,
+                                 conjunctions: bool = True) -> list:
+        """
+        get_influence_at_location() for arrays of locations, interpolated
+        from the influence grid of each location's time bucket.
+
+        Args:
+            latitudes, longitudes: Observer positions in degrees.
+            seconds: Times in seconds since 1970 UTC.
+
+        Returns:
+            list: One influence dict per location.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        seconds = np.asarray(seconds, dtype=float)
+        documents = [None] * len(seconds)
+        # Grids are computed at the start of their bucket, exact for rows on the hour or minute
+        buckets = np.floor(seconds / self.grid_bucket_seconds) * self.grid_bucket_seconds
+        # Each bucket's rows are interpolated together, so a grid is built once per batch even when evicted later
+        for bucket in np.unique(buckets).tolist():
+            rows = np.flatnonzero(buckets == bucket)
+            vectors, separations = self.influence_grid(bucket).interpolate(latitudes[rows], longitudes[rows], seconds[rows])
+            for row, document in zip(rows.tolist(), self.influence_documents(vectors, separations, conjunction_threshold,
+                                                                             bodies, conjunctions)):
+                documents[row] = document
+        return documents
+
+    def influence_grid(self, seconds: float) -> InfluenceGrid:
+        """The influence grid at a time (a bucket start), cached."""
+        grid = self._grids.get(seconds)
+        if grid is not None:
+            self._grids.move_to_end(seconds)
+            METRICS.inc('enricher_cache_hits_total', cache='influence_grid')
+            return grid
+        METRICS.inc('enricher_cache_misses_total', cache='influence_grid')
+        while len(self._grids) >= self.grid_cache_size:
+            self._grids.popitem(last=False)
+        geocentric = self.geocentric_positions([seconds])[0]
+        latitudes, longitudes = np.meshgrid(*grid_nodes(self.grid_degrees), indexing='ij')
+        observers = self.observer_positions(latitudes.ravel(), longitudes.ravel(), np.full(latitudes.size, seconds))
+        positions = (geocentric[None] - observers[:, None, :]).reshape(latitudes.shape + geocentric.shape)
+        grid = InfluenceGrid(seconds, self.grid_degrees, *self.influence_fields(positions))
+
+        # Interpolation error at cell centres, against the exact fields there
+        centre_latitudes, centre_longitudes = cell_centres(self.grid_degrees, self.grid_error_samples)
+        times = np.full(len(centre_latitudes), seconds)
+        exact, _ = self.influence_fields(geocentric[None] - self.observer_positions(centre_latitudes, centre_longitudes, times)[:, None, :])
+        interpolated, _ = grid.interpolate(centre_latitudes, centre_longitudes, times)
+        grid.error = float((np.linalg.norm(interpolated - exact, axis=-1) / np.linalg.norm(exact, axis=-1)).max())
+        METRICS.set('enricher_grid_interpolation_error', grid.error)
+        self.logger.debug(f"Influence grid at {seconds} ({self.grid_degrees} degrees): relative error up to {grid.error:.2e}")
+
+        self._grids[seconds] = grid
+        return grid
+
+    def geocentric_positions(self, seconds) -> np.ndarray:
+        """Body positions in km seen from the Earth's centre, (times, bodies, 3), from the table when it covers them."""
+        seconds = np.asarray(seconds, dtype=float)
+        if self.ephemeris_table is not None and self.ephemeris_table.covers(seconds).all():
+            return self.ephemeris_table.positions_at(seconds)
+        origin = self.earth.at(skyfield_times(self.ts, seconds))
+        return np.stack([origin.observe(self.planets[name]).position.km.T for name in self.planet_names], axis=1)
+
+    def observer_positions(self, latitudes, longitudes, seconds) -> np.ndarray:
+        """Geocentric positions in km (ICRF axes) of observers on the ground, shaped (locations, 3)."""
+        from skyfield.api import wgs84
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        seconds = np.asarray(seconds, dtype=float)
+        times, inverse = np.unique(seconds, return_inverse=True)
+        if len(times) > 64:
+            return wgs84.latlon(latitudes, longitudes).at(skyfield_times(self.ts, seconds)).position.km.T
+        # The Earth's orientation is computed per element, so a few shared times are far cheaper one at a time
+        positions = np.empty((len(seconds), 3))
+        skyfield_time = skyfield_times(self.ts, times)
+        for index in range(len(times)):
+            rows = np.flatnonzero(inverse == index)
+            positions[rows] = wgs84.latlon(latitudes[rows], longitudes[rows]).at(skyfield_time[index]).position.km.T
+        return positions
+
+    @property
+    def conjunction_pairs(self) -> list:
+        """Index pairs of the bodies other than the Earth, in check_conjunction() order."""
+        non_earth = [index for index, name in enumerate(self.planet_names) if name.lower() != 'earth']
+        return [(first, second) for offset, first in enumerate(non_earth) for second in non_earth[offset + 1:]]
+
+    def influence_fields(self, positions: np.ndarray) -> tuple:
+        """
+        Influence vectors (..., bodies, 3) and pairwise body separations in
+        degrees (..., pairs) from observer-centred body positions in km,
+        shaped (..., bodies, 3).
+        """
+        G = 6.67430e-11  # gravitational constant
+        masses = np.array(self.masses, dtype=float)
+        norms = np.linalg.norm(positions, axis=-1)
+        distances = np.maximum(norms * 1000.0, 1e3)  # Minimum distance threshold in meters
+        magnitudes = G * masses / (distances ** 2 + 1e-10)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vectors = np.where(norms[..., None] > 0, positions / norms[..., None], 0.0) * magnitudes[..., None]
+
+        pairs = self.conjunction_pairs
+        firsts = positions[..., [first for first, _ in pairs], :]
+        seconds = positions[..., [second for _, second in pairs], :]
+        separations = np.degrees(np.arctan2(np.linalg.norm(np.cross(firsts, seconds), axis=-1),
+                                            np.sum(firsts * seconds, axis=-1)))
+        return vectors, separations
+
+    def influence_documents(self, vectors: np.ndarray, separations: np.ndarray, conjunction_threshold: float = 10.0,
+                            bodies=None, conjunctions: bool = True) -> list:
+        """Builds the get_influence_at_location() dicts from influence_fields() of n locations."""
+        selected = self.body_indices(bodies)
+        lengths = np.linalg.norm(vectors, axis=2)
+        not_sun = [index for index in selected if self.planet_names[index].lower() != 'sun']
+        totals = vectors[:, not_sun].sum(axis=1)
+        pairs = self.conjunction_pairs
+        close = separations < conjunction_threshold
+        # Only pairs of selected bodies
+        close[:, [first not in selected or second not in selected for first, second in pairs]] = False
+
+        documents = []
+        for row in range(len(vectors)):
+            document = {}
+            for index in selected:
+                x, y, z = vectors[row, index].tolist()
+                document[self.output_names[index]] = {'x': x, 'y': y, 'z': z, 't': float(lengths[row, index])}
+            document['total_influence'] = {
+                'x': float(totals[row, 0]),
+                'y': float(totals[row, 1]),
+                'z': float(totals[row, 2]),
+                't': float(np.linalg.norm(totals[row]))
+            }
+            documents.append(document)
+            if not conjunctions:
+                continue
+            combined_conjunctions = {"planets": [], "x": 0.0, "y": 0.0, "z": 0.0, "t": 0.0}
+            for pair in np.flatnonzero(close[row]).tolist():
+                first, second = pairs[pair]
+                combined = vectors[row, first] + vectors[row, second]
+                combined_conjunctions["planets"].append(f"{self.output_names[first].capitalize()}-"
+                                                        f"{self.output_names[second].capitalize()}")
+                combined_conjunctions["x"] += float(combined[0])
+                combined_conjunctions["y"] += float(combined[1])
+                combined_conjunctions["z"] += float(combined[2])
+                combined_conjunctions["t"] += float(np.linalg.norm(combined))
+            document['conjunctions'] = combined_conjunctions
+        return documents
+
     def get_constellations_at_location(self, location: dict) -> list:
         """
         Returns a list of constellations visible at the given location and time.
@@ -351,9 +666,10 @@ class SolarSystemInfluence:
         # time = datetime.fromisoformat(location['timestamp'])
         time_str = location['timestamp'].rstrip('Z')  # Remove 'Z'
         time = datetime.fromisoformat(time_str)  # Updated parsing
-        skyfield_time = self.ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+        skyfield_time = self.skyfield_time(time)
         
         # Define the observer's location
+        from skyfield.api import wgs84
         observer = wgs84.latlon(lat, lon)
         
         # Define the celestial sphere points with increased step sizes for optimization
@@ -391,16 +707,19 @@ class SolarSystemInfluence:
         """
         lat = float(location['latitude'])
         lon = float(location['longitude'])
+        if self.light_mode == 'fast':
+            return float(solar_position.light_intensity([lat], [lon], [location['timestamp']])[0])
         # ...existing code...
         
         # Define the observer's location
+        from skyfield.api import wgs84
         observer = self.planets['earth'] + wgs84.latlon(lat, lon)
         
         try:
             # Define skyfield_time
             time_str = location['timestamp'].rstrip('Z')  # Remove 'Z'
             time = datetime.fromisoformat(time_str)
-            skyfield_time = self.ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+            skyfield_time = self.skyfield_time(time)
             
             # Calculate the altitude of the Sun
             astrometric = observer.at(skyfield_time).observe(self.planets['sun'])
@@ -419,6 +738,92 @@ class SolarSystemInfluence:
             self.logger.error(f"Error in get_light_intensity_at_location: {e}")
             return 0.0
 
+    def enrich_batch(self, batch, light_intensity: bool = True, influence: bool = True, bodies=None,
+                     conjunctions: bool = True):
+        """
+        Adds light_intensity and the gravitational influence fields to every
+        valid row of a RecordBatch in place.
+
+        Args:
+            batch (RecordBatch): Batch with 'latitude', 'longitude' and 'timestamp' columns.
+            light_intensity (bool): Whether to add light_intensity.
+            influence (bool): Whether to add the influence fields.
+            bodies (list): Bodies to add influence fields for (output or planet names), all when None.
+            conjunctions (bool): Whether to add the combined influence of bodies in conjunction.
+
+        Returns:
+            RecordBatch: The same batch, enriched.
+        """
+        rows = np.flatnonzero(batch.valid).tolist()
+        if not rows:
+            return batch
+        if light_intensity:
+            self._enrich_light_intensity(batch, rows)
+        if influence:
+            self._enrich_influence(batch, rows, bodies, conjunctions)
+        return batch
+
+    def _enrich_light_intensity(self, batch, rows):
+        intensity = np.zeros(len(batch), dtype=float)
+        if self.light_mode == 'fast':
+            intensity[rows] = solar_position.light_intensity(
+                batch.column('latitude')[rows], batch.column('longitude')[rows], batch.column('timestamp')[rows])
+        else:
+            for row, location in zip(rows, self._locations(batch, rows)):
+                intensity[row] = self.get_light_intensity_at_location(location)
+        batch.set_column('light_intensity', intensity)
+
+    def _enrich_influence(self, batch, rows, bodies, conjunctions):
+        if self.influence_mode == 'batch':
+            # Rows at the same position in the same time bucket share one computation, at the first one's time
+            seconds = solar_position.epoch_seconds(batch.column('timestamp')[rows])
+            buckets = np.floor(seconds / self.grid_bucket_seconds).tolist()
+            first = {}
+            shared = []
+            for row, location, bucket in zip(rows, self._locations(batch, rows), buckets):
+                # Rows without a parsable time only share with the same timestamp
+                key = (location['latitude'], location['longitude'], bucket if np.isfinite(bucket) else location['timestamp'])
+                shared.append(first.setdefault(key, row))
+            influences = self._exact_influences(batch, list(first.values()), bodies, conjunctions)
+            batch.assign_rows(rows, [influences[row] for row in shared])
+            return
+        influences = {}
+        exact_rows = rows
+        if self.influence_mode == 'grid':
+            seconds = solar_position.epoch_seconds(batch.column('timestamp')[rows])
+            timed = np.isfinite(seconds)
+            grid_rows = np.asarray(rows)[timed]
+            documents = self.get_influences_from_grid(batch.column('latitude')[grid_rows], batch.column('longitude')[grid_rows],
+                                                      seconds[timed], bodies=bodies, conjunctions=conjunctions)
+            influences.update(zip(grid_rows.tolist(), documents))
+            exact_rows = [row for row in rows if row not in influences]
+        influences.update(self._exact_influences(batch, exact_rows, bodies, conjunctions))
+        batch.assign_rows(rows, [influences[row] for row in rows])
+
+    def _exact_influences(self, batch, rows, bodies, conjunctions):
+        """{row: influence dict} computed per row, vectorized from the ephemeris table where it covers them."""
+        influences = {}
+        if self.ephemeris_table is not None and rows:
+            seconds = solar_position.epoch_seconds(batch.column('timestamp')[rows])
+            in_table = self.ephemeris_table.covers(seconds)
+            table_rows = np.asarray(rows)[in_table]
+            documents = self.get_influences_from_table(batch.column('latitude')[table_rows], batch.column('longitude')[table_rows],
+                                                       seconds[in_table], bodies=bodies, conjunctions=conjunctions)
+            influences.update(zip(table_rows.tolist(), documents))
+            METRICS.inc('enricher_table_rows_total', len(table_rows))
+        remaining = [row for row in rows if row not in influences]
+        for row, location in zip(remaining, self._locations(batch, remaining)):
+            influences[row] = self.get_influence_at_location(location, bodies=bodies, conjunctions=conjunctions)
+        return influences
+
+    @staticmethod
+    def _locations(batch, rows):
+        latitudes = batch.column('latitude')[rows].tolist()
+        longitudes = batch.column('longitude')[rows].tolist()
+        timestamps = batch.column('timestamp')[rows].tolist()
+        return [{'latitude': latitude, 'longitude': longitude, 'timestamp': timestamp}
+                for latitude, longitude, timestamp in zip(latitudes, longitudes, timestamps)]
+
 if __name__ == "__main__":
     gravity_influence = SolarSystemInfluence()
     # ...existing code...
@@ -1,63 +1,339 @@
-from data_sources.cmems_data import CmemsDataSource
-from data_sources.metar_data import MetarDataSource
-from data_sources.space_weather_data import SpaceWeatherDataSource
-from data_sources.meteostat_data import MeteostatDataSource
-from data_sources.aircraft_data import AircraftDataSource
+from data_sources import registry
+from data_sources.scheduler import Scheduler
 from storage.elasticsearch import ElasticsearchStorage
+from storage.fanout import FanOut, Sink
+from utils.record_batch import RecordBatch
+from utils.metrics import METRICS, MetricsServer
+from utils.profiling import PROFILER
+from config import Config
+from queue import Empty
 import multiprocessing
-import threading
+import functools
 import logging
-import json
 import time
 import asyncio
+import argparse
+
+def __getattr__(name):
+    # Keeps `from main import AircraftDataSource` working without importing every source up front
+    for class_path in registry.DATA_SOURCES.values():
+        if class_path.endswith(f":{name}"):
+            return registry.load_class(class_path)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+MODES = ('all', 'fetcher', 'worker')
+
+
+def connect_broker():
+    from storage.rabbitmq import RabbitMQStorage
+    return RabbitMQStorage(url=Config.RABBITMQ_URL, queue_name=Config.RABBITMQ_QUEUE,
+                           batch_size=Config.RABBITMQ_BATCH_SIZE, prefetch_count=Config.RABBITMQ_PREFETCH,
+                           retry_seconds=Config.RABBITMQ_RETRY_SECONDS, max_attempts=Config.RABBITMQ_MAX_ATTEMPTS)
+
+
+STORES = ('elasticsearch', 'sqlite')
+
+
+def create_storage(backend=None):
+    """A store records are indexed into, Config.STORAGE_BACKEND by default."""
+    backend = backend or Config.STORAGE_BACKEND
+    if backend == 'sqlite':
+        from storage.database import DatabaseStorage
+        return DatabaseStorage(Config.DATABASE_URL)
+    if backend != 'elasticsearch':
+        raise ValueError(f"Unknown storage backend {backend}")
+    return ElasticsearchStorage(
+        es_url='http://weather-lab-elasticsearch:9200',
+        max_retries=Config.BULK_MAX_RETRIES,
+        retry_backoff=Config.BULK_RETRY_BACKOFF,
+        flush_concurrency=Config.BULK_FLUSH_CONCURRENCY
+    )
+
+
+def check_written(stats):
+    """
+    Raises unless a bulk was written in full. Records the store rejected
+    for good (stats "rejected", e.g. mapping conflicts) are only counted:
+    writing them again cannot succeed.
+    """
+    if stats is None:
+        raise RuntimeError("bulk request failed")
+    unwritten = stats['failed'] - stats.get('rejected', 0)
+    if unwritten:
+        raise RuntimeError(f"{unwritten} of {stats['records']} records were not written")
+    return stats
+
+
+def store_writer(storage):
+    def write(records):
+        check_written(storage._bulk_index_data_sync(records))
+    return write
+
+
+def create_sinks(primary_storage, concurrency=1):
+    """
+    Builds the fan-out over Config.SINKS. The primary store (STORAGE_BACKEND)
+    is the given storage and gets `concurrency` writers by default.
+    """
+    names = Config.SINKS or [Config.STORAGE_BACKEND] + (['flowiseai'] if Config.FLOWISEAI_URL else [])
+    sinks = []
+    for name in names:
+        if name in STORES:
+            storage = primary_storage if name == Config.STORAGE_BACKEND else create_storage(name)
+            settings = Config.sink_settings(name, concurrency=concurrency if storage is primary_storage else 1)
+            sinks.append(Sink(name, store_writer(storage), close=getattr(storage, 'close_connection', None), **settings))
+        elif name == 'flowiseai':
+            from storage.flowiseai import FlowiseAIStorage
+            storage = FlowiseAIStorage(
+                api_url=Config.FLOWISEAI_URL,
+                api_key=Config.FLOWISEAI_API_KEY,
+                batch_size=Config.FLOWISEAI_BATCH_SIZE,
+                concurrency=Config.FLOWISEAI_CONCURRENCY,
+                buffer_size=Config.FLOWISEAI_BUFFER_SIZE
+            )
+            # add() only buffers, the forwarder has its own senders and drops the oldest records itself
+            sinks.append(Sink(name, storage.add, close=storage.close, **Config.sink_settings(name, policy='drop')))
+        else:
+            raise ValueError(f"Unknown sink {name}, expected one of {', '.join(STORES + ('flowiseai',))}")
+    return FanOut(sinks)
+
 
 class WeatherLab:
-    def __init__(self, elasticsearch_storage=None):
-        self.queue = multiprocessing.Queue()
-        self.cmems_data_source = CmemsDataSource(config_path='src/config/cmems_config.json', queue=self.queue)
-        self.metar_data_source = MetarDataSource(config_path='src/config/metar_config.json', queue=self.queue)
-        self.space_weather_data_source = SpaceWeatherDataSource(config_path='src/config/space_weather_config.json', queue=self.queue)
-        self.meteostat_data_source = MeteostatDataSource(config_path='src/config/meteostat_config.json', queue=self.queue)
-        self.aircraft_data_source = AircraftDataSource(config_path='src/config/aircraft_config.json', queue=self.queue)
-        
-        self.elasticsearch_storage = elasticsearch_storage or ElasticsearchStorage(es_url='http://weather-lab-elasticsearch:9200')
+    """
+    mode 'all' fetches, enriches and indexes in one process. In distributed
+    mode 'fetcher' nodes only fetch and translate and publish batches to
+    RabbitMQ, 'worker' nodes consume them, enrich and index them; add
+    workers to scale ingest.
+    """
+
+    def __init__(self, elasticsearch_storage=None, mode='all', broker=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.broker = broker or (connect_broker() if mode != 'all' else None)
+        self.enrichment_stage = None
+        self.enrichment_pool = None
+        if Config.ENRICH_WORKERS > 0 and mode == 'all':
+            from enrichers.enrichment_pool import CONTEXT, EnrichmentPool
+            # Worker processes put enriched batches straight on the indexer queue
+            self.queue = CONTEXT.Queue()
+            self.enrichment_pool = EnrichmentPool(self.queue, workers=Config.ENRICH_WORKERS, batch_size=Config.ENRICH_BATCH_SIZE,
+                                                  plans=registry.enrichment_plans(Config.CONFIG_DIR))
+        else:
+            self.queue = multiprocessing.Queue()
+        self.data_sources = registry.load_sources(Config.CONFIG_DIR, self.queue) if mode != 'worker' else {}
+        self.scheduler = None
+        self.scheduler_workers = Config.SCHEDULER_WORKERS
+
+        # Fetchers publish to the broker and never index
+        self.elasticsearch_storage = elasticsearch_storage
+        if elasticsearch_storage is None and mode != 'fetcher':
+            self.elasticsearch_storage = create_storage()
+        # Built on start, see create_sinks
+        self.sinks = None
+        self.spool = None
+        if Config.SPOOL_DIR and mode == 'all':
+            from storage.spool import Spool
+            self.spool = Spool(Config.SPOOL_DIR, segment_bytes=Config.SPOOL_SEGMENT_MB << 20,
+                               fsync_interval=Config.SPOOL_FSYNC_SECONDS, max_bytes=Config.SPOOL_MAX_MB << 20)
+        self.spool_retry_seconds = Config.SPOOL_RETRY_SECONDS
+        self.last_spool_retry = time.monotonic()
         self.bulk_records = []
-        self.bulk_size = 1000
+        self.bulk_record_count = 0
+        self.bulk_size = Config.BULK_SIZE
+        # Flush a partial bulk after this many idle seconds, 0 waits for a full bulk
+        self.flush_interval = Config.BULK_FLUSH_SECONDS
+        # Writer threads of the primary store
+        self.flush_concurrency = Config.BULK_FLUSH_CONCURRENCY
+        self.last_flush = time.monotonic()
+        # How often the consumer checks whether every source is done (one-shot polls)
+        self.idle_check_seconds = 1.0
+        METRICS.register_collector(self.queue_depth)
 
-    def fetch_and_process_data(self, data_source):
-        data_source.run()
+    def queue_depth(self):
+        try:
+            return [('queue_depth', {}, self.queue.qsize())]
+        except NotImplementedError:
+            # qsize() is not available on every platform (e.g. macOS)
+            return []
 
-    async def run(self):
-        threads = [
-            threading.Thread(target=self.fetch_and_process_data, args=(self.cmems_data_source,)),
-            threading.Thread(target=self.fetch_and_process_data, args=(self.metar_data_source,)),
-            threading.Thread(target=self.fetch_and_process_data, args=(self.space_weather_data_source,)),
-            threading.Thread(target=self.fetch_and_process_data, args=(self.meteostat_data_source,)),
-            threading.Thread(target=self.fetch_and_process_data, args=(self.aircraft_data_source,))
-        ]
+    async def flush(self):
+        records = self.bulk_records
+        self.bulk_records = []
+        self.bulk_record_count = 0
+        self.last_flush = time.monotonic()
+        on_done = None
+        if self.spool:
+            on_done = functools.partial(self.spooled, self.spool.append(records))
+        # Returns once every sink buffered the bulk, or dropped it; waits only for a full blocking sink
+        await self.sinks.bulk_index_data(records, on_done=on_done)
+        await self.retry_spooled()
+
+    def spooled(self, sequences, failed):
+        if failed:
+            self.spool.nack(sequences, failed)
+        else:
+            self.spool.ack(sequences)
+
+    async def replay_spool(self, sequences=None, sinks=None):
+        """
+        Hands spooled entries to the sinks again in bulks of bulk_size: on
+        start the ones not acknowledged before the last shutdown to every
+        blocking sink, later the ones a sink failed to write to the sinks that
+        failed them. Dropping sinks got every entry when it was flushed and
+        are lossy anyway, they never see a replay.
+        """
+        sinks = self.sinks.blocking() if sinks is None else sinks
+        bulk, bulk_sequences, count, replayed = [], [], 0, 0
+        for sequence, batch in self.spool.replay(sequences):
+            bulk.append(batch)
+            bulk_sequences.append(sequence)
+            count += len(batch)
+            if count >= self.bulk_size:
+                await self.sinks.bulk_index_data(bulk, on_done=functools.partial(self.spooled, bulk_sequences), only=sinks)
+                replayed += count
+                bulk, bulk_sequences, count = [], [], 0
+        if bulk:
+            await self.sinks.bulk_index_data(bulk, on_done=functools.partial(self.spooled, bulk_sequences), only=sinks)
+            replayed += count
+        if replayed:
+            METRICS.inc('spool_replayed_records_total', replayed)
+            logging.info(f"Replayed {replayed} spooled records to {', '.join(sinks)}")
+        self.last_spool_retry = time.monotonic()
+
+    async def retry_spooled(self):
+        if self.spool and time.monotonic() - self.last_spool_retry >= self.spool_retry_seconds:
+            failed = self.spool.take_failed()
+            for sinks, sequences in failed.items():
+                await self.replay_spool(sequences, sorted(sinks))
+            if not failed:
+                self.last_spool_retry = time.monotonic()
+
+    def next_record(self):
+        timeout = self.idle_check_seconds
+        if self.flush_interval:
+            timeout = min(timeout, max(0.0, self.last_flush + self.flush_interval - time.monotonic()))
+        return self.queue.get(timeout=timeout)
 
-        for thread in threads:
-            thread.start()
+    def start_sinks(self):
+        if self.sinks is None:
+            self.sinks = create_sinks(self.elasticsearch_storage, concurrency=self.flush_concurrency)
+        self.sinks.start()
 
+    def idle(self):
+        """True when every source is done and no batch is being enriched."""
+        return self.scheduler.idle() and not (self.enrichment_pool and self.enrichment_pool.pending())
+
+    async def run(self):
+        if self.mode == 'worker':
+            raise RuntimeError("A worker consumes from the broker, use run_worker()")
+        if self.enrichment_pool:
+            self.enrichment_pool.start()
+        if self.mode == 'all':
+            self.start_sinks()
+        if self.spool:
+            await self.replay_spool()
+        # A fetcher hands translated records to the broker in place of an enrichment pool
+        pool = self.broker if self.mode == 'fetcher' else self.enrichment_pool
+        if pool:
+            for data_source in self.data_sources.values():
+                data_source.enrichment_pool = pool
+        self.scheduler = Scheduler(self.data_sources, max_workers=self.scheduler_workers,
+                                   stall_seconds=Config.STALL_SECONDS).start()
+
+        idle_checks = 0
         while True:
-            record = self.queue.get()
+            try:
+                record = self.next_record()
+            except Empty:
+                # Stop once every source has finished (only one-shot sources do) and
+                # the queue stayed empty for two checks, records may still be in flight
+                idle_checks = idle_checks + 1 if self.idle() else 0
+                if idle_checks >= 2:
+                    break
+                await self.retry_spooled()
+                if self.flush_interval and time.monotonic() - self.last_flush >= self.flush_interval:
+                    if self.bulk_records:
+                        await self.flush()
+                    else:
+                        self.last_flush = time.monotonic()
+                continue
+            idle_checks = 0
             if record is None:
                 break
             # logging.info(f"Processing record: {record}")
+            METRICS.mark_progress('queue_consumer')
             self.bulk_records.append(record)
-            if len(self.bulk_records) >= self.bulk_size:
-                await self.elasticsearch_storage.bulk_index_data(self.bulk_records)
-                self.bulk_records = []
+            self.bulk_record_count += record.count_valid() if isinstance(record, RecordBatch) else 1
+            if self.bulk_record_count >= self.bulk_size:
+                await self.flush()
 
         # Index any remaining records
         if self.bulk_records:
-            await self.elasticsearch_storage.bulk_index_data(self.bulk_records)
+            await self.flush()
+        if self.sinks:
+            # Drains every sink buffer
+            self.sinks.stop()
+        if self.spool:
+            self.spool.close()
+
+        self.scheduler.stop()
+        if self.enrichment_pool:
+            self.enrichment_pool.stop()
+        if self.broker:
+            self.broker.close()
+
+    def index_batch(self, batch):
+        """
+        Worker mode: enriches and indexes one batch consumed from the broker.
+        Raises when records were not indexed, so the broker retries the batch.
+        """
+        if self.enrichment_stage is None:
+            from enrichers.enrichment_stage import EnrichmentStage
+            self.enrichment_stage = EnrichmentStage(registry.enrichment_plans(Config.CONFIG_DIR))
+        self.enrichment_stage.enrich_batch(batch)
+        METRICS.mark_progress('queue_consumer')
+        try:
+            check_written(self.elasticsearch_storage._bulk_index_data_sync([batch]))
+        except RuntimeError as e:
+            raise RuntimeError(f"Bulk indexing of a {batch.source} batch failed: {e}")
+        # The other sinks get the batch once the primary store has it, it is acked after that
+        self.sinks.put([batch], exclude=(Config.STORAGE_BACKEND,))
+
+    def run_worker(self):
+        """Consumes batches from the broker until stopped, acknowledging each once indexed."""
+        self.start_sinks()
+        try:
+            self.broker.consume(self.index_batch)
+        finally:
+            self.broker.close()
+            self.sinks.stop()
+
 
-        for thread in threads:
-            thread.join()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather Lab ingestion pipeline")
+    parser.add_argument('--profile', action='store_true', default=Config.PROFILE,
+                        help="Record per-stage timing spans (env WEATHER_LAB_PROFILE)")
+    parser.add_argument('--profile-interval', type=float, default=Config.PROFILE_SAMPLE_INTERVAL,
+                        help="Sampling profiler interval in seconds, 0 disables sampling (env WEATHER_LAB_PROFILE_INTERVAL)")
+    parser.add_argument('--profile-dir', default=Config.PROFILE_DIR,
+                        help="Directory for the summary table and folded stacks (env WEATHER_LAB_PROFILE_DIR)")
+    parser.add_argument('--mode', choices=MODES, default=Config.MODE,
+                        help="all: fetch and index in one process, fetcher/worker: distributed over RabbitMQ (env WEATHER_LAB_MODE)")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-    weather_lab = WeatherLab()
-    asyncio.run(weather_lab.run())
\ No newline at end of file
+    args = parse_args()
+    if args.profile:
+        PROFILER.configure(sample_interval=args.profile_interval, output_dir=args.profile_dir)
+        PROFILER.install_handlers()
+        PROFILER.start_sampler()
+    MetricsServer(host=Config.METRICS_HOST, port=Config.METRICS_PORT, stall_seconds=Config.STALL_SECONDS).start()
+    weather_lab = WeatherLab(mode=args.mode)
+    if args.mode == 'worker':
+        weather_lab.run_worker()
+    else:
+        asyncio.run(weather_lab.run())
@@ -0,0 +1,129 @@
+import json
+import logging
+import math
+import time
+from datetime import datetime
+import numpy as np
+from utils.record_batch import RecordBatch
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _finite(value):
+    # Elasticsearch rejects NaN/Infinity tokens, so non-finite floats become null
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+if orjson is not None:
+    def dumps(value):
+        # orjson already writes NaN/Infinity as null
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+else:
+    def dumps(value):
+        try:
+            return json.dumps(value, default=_default, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        except ValueError:
+            return json.dumps(_finite(value), default=_default, separators=(',', ':')).encode('utf-8')
+
+
+class BulkBodySerializer:
+    """
+    Writes Elasticsearch bulk request bodies (NDJSON) straight from records into
+    a reusable byte buffer. The action/metadata prefix of every daily index is
+    rendered once and cached, and the buffer keeps its capacity between flushes.
+    """
+
+    def __init__(self, index_prefix="weather_data", initial_capacity=1 << 20):
+        self.index_prefix = index_prefix
+        self._buffer = bytearray(initial_capacity)
+        self._length = 0
+        self._action_prefixes = {}
+
+    def _write(self, chunk):
+        end = self._length + len(chunk)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(max(end - len(self._buffer), len(self._buffer))))
+        self._buffer[self._length:end] = chunk
+        self._length = end
+
+    def action_prefix(self, timestamp):
+        """
+        Returns the cached '{"index":{"_index":...,"_id":' prefix for the daily
+        index the timestamp belongs to.
+        """
+        day = timestamp[:10]
+        prefix = self._action_prefixes.get(day)
+        if prefix is None:
+            parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            index_name = f"{self.index_prefix}-{parsed.strftime('%Y-%m-%d')}"
+            prefix = b'{"index":{"_index":' + dumps(index_name) + b',"_id":'
+            self._action_prefixes[day] = prefix
+        return prefix
+
+    def _write_document(self, latitude, longitude, timestamp, source):
+        if not isinstance(timestamp, str):
+            raise ValueError(f"Invalid timestamp format: {timestamp}")
+        prefix = self.action_prefix(timestamp)
+        self._write(prefix)
+        self._write(dumps(f"{latitude}-{longitude}-{timestamp}"))
+        self._write(b'}}\n')
+        self._write(source)
+        self._write(b'\n')
+
+    def _write_batch(self, batch):
+        written = 0
+        latitudes = batch.values('latitude')
+        longitudes = batch.values('longitude')
+        timestamps = batch.values('timestamp')
+        for row, source in batch.encoded_rows():
+            if source is None:
+                logging.error(f"Error preparing batch row for bulk indexing: row {row} holds a value that is not JSON serializable")
+                continue
+            try:
+                self._write_document(latitudes[row], longitudes[row], timestamps[row], source.encode('utf-8'))
+                written += 1
+            except (ValueError, TypeError) as e:
+                logging.error(f"Error preparing batch row for bulk indexing: {e}")
+        return written
+
+    def serialize(self, data_list):
+        """
+        Renders the bulk body for a list of record dicts and/or RecordBatches.
+
+        Returns:
+            tuple: (body bytes, number of documents, serialization seconds)
+        """
+        started = time.perf_counter()
+        self._length = 0
+        count = 0
+        for data in data_list:
+            if isinstance(data, RecordBatch):
+                count += self._write_batch(data)
+                continue
+            try:
+                self._write_document(data['latitude'], data['longitude'], data['timestamp'], dumps(data))
+                count += 1
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                logging.error(f"Error preparing data for bulk indexing: {e}")
+                logging.error(f"Problematic data: {data}")
+        body = bytes(memoryview(self._buffer)[:self._length])
+        return body, count, time.perf_counter() - started
@@ -0,0 +1,43 @@
+import json
+import zlib
+import numpy as np
+from storage.bulk_serializer import dumps
+from utils.record_batch import RecordBatch
+
+
+def encode_batch(batch):
+    """
+    Encodes the valid rows of a RecordBatch as one compact message body:
+    column-oriented JSON (field names once per batch, not once per record),
+    deflate compressed.
+    """
+    batch = batch.compact()
+    payload = {
+        "source": batch.source,
+        "rows": len(batch),
+        # Integral columns as ints, so they decode as ints (with gaps) again
+        "columns": {name: batch.values(name) if name in batch.integral else values
+                    for name, values in batch.columns.items()},
+    }
+    return zlib.compress(dumps(payload), 1)
+
+
+def decode_batch(body):
+    payload = json.loads(zlib.decompress(body))
+    batch = RecordBatch.from_columns(payload["columns"], source=payload["source"])
+    if not payload["columns"]:
+        batch.valid = np.ones(payload["rows"], dtype=bool)
+    return batch
+
+
+def as_batches(data_list):
+    """A bulk of records and/or RecordBatches as RecordBatches, records grouped by source."""
+    batches = []
+    records = {}
+    for data in data_list:
+        if isinstance(data, RecordBatch):
+            batches.append(data)
+        else:
+            records.setdefault(data.get('source'), []).append(data)
+    batches.extend(RecordBatch.from_records(group, source=source) for source, group in records.items())
+    return batches
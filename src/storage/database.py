@@ -1,20 +1,249 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import sqlite3
+import threading
+import time
+from utils import geohash
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from utils.record_batch import RecordBatch
+
+GEOHASH_PRECISION = 7
+TABLE_PREFIX = 'records_'
+# Every source table starts with these; other fields become columns as they first appear
+CORE_COLUMNS = (('source', 'TEXT'), ('timestamp', 'TEXT'), ('latitude', 'REAL'), ('longitude', 'REAL'), ('geohash', 'TEXT'))
+# A record replaces an earlier one with the same key, like the Elasticsearch document id
+NATURAL_KEY = ('source', 'timestamp', 'latitude', 'longitude')
+# Sorts after every geohash character, for prefix range scans
+PREFIX_END = '{'
+
+
+def sqlite_path(database_url):
+    """sqlite:///data.db -> data.db, sqlite:////var/lib/lab.db -> /var/lib/lab.db"""
+    prefix = 'sqlite:///'
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Unsupported database URL {database_url}, expected {prefix}<path>")
+    return database_url[len(prefix):]
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def column_type(values):
+    if values.dtype.kind in 'iub':
+        return 'INTEGER'
+    if values.dtype.kind == 'f':
+        return 'REAL'
+    return 'TEXT'
+
+
+def sql_values(values, integral=False):
+    """Column values as Python objects, with None for NaN (and ints for an integral column)."""
+    if values.dtype.kind == 'f':
+        if integral:
+            return [None if value != value else int(value) for value in values.tolist()]
+        return [None if value != value else value for value in values.tolist()]
+    if values.dtype.kind == 'O':
+        # Lists (e.g. conjunctions.planets) and other structures are stored as JSON text
+        return [value if value is None or isinstance(value, (str, int, float)) else json.dumps(value, default=str)
+                for value in values.tolist()]
+    return values.tolist()
+
+
 class DatabaseStorage:
-    def __init__(self, db_config):
-        self.db_config = db_config
+    """
+    Embedded SQLite sink, so the lab runs on a single node without
+    Elasticsearch. Every source gets its own table (records_<source>) with
+    the core columns plus one column per field; nested enrichment fields
+    are stored flattened as "parent.child". Tables are indexed on
+    (source, timestamp) and on a geohash of the position, which answers
+    time-window and bounding-box queries without a full scan.
+
+    Writes are serialized on one connection: every bulk is one transaction
+    of executemany inserts, with the database in WAL mode so readers in
+    other processes are not blocked while it writes. Rows are unique on
+    NATURAL_KEY, a record written again (a spool or broker replay) replaces
+    the earlier row.
+    """
+
+    def __init__(self, database_url='sqlite:///data.db', geohash_precision=GEOHASH_PRECISION):
+        self.database_url = database_url
+        self.geohash_precision = geohash_precision
+        self.columns = {}
+        # Serializes callers of _bulk_index_data_sync outside the executor (worker mode) with it
+        self._lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
         self.connection = self.connect_to_database()
 
     def connect_to_database(self):
-        # Implement the logic to connect to the database using self.db_config
-        pass
+        connection = sqlite3.connect(sqlite_path(self.database_url), isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only syncs on checkpoints and stays consistent after a crash
+        connection.execute('PRAGMA synchronous=NORMAL')
+        self.columns = self.table_columns(connection)
+        for table in self.columns:
+            self.ensure_key(connection, table)
+        return connection
+
+    @staticmethod
+    def table_columns(connection):
+        """{table: column names} of the source tables, as the database has them."""
+        return {table: [row[1] for row in connection.execute(f'PRAGMA table_info({quote(table)})')]
+                for (table,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                                                   (TABLE_PREFIX + '%',)).fetchall()}
+
+    @staticmethod
+    def ensure_key(connection, table):
+        """
+        Creates the unique index on a table's natural key, the one the
+        Elasticsearch document id is made of, so replayed records replace
+        their earlier copy. Duplicates written before it existed are removed
+        first, keeping the last one.
+        """
+        key = ', '.join(quote(name) for name in NATURAL_KEY)
+        statement = f'CREATE UNIQUE INDEX IF NOT EXISTS {quote(table + "_key")} ON {quote(table)} ({key})'
+        try:
+            connection.execute(statement)
+        except sqlite3.IntegrityError:
+            removed = connection.execute(f'DELETE FROM {quote(table)} WHERE rowid NOT IN '
+                                         f'(SELECT MAX(rowid) FROM {quote(table)} GROUP BY {key})').rowcount
+            logging.warning(f"Removed {removed} duplicate rows from {table}")
+            connection.execute(statement)
+
+    def ensure_table(self, source, batch):
+        """Creates the source's table and indexes, and adds columns for new fields."""
+        table = TABLE_PREFIX + source
+        if table not in self.columns:
+            definition = ', '.join(f'{quote(name)} {kind}' for name, kind in CORE_COLUMNS)
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {quote(table)} ({definition})')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {quote(table + "_source_timestamp")} '
+                                    f'ON {quote(table)} (source, timestamp)')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {quote(table + "_geohash")} ON {quote(table)} (geohash)')
+            self.ensure_key(self.connection, table)
+            self.columns[table] = [name for name, _ in CORE_COLUMNS]
+        known = set(self.columns[table])
+        for name, values in batch.columns.items():
+            if name not in known:
+                self.connection.execute(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(name)} {column_type(values)}')
+                self.columns[table].append(name)
+                known.add(name)
+        return table
+
+    def _batches(self, data_list):
+        """Groups records and RecordBatches by source."""
+        batches = []
+        records = {}
+        for data in data_list:
+            if isinstance(data, RecordBatch):
+                # A copy, so the source and geohash columns added here stay out of the caller's batch
+                valid = data.compact()
+                batches.append(RecordBatch(dict(valid.columns), source=valid.source, integral=valid.integral))
+            else:
+                records.setdefault(data.get('source') or 'unknown', []).append(data)
+        batches.extend(RecordBatch.from_records(group, source=source) for source, group in records.items())
+        return batches
+
+    def store_batch(self, batch):
+        source = batch.source
+        if source is None:
+            source = batch.column('source')[0] if 'source' in batch.columns else 'unknown'
+        if 'source' not in batch.columns:
+            batch.set_column('source', [source] * len(batch))
+        if 'latitude' in batch.columns and 'longitude' in batch.columns:
+            batch.set_column('geohash', geohash.encode(batch.column('latitude'), batch.column('longitude'),
+                                                       self.geohash_precision))
+        table = self.ensure_table(source, batch)
+        names = list(batch.columns)
+        rows = list(zip(*(sql_values(batch.column(name), name in batch.integral) for name in names)))
+        placeholders = ', '.join('?' * len(names))
+        self.connection.executemany(f'INSERT OR REPLACE INTO {quote(table)} ({", ".join(quote(name) for name in names)}) '
+                                    f'VALUES ({placeholders})', rows)
+        return len(rows)
+
+    async def bulk_index_data(self, data_list):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._bulk_index_data_sync, data_list)
+
+    def _bulk_index_data_sync(self, data_list):
+        started = time.perf_counter()
+        count = 0
+        with self._lock, PROFILER.span('index'):
+            begun = False
+            try:
+                self.connection.execute('BEGIN')
+                begun = True
+                for batch in self._batches(data_list):
+                    if len(batch):
+                        count += self.store_batch(batch)
+                self.connection.execute('COMMIT')
+            except Exception as e:
+                # Nothing to roll back when BEGIN itself failed, or SQLite already rolled back
+                if begun and self.connection.in_transaction:
+                    self.connection.execute('ROLLBACK')
+                # The rollback also undid tables and columns created in the transaction
+                self.columns = self.table_columns(self.connection)
+                METRICS.inc('bulk_flush_errors_total')
+                logging.error(f"Error writing to {self.database_url}: {e}")
+                return None
+        seconds = time.perf_counter() - started
+        METRICS.observe('bulk_flush_records', count)
+        METRICS.observe('bulk_flush_seconds', seconds)
+        METRICS.inc('records_indexed_total', count)
+        METRICS.mark_progress('indexer')
+        logging.info(f"Stored {count} records in {seconds * 1000:.1f} ms")
+        return {"records": count, "failed": 0, "seconds": seconds}
 
     def store_data(self, data):
-        # Implement the logic to store data in the database
-        pass
+        return self._bulk_index_data_sync([data])
+
+    def fetch_data(self, start=None, end=None, bbox=None, sources=None, limit=None):
+        """
+        Returns records (flattened, as dicts) observed in [start, end) and
+        inside bbox = (min_lat, min_lon, max_lat, max_lon), for the given
+        sources or all of them. Timestamps are compared as ISO 8601 text.
+        """
+        with self._lock:
+            return self._fetch(start, end, bbox, sources, limit)
+
+    def _fetch(self, start, end, bbox, sources, limit):
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('timestamp < ?')
+            parameters.append(end)
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            # Narrow down with geohash prefix ranges on the index, then the exact box
+            prefixes = geohash.cover(min_lat, min_lon, max_lat, max_lon)
+            conditions.append('(' + ' OR '.join('(geohash >= ? AND geohash < ?)' for _ in prefixes) + ')')
+            for prefix in prefixes:
+                parameters.extend((prefix, prefix + PREFIX_END))
+            conditions.append('latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?')
+            parameters.extend((min_lat, max_lat, min_lon, max_lon))
+        where = ''.join(f' AND {condition}' for condition in conditions)
 
-    def fetch_data(self, query):
-        # Implement the logic to fetch data from the database based on the query
-        pass
+        results = []
+        tables = [TABLE_PREFIX + source for source in sources] if sources else sorted(self.columns)
+        for table in tables:
+            if table not in self.columns:
+                continue
+            # The source condition lets the time window use the (source, timestamp) index
+            cursor = self.connection.execute(f'SELECT * FROM {quote(table)} WHERE source = ?{where} ORDER BY timestamp',
+                                             [table[len(TABLE_PREFIX):]] + parameters)
+            names = [description[0] for description in cursor.description]
+            for row in cursor:
+                results.append({name: value for name, value in zip(names, row) if value is not None})
+                if limit is not None and len(results) >= limit:
+                    return results
+        return results
 
     def close_connection(self):
-        # Implement the logic to close the database connection
-        pass
\ No newline at end of file
+        self.executor.shutdown()
+        with self._lock:
+            self.connection.close()
@@ -1,27 +1,47 @@
-from elasticsearch import Elasticsearch, helpers
 from datetime import datetime
 import time
 import json
 import logging
 import asyncio
 import concurrent.futures
+import random
+import threading
+from storage.bulk_serializer import BulkBodySerializer
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+
+# Bulk requests and bulk items failing with these statuses are retried with backoff
+RETRYABLE_STATUS = (429, 502, 503, 504)
+# Index settings while loading history: no refreshes and no replicas, see begin_bulk_load
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
 
 class ElasticsearchStorage:
-    def __init__(self, es_url, retry_delay=10, bulk_size=1000):
+    def __init__(self, es_url, retry_delay=10, bulk_size=1000, max_retries=3, retry_backoff=0.5, max_backoff=30.0, flush_concurrency=1):
         self.es_url = es_url
         self.retry_delay = retry_delay
         self.bulk_size = bulk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.flush_concurrency = flush_concurrency
         self.es = None
+        self.serializer = BulkBodySerializer()
+        self._serializer_lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=flush_concurrency, thread_name_prefix="bulk-flush")
         self.connect()
 
     def connect(self):
+        # The client is imported on connect so importing main stays cheap
+        from elasticsearch import Elasticsearch
         while True:
             try:
                 logging.info(f"Attempting to connect to Elasticsearch at {self.es_url}")
                 self.es = Elasticsearch(
                     [self.es_url],
                     headers={"Content-Type": "application/json"},
-                    connections_per_node=10
+                    connections_per_node=10,
+                    # Retries happen per bulk request with backoff, see _send_bulk
+                    max_retries=0
                 )
             except Exception as e:
                 logging.error(f"Connection attempt failed: {e}")
@@ -43,37 +63,125 @@ class ElasticsearchStorage:
 
     async def bulk_index_data(self, data_list):
         loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            await loop.run_in_executor(pool, self._bulk_index_data_sync, data_list)
+        return await loop.run_in_executor(self.executor, self._bulk_index_data_sync, data_list)
+
+    def backoff_seconds(self, attempt):
+        delay = min(self.max_backoff, self.retry_backoff * (2 ** attempt))
+        # Jitter keeps concurrent flushes from retrying in lockstep
+        return delay * random.uniform(0.5, 1.0)
 
     def _bulk_index_data_sync(self, data_list):
-        actions = []
-        for data in data_list:
-            try:
-                if not isinstance(data['timestamp'], str):
-                    logging.error(f"Invalid timestamp format: {data['timestamp']}")
-                doc_id = f"{data['latitude']}-{data['longitude']}-{data['timestamp']}"
-                timestamp = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))
-                index_name = f"weather_data-{timestamp.strftime('%Y-%m-%d')}"
-                action = {
-                    "_index": index_name,
-                    "_id": doc_id,
-                    "_source": data
-                }
-                actions.append(action)
-            except AttributeError as e:
-                logging.error(f"Error preparing data for bulk indexing: {e}")
-                logging.error(f"Problematic data: {data}")
-            except Exception as e:
-                logging.error(f"Unexpected error preparing data for bulk indexing: {e}")
-                logging.error(f"Problematic data: {data}")
+        """
+        Indexes records and RecordBatches in one bulk request. Returns its
+        stats (records 0 when no row could be serialized), or None when the
+        request failed.
+        """
+        with self._serializer_lock:
+            body, count, serialize_seconds = self.serializer.serialize(data_list)
+        if not count:
+            return {"records": 0, "failed": 0, "rejected": 0, "retries": 0, "bytes": 0,
+                    "serialize_seconds": serialize_seconds, "network_seconds": 0.0}
+        with PROFILER.span('index'):
+            return self._send_bulk(body, count, serialize_seconds)
 
-        if actions:
+    def _send_bulk(self, body, count, serialize_seconds):
+        """
+        Sends a bulk body, retrying throttled or unavailable requests and
+        resending only the items rejected with a retryable status. Other item
+        errors (e.g. mapping conflicts) are counted as failed straight away,
+        and also as "rejected": sending them again cannot succeed.
+        """
+        from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+        pending = body
+        failed = 0
+        rejected_total = 0
+        network_seconds = 0.0
+        attempt = 0
+        while True:
+            started = time.perf_counter()
             try:
-                helpers.bulk(self.es, actions)
-                logging.info(f"Bulk indexed {len(actions)} records")
+                response = self.es.bulk(operations=pending)
+            except (ApiError, ConnectionError, ConnectionTimeout) as e:
+                network_seconds += time.perf_counter() - started
+                status = e.status_code if isinstance(e, ApiError) else None
+                if (status is None or status in RETRYABLE_STATUS) and attempt < self.max_retries:
+                    METRICS.inc('bulk_retries_total', reason=str(status or 'connection'))
+                    delay = self.backoff_seconds(attempt)
+                    logging.warning(f"Bulk request failed ({status or e}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                METRICS.inc('bulk_flush_errors_total')
+                logging.error(f"Error during bulk indexing: {e}")
+                if pending is body:
+                    return None
+                # Part of the body was indexed by earlier attempts
+                failed += pending.count(b"\n") // 2
+                break
             except Exception as e:
+                METRICS.inc('bulk_flush_errors_total')
                 logging.error(f"Error during bulk indexing: {e}")
+                return None
+            network_seconds += time.perf_counter() - started
+
+            retry_items, rejected = self.rejected_items(pending, response)
+            failed += rejected
+            rejected_total += rejected
+            if not retry_items:
+                break
+            if attempt >= self.max_retries:
+                failed += len(retry_items)
+                break
+            METRICS.inc('bulk_retries_total', reason='items')
+            METRICS.inc('bulk_retried_records_total', len(retry_items))
+            delay = self.backoff_seconds(attempt)
+            logging.warning(f"Bulk indexing throttled {len(retry_items)} records, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            pending = b"".join(retry_items)
+            attempt += 1
+
+        if failed:
+            METRICS.inc('bulk_failed_records_total', failed)
+            logging.error(f"Bulk indexing rejected {failed} of {count} records")
+        METRICS.observe('bulk_flush_records', count)
+        METRICS.observe('bulk_flush_bytes', len(body))
+        METRICS.observe('bulk_serialize_seconds', serialize_seconds)
+        METRICS.observe('bulk_flush_seconds', network_seconds)
+        METRICS.inc('records_indexed_total', count - failed)
+        METRICS.mark_progress('indexer')
+        logging.info(f"Bulk indexed {count - failed} records "
+                     f"(serialize {serialize_seconds * 1000:.1f} ms, network {network_seconds * 1000:.1f} ms, {len(body)} bytes)")
+        return {
+            "records": count,
+            "failed": failed,
+            "rejected": rejected_total,
+            "retries": attempt,
+            "bytes": len(body),
+            "serialize_seconds": serialize_seconds,
+            "network_seconds": network_seconds
+        }
+
+    @staticmethod
+    def rejected_items(body, response):
+        """
+        Returns the action/source line pairs of items rejected with a
+        retryable status and the number of items that failed otherwise.
+        """
+        if not response.get('errors'):
+            return [], 0
+        lines = body.split(b"\n")
+        retry_items = []
+        failed = 0
+        for i, item in enumerate(response.get('items', [])):
+            result = next(iter(item.values()))
+            if not result.get('error'):
+                continue
+            if result.get('status') in RETRYABLE_STATUS:
+                retry_items.append(lines[2 * i] + b"\n" + lines[2 * i + 1] + b"\n")
+            else:
+                failed += 1
+                logging.debug(f"Bulk item failed: {result['error']}")
+        return retry_items, failed
 
     def create_index(self, index_name):
         try:
@@ -89,4 +197,28 @@ class ElasticsearchStorage:
                 self.es.indices.delete(index=index_name)
                 logging.info(f"Deleted index: {index_name}")
         except Exception as e:
-            logging.error(f"Error deleting index: {e}")
\ No newline at end of file
+            logging.error(f"Error deleting index: {e}")
+
+    def begin_bulk_load(self, index_names):
+        """
+        Switches indices to BULK_LOAD_SETTINGS, creating the missing ones with
+        them. Returns {index: the settings replaced} for end_bulk_load.
+        """
+        previous = {}
+        for index_name in index_names:
+            if self.es.indices.exists(index=index_name):
+                settings = self.es.indices.get_settings(index=index_name)[index_name]['settings'].get('index', {})
+                previous[index_name] = {name: settings.get(name) for name in BULK_LOAD_SETTINGS}
+                self.es.indices.put_settings(index=index_name, settings={'index': BULK_LOAD_SETTINGS})
+            else:
+                self.es.indices.create(index=index_name, settings={'index': BULK_LOAD_SETTINGS})
+                previous[index_name] = {name: None for name in BULK_LOAD_SETTINGS}
+            logging.info(f"Index {index_name} set up for bulk loading")
+        return previous
+
+    def end_bulk_load(self, previous):
+        """Puts back the settings begin_bulk_load replaced (None is the cluster default) and refreshes the indices."""
+        for index_name, settings in previous.items():
+            self.es.indices.put_settings(index=index_name, settings={'index': settings})
+            self.es.indices.refresh(index=index_name)
+            logging.info(f"Index {index_name} restored after bulk loading")
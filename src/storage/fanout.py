@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import logging
+import queue
+import threading
+import time
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+
+POLICIES = ('block', 'drop')
+
+
+def record_count(records):
+    return sum(record.count_valid() if isinstance(record, RecordBatch) else 1 for record in records)
+
+
+class Delivery:
+    """
+    Calls on_done(failed) once every sink a bulk was handed to has written it
+    (or failed), with the names of the sinks that failed, empty when none did.
+    """
+
+    def __init__(self, sinks, on_done):
+        self.remaining = sinks
+        self.failed = set()
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        if not sinks:
+            on_done(self.failed)
+
+    def done(self, name, ok):
+        with self._lock:
+            if not ok:
+                self.failed.add(name)
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished:
+            self.on_done(self.failed)
+
+
+class Sink:
+    """
+    One destination of the fan-out: a bounded buffer of bulks and
+    `concurrency` writer threads calling write(records). When the buffer is
+    full, policy 'block' makes the producer wait (backpressure) and 'drop'
+    discards the bulk for this sink only.
+
+    Bulks are shared between sinks, so write() must not modify them.
+    """
+
+    def __init__(self, name, write, buffer=8, concurrency=1, policy='block', close=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy} for sink {name}, expected one of {', '.join(POLICIES)}")
+        self.name = name
+        self.write = write
+        self.concurrency = concurrency
+        self.policy = policy
+        self.close = close
+        self.queue = queue.Queue(maxsize=buffer)
+        self._threads = []
+        METRICS.register_collector(self.collect)
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._writer, name=f"sink-{self.name}-{i}", daemon=True)
+                         for i in range(self.concurrency)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def full(self):
+        return self.queue.full()
+
+    def put(self, records, on_written=None):
+        """
+        Buffers a bulk for this sink. on_written(ok) is called by the writer
+        once the bulk was written or failed.
+
+        Returns:
+            bool: False when the bulk was dropped.
+        """
+        count = record_count(records)
+        item = (time.monotonic(), records, count, on_written)
+        if self.policy == 'block':
+            self.queue.put(item)
+            return True
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            METRICS.inc('sink_dropped_records_total', count, sink=self.name)
+            logging.warning(f"Sink {self.name} is full, dropped {count} records")
+            return False
+        return True
+
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            enqueued, records, count, on_written = item
+            started = time.monotonic()
+            ok = False
+            try:
+                self.write(records)
+                ok = True
+                METRICS.inc('sink_records_total', count, sink=self.name)
+            except Exception as e:
+                METRICS.inc('sink_errors_total', sink=self.name)
+                logging.error(f"Sink {self.name} failed to write {count} records: {e}")
+            finally:
+                if on_written:
+                    try:
+                        on_written(ok)
+                    except Exception as e:
+                        logging.error(f"Sink {self.name} completion callback failed: {e}")
+                finished = time.monotonic()
+                METRICS.observe('sink_write_seconds', finished - started, sink=self.name)
+                # Time from the flush to the bulk being written, including the wait in the buffer
+                METRICS.observe('sink_lag_seconds', finished - enqueued, sink=self.name)
+                self.queue.task_done()
+
+    def pending(self):
+        """Bulks buffered or being written."""
+        return self.queue.unfinished_tasks
+
+    def collect(self):
+        return [('sink_buffered_batches', {'sink': self.name}, self.queue.qsize())]
+
+    def stop(self, timeout=30):
+        """Writes what is buffered, then stops the writers and closes the sink."""
+        for _ in self._threads:
+            self.queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        if self.close:
+            self.close()
+
+
+class FanOut:
+    """
+    Delivers every flushed bulk to a set of sinks. Each sink buffers and
+    writes on its own, so a slow sink only holds up the producer when its
+    policy is 'block' and its buffer is full.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = {sink.name: sink for sink in sinks}
+
+    def start(self):
+        for sink in self.sinks.values():
+            sink.start()
+        return self
+
+    def blocking(self):
+        """Names of the sinks with policy 'block', the ones a bulk is waited for."""
+        return [name for name, sink in self.sinks.items() if sink.policy == 'block']
+
+    async def bulk_index_data(self, records, on_done=None, only=None):
+        """
+        Hands a bulk to every sink, or only to the named ones (e.g. a replay
+        to the sinks that failed it). on_done(failed) is called once all
+        blocking sinks wrote it; dropping sinks are lossy by design and not
+        waited for.
+        """
+        loop = asyncio.get_running_loop()
+        sinks = [sink for name, sink in self.sinks.items() if only is None or name in only]
+        blocking = [sink for sink in sinks if sink.policy == 'block']
+        delivery = Delivery(len(blocking), on_done) if on_done else None
+        for sink in sinks:
+            on_written = functools.partial(delivery.done, sink.name) if delivery and sink.policy == 'block' else None
+            if sink.policy == 'block' and sink.full():
+                # Wait for room off the event loop
+                await loop.run_in_executor(None, sink.put, records, on_written)
+            else:
+                sink.put(records, on_written)
+
+    def put(self, records, exclude=()):
+        for name, sink in self.sinks.items():
+            if name not in exclude:
+                sink.put(records)
+
+    def pending(self):
+        return sum(sink.pending() for sink in self.sinks.values())
+
+    def stop(self, timeout=30):
+        for sink in self.sinks.values():
+            sink.stop(timeout)
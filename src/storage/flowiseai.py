@@ -1,17 +1,155 @@
+import collections
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+
+# Batches failing with these statuses (or a connection error) are retried with backoff
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
 class FlowiseAIStorage:
-    def __init__(self, api_url, api_key):
+    """
+    Forwards enriched records to a FlowiseAI endpoint. add() only appends to a
+    bounded buffer and never blocks, so a slow or unavailable agent cannot
+    hold up Elasticsearch indexing; when the buffer is full the oldest
+    records are dropped. Up to `concurrency` sender threads take batches of
+    batch_size records from the buffer and POST them as one JSON array over a
+    pooled session, retrying throttled and failed requests with backoff.
+    """
+
+    def __init__(self, api_url, api_key=None, batch_size=100, concurrency=2, buffer_size=10000,
+                 max_retries=3, retry_backoff=0.5, max_backoff=30.0, timeout=10):
         self.api_url = api_url
         self.api_key = api_key
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._stopped = False
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+        self._threads = [threading.Thread(target=self._sender, name=f"flowiseai-{i}", daemon=True)
+                         for i in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+        METRICS.register_collector(self.collect)
+
+    def add(self, data_list):
+        """
+        Queues records (dicts and/or RecordBatches) for forwarding.
+
+        Returns:
+            int: Number of buffered records that were dropped to make room.
+        """
+        records = []
+        for data in data_list:
+            if isinstance(data, RecordBatch):
+                records.extend(data.to_records())
+            else:
+                records.append(data)
+        with self._condition:
+            dropped = max(0, len(self.buffer) + len(records) - self.buffer.maxlen)
+            self.buffer.extend(records)
+            self._condition.notify_all()
+        if dropped:
+            METRICS.inc('flowiseai_dropped_records_total', dropped)
+            logging.warning(f"FlowiseAI buffer full, dropped {dropped} records")
+        return dropped
+
+    def pending(self):
+        """Records buffered or being sent."""
+        with self._condition:
+            return len(self.buffer) + self._in_flight
+
+    def collect(self):
+        return [('flowiseai_buffer_records', {}, len(self.buffer))]
+
+    def backoff_seconds(self, attempt):
+        delay = min(self.max_backoff, self.retry_backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _take_batch(self):
+        with self._condition:
+            while not self.buffer and not self._stopped:
+                self._condition.wait()
+            if not self.buffer:
+                return None
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+            self._in_flight += len(batch)
+            return batch
+
+    def _sender(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self.send_batch_data(batch)
+            except Exception as e:
+                METRICS.inc('flowiseai_failed_records_total', len(batch))
+                logging.error(f"Failed to send {len(batch)} records to FlowiseAI: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight -= len(batch)
+                    self._condition.notify_all()
 
     def send_data(self, data):
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
-        response = requests.post(self.api_url, json=data, headers=headers)
-        if response.status_code != 200:
-            raise Exception(f"Failed to send data to FlowiseAI: {response.status_code}, {response.text}")
+        self.send_batch_data([data])
 
     def send_batch_data(self, data_list):
-        for data in data_list:
-            self.send_data(data)
\ No newline at end of file
+        """
+        POSTs records as one JSON array, retrying connection errors and
+        RETRYABLE_STATUS responses. A 429 with Retry-After waits that long.
+        """
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.api_url, json=data_list, timeout=self.timeout)
+            except requests.RequestException as e:
+                status, error, retry_after = None, e, None
+            else:
+                METRICS.observe('flowiseai_request_seconds', time.perf_counter() - started)
+                if response.ok:
+                    METRICS.inc('flowiseai_sent_records_total', len(data_list))
+                    return
+                status = response.status_code
+                error = f"{status}, {response.text[:200]}"
+                retry_after = response.headers.get('Retry-After')
+            if (status is not None and status not in RETRYABLE_STATUS) or attempt >= self.max_retries:
+                raise Exception(f"Failed to send data to FlowiseAI: {error}")
+            delay = self.backoff_seconds(attempt)
+            if retry_after and retry_after.isdigit():
+                delay = min(self.max_backoff, float(retry_after))
+            METRICS.inc('flowiseai_retries_total', reason=str(status or 'connection'))
+            logging.warning(f"FlowiseAI request failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self, timeout=10):
+        """Sends what is buffered for up to `timeout` seconds, then stops the senders."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while (self.buffer or self._in_flight) and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            self._stopped = True
+            self.buffer.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.session.close()
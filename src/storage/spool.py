@@ -0,0 +1,298 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from storage.codec import as_batches, decode_batch, encode_batch
+from utils.metrics import METRICS
+
+# Entry header: payload length, sequence number, CRC32 of the payload
+HEADER = struct.Struct('<IQI')
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT = 'checkpoint'
+
+
+class Spool:
+    """
+    Append-only on-disk write-ahead log for flushed bulks, so records survive
+    a crash or an unavailable store.
+
+    Every bulk is appended as one entry per RecordBatch (the compact batch
+    encoding) with a sequence number and a checksum, to segment files named
+    after their first sequence number. Appends are fsynced in groups, at most
+    every fsync_interval seconds. Once every sink that must have a bulk wrote
+    it, its entries are acknowledged; the checkpoint file holds the highest
+    sequence number below which everything is acknowledged. Segments
+    entirely below it are deleted, and when the spool grows beyond max_bytes
+    (e.g. during a long store outage) the oldest segments are evicted.
+
+    On start, replay() reads the unacknowledged entries of the remaining
+    segments through mmap; entries a sink failed to write are nacked with the
+    names of the failed sinks and read back the same way for another attempt
+    at only those sinks. A torn entry at the end of a segment (a crash during
+    a write) is cut off on start, and writing always continues in a new
+    segment, never in one a previous run left behind.
+    """
+
+    def __init__(self, directory, segment_bytes=64 << 20, fsync_interval=1.0, max_bytes=1 << 30):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.committed = self._read_checkpoint()
+        self._acked = set()
+        self._failed = {}
+        self._checkpoint_written = self.committed
+        self._last_checkpoint = time.monotonic()
+        self._segments = self._existing_segments()
+        self._next_sequence = max(self.committed, self._recover()) + 1
+        self._file = None
+        self._file_bytes = 0
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+        METRICS.register_collector(self.collect)
+
+    # Segments and checkpoint
+
+    def _segment_path(self, first_sequence):
+        return os.path.join(self.directory, f"{first_sequence:020d}{SEGMENT_SUFFIX}")
+
+    def _existing_segments(self):
+        """[(first sequence, path)] in order."""
+        paths = sorted(glob.glob(os.path.join(self.directory, f"*{SEGMENT_SUFFIX}")))
+        return [(int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)]), path) for path in paths]
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT), 'r') as checkpoint_file:
+                return int(checkpoint_file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as checkpoint_file:
+            checkpoint_file.write(str(self.committed))
+        os.replace(path + '.tmp', path)
+        self._checkpoint_written = self.committed
+        self._last_checkpoint = time.monotonic()
+
+    def _recover(self):
+        """
+        Seals the segments a crash left behind: a torn tail (a crash during a
+        write) is cut off, and segments without an intact entry (e.g. a crash
+        right after a roll) are deleted, so new entries always go to a new
+        segment after the last intact one.
+
+        Returns:
+            int: The last intact sequence number, 0 when there is none.
+        """
+        last = 0
+        for first, path in list(self._segments):
+            intact = 0
+            for sequence, _, end in self._read_entries(path):
+                last, intact = sequence, end
+            if not intact:
+                logging.warning(f"Spool segment {path} holds no intact entry, deleting it")
+                os.remove(path)
+                self._segments.remove((first, path))
+            elif intact < os.path.getsize(path):
+                logging.warning(f"Spool segment {path} ends with a torn entry, cutting it off at {intact}")
+                with open(path, 'r+b') as segment_file:
+                    segment_file.truncate(intact)
+                    os.fsync(segment_file.fileno())
+        return last
+
+    @staticmethod
+    def read_segment(path):
+        """Yields (sequence, payload bytes) of the intact entries of a segment, read through mmap."""
+        for sequence, payload, _ in Spool._read_entries(path):
+            yield sequence, payload
+
+    @staticmethod
+    def _read_entries(path):
+        """read_segment(), with the offset each entry ends at."""
+        with open(path, 'rb') as segment_file:
+            size = os.fstat(segment_file.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    position = 0
+                    while position + HEADER.size <= size:
+                        length, sequence, checksum = HEADER.unpack_from(mapped, position)
+                        start = position + HEADER.size
+                        payload = view[start:start + length]
+                        if start + length > size or zlib.crc32(payload) != checksum:
+                            logging.warning(f"Spool segment {path} ends with a torn entry at {position}")
+                            payload.release()
+                            return
+                        # Copied, so the map can be closed while the caller still holds the payload
+                        yield sequence, bytes(payload), start + length
+                        payload.release()
+                        position = start + length
+                finally:
+                    view.release()
+
+    # Writing
+
+    def append(self, records):
+        """
+        Appends a bulk of records and/or RecordBatches.
+
+        Returns:
+            list: Sequence numbers of the entries written, to pass to ack().
+        """
+        entries = [encode_batch(batch) for batch in as_batches(records) if len(batch)]
+        sequences = []
+        with self._lock:
+            for payload in entries:
+                if self._file is None or self._file_bytes >= self.segment_bytes:
+                    self._roll()
+                sequence = self._next_sequence
+                self._next_sequence += 1
+                self._file.write(HEADER.pack(len(payload), sequence, zlib.crc32(payload)))
+                self._file.write(payload)
+                self._file_bytes += HEADER.size + len(payload)
+                sequences.append(sequence)
+            self._unsynced = self._unsynced or bool(entries)
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+        METRICS.inc('spool_appended_entries_total', len(sequences))
+        return sequences
+
+    def _roll(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        path = self._segment_path(self._next_sequence)
+        # Never appends to an existing segment, entries after a torn one would be unreadable
+        self._file = open(path, 'xb')
+        self._file_bytes = 0
+        self._segments.append((self._next_sequence, path))
+        self._enforce_retention()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            METRICS.inc('spool_fsyncs_total')
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    # Acknowledging and retention
+
+    def ack(self, sequences):
+        """Marks entries as written by every sink that needs them."""
+        with self._lock:
+            self._acked.update(sequences)
+            while self.committed + 1 in self._acked:
+                self.committed += 1
+                self._acked.discard(self.committed)
+            # Checkpointed at most every fsync_interval, a lost checkpoint only means replaying more
+            if self.committed != self._checkpoint_written and time.monotonic() - self._last_checkpoint >= self.fsync_interval:
+                self._checkpoint()
+
+    def nack(self, sequences, sinks):
+        """
+        Marks entries as failed in the named sinks; take_failed() hands them
+        out for another attempt.
+        """
+        with self._lock:
+            for sequence in sequences:
+                self._failed.setdefault(sequence, set()).update(sinks)
+
+    def take_failed(self):
+        """
+        Returns:
+            dict: Failed sequence numbers, in order, by the (frozen) set of sinks they failed in.
+        """
+        with self._lock:
+            failed = {}
+            for sequence in sorted(self._failed):
+                failed.setdefault(frozenset(self._failed[sequence]), []).append(sequence)
+            self._failed.clear()
+            return failed
+
+    def _checkpoint(self):
+        self._write_checkpoint()
+        self._delete_acknowledged()
+
+    def _delete_acknowledged(self):
+        # A segment is done when the next one starts at or below the checkpoint + 1
+        while len(self._segments) > 1 and self._segments[1][0] <= self.committed + 1:
+            _, path = self._segments.pop(0)
+            os.remove(path)
+
+    def _enforce_retention(self):
+        sizes = [os.path.getsize(path) for _, path in self._segments]
+        total = sum(sizes)
+        while len(self._segments) > 1 and total > self.max_bytes:
+            _, path = self._segments.pop(0)
+            total -= sizes.pop(0)
+            os.remove(path)
+            # Everything in the evicted segment is given up on
+            skipped = self._segments[0][0] - 1
+            if skipped > self.committed:
+                self._acked = {sequence for sequence in self._acked if sequence > skipped}
+                self.committed = skipped
+                self._write_checkpoint()
+            METRICS.inc('spool_evicted_segments_total')
+            logging.error(f"Spool exceeds {self.max_bytes} bytes, evicted unacknowledged segment {path}")
+
+    # Reading back
+
+    def replay(self, sequences=None):
+        """
+        Yields (sequence, RecordBatch) for every entry that is not
+        acknowledged, in order, or only for the given sequence numbers.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            segments = list(self._segments)
+            committed = self.committed
+            wanted = set(sequences) if sequences is not None else None
+        for index, (first, path) in enumerate(segments):
+            end = segments[index + 1][0] if index + 1 < len(segments) else None
+            if end is not None and (end - 1 <= committed or (wanted is not None and not any(first <= sequence < end for sequence in wanted))):
+                continue
+            for sequence, payload in self.read_segment(path):
+                if sequence > committed and (wanted is None or sequence in wanted):
+                    yield sequence, decode_batch(payload)
+
+    def pending(self):
+        """Entries appended but not acknowledged."""
+        with self._lock:
+            return self._next_sequence - 1 - self.committed
+
+    def collect(self):
+        with self._lock:
+            segments = list(self._segments)
+        size = 0
+        for _, path in segments:
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return [('spool_unacked_entries', {}, self.pending()),
+                ('spool_segments', {}, len(segments)),
+                ('spool_bytes', {}, size)]
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._checkpoint()
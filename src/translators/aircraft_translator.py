@@ -1,5 +1,5 @@
 import csv
-from datetime import datetime
+from utils.helpers import utc_isoformat
 
 def translate_wind_speed(wind_speed_kt):
     return float(wind_speed_kt) * 1.852 if wind_speed_kt else None  # Convert knots to km/h
@@ -12,7 +12,7 @@ def translate_temperature(temp_c):
 
 def translate_timestamp(observation_time):
     try:
-        return datetime.strptime(observation_time, '%Y-%m-%dT%H:%M:%SZ').isoformat() if observation_time else None
+        return utc_isoformat(observation_time) if observation_time else None
     except ValueError:
         print(f"Error parsing observation_time: {observation_time}")
         return None
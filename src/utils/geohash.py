@@ -0,0 +1,63 @@
+import numpy as np
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_ALPHABET = np.array(list(BASE32))
+
+
+def _bits(precision):
+    total = 5 * precision
+    # Bits alternate starting with longitude, so longitude gets the odd one
+    return (total + 1) // 2, total // 2
+
+
+def cell_size(precision):
+    """Returns (latitude degrees, longitude degrees) of a cell at this precision."""
+    lon_bits, lat_bits = _bits(precision)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def encode(latitudes, longitudes, precision=7):
+    """
+    Geohashes arrays of coordinates in one pass.
+
+    Returns:
+        numpy.ndarray: object array of geohash strings, None where a
+        coordinate is missing or out of range.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    lon_bits, lat_bits = _bits(precision)
+    valid = (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)
+    lat_cells = np.clip(np.floor((np.where(valid, latitudes, 0) + 90) / 180 * 2 ** lat_bits), 0, 2 ** lat_bits - 1).astype(np.int64)
+    lon_cells = np.clip(np.floor((np.where(valid, longitudes, 0) + 180) / 360 * 2 ** lon_bits), 0, 2 ** lon_bits - 1).astype(np.int64)
+
+    bits = np.empty((len(latitudes), 5 * precision), dtype=np.int64)
+    bits[:, 0::2] = (lon_cells[:, None] >> np.arange(lon_bits - 1, -1, -1)) & 1
+    bits[:, 1::2] = (lat_cells[:, None] >> np.arange(lat_bits - 1, -1, -1)) & 1
+    digits = bits.reshape(len(latitudes), precision, 5) @ np.array([16, 8, 4, 2, 1])
+    hashes = np.array([''.join(row) for row in _ALPHABET[digits]] if len(digits) else [], dtype=object)
+    hashes[~valid] = None
+    return hashes
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """
+    Returns the geohash prefixes of the cells covering a bounding box, at
+    the finest precision that needs at most max_cells cells.
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise ValueError("Bounding box must have min <= max (boxes across the antimeridian are not supported)")
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+    cells = ['']
+    for precision in range(1, 13):
+        lat_size, lon_size = cell_size(precision)
+        lat_steps = np.arange(np.floor((min_lat + 90) / lat_size), np.floor((max_lat + 90) / lat_size) + 1)
+        lon_steps = np.arange(np.floor((min_lon + 180) / lon_size), np.floor((max_lon + 180) / lon_size) + 1)
+        if len(lat_steps) * len(lon_steps) > max_cells:
+            break
+        lat_centers = np.minimum((lat_steps + 0.5) * lat_size - 90, 90)
+        lon_centers = np.minimum((lon_steps + 0.5) * lon_size - 180, 180)
+        grid_lat, grid_lon = np.meshgrid(lat_centers, lon_centers, indexing='ij')
+        cells = sorted(set(encode(grid_lat.ravel(), grid_lon.ravel(), precision)))
+    return cells
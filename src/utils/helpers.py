@@ -1,23 +1,24 @@
-def fetch_data_from_sources():
-    # Function to fetch data from all sources
-    pass
+from datetime import datetime, timezone
+from utils.record_batch import RecordBatch
+from utils.validation import Validator
 
-def translate_data(data):
-    # Function to translate data into standardized format
-    pass
+def validate_data(data, source=None):
+    # Validate translated records (dicts) or a RecordBatch with the shared validation stage, see utils/validation.py
+    if isinstance(data, RecordBatch):
+        return Validator().validate(data)
+    return Validator().validate(RecordBatch.from_records(data, source=source)).to_records()
 
-def store_data(data, storage_type):
-    # Function to store data in the specified storage type
-    pass
+def element_to_dict(element):
+    # Flatten the direct children of an XML element into a tag -> text mapping in a single pass.
+    # The children are walked last to first, so of repeated tags the first one wins, as with find()
+    return {child.tag: child.text for child in reversed(element)}
 
-def send_to_queue(data, queue_type):
-    # Function to send data to a message queue or FlowiseAI agent
-    pass
-
-def log_error(error_message):
-    # Function to log errors
-    pass
-
-def validate_data(data):
-    # Function to validate data before processing
-    pass
\ No newline at end of file
+def utc_isoformat(value):
+    # '2024-06-01T12:00:00Z' -> '2024-06-01T12:00:00'; fromisoformat is a lot cheaper than strptime.
+    # It also takes other ISO 8601 forms: those with an offset are converted to UTC, dates without a time are rejected.
+    if len(value) <= 10:
+        raise ValueError(f"Invalid observation time, no time of day: {value!r}")
+    parsed = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
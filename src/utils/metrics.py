@@ -0,0 +1,224 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "weather_lab_"
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe in-process registry of counters, gauges and summaries,
+    rendered in the Prometheus text exposition format. Stages report progress
+    with mark_progress() so stalled stages can be detected by the healthcheck.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._progress = {}
+        self._stall_after = {}
+        self._collectors = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def take_deltas(self):
+        """
+        Returns the counters and summaries recorded since the last call, and
+        the current gauges, and starts counting from zero: what a worker
+        process ships to the parent's registry, see merge().
+        """
+        with self._lock:
+            deltas = {'counters': self._counters, 'summaries': self._summaries, 'gauges': dict(self._gauges)}
+            self._counters = {}
+            self._summaries = {}
+        return deltas
+
+    def merge(self, deltas):
+        """Adds the deltas of another registry (take_deltas()) to this one."""
+        with self._lock:
+            for key, value in deltas['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (count, total, maximum) in deltas['summaries'].items():
+                summary = self._summaries.get(key)
+                if summary is None:
+                    self._summaries[key] = [count, total, maximum]
+                else:
+                    summary[0] += count
+                    summary[1] += total
+                    if maximum > summary[2]:
+                        summary[2] = maximum
+            self._gauges.update(deltas['gauges'])
+
+    def register_collector(self, collector):
+        """
+        Registers a callable evaluated on every scrape. It returns an iterable
+        of (name, labels dict, value) gauge samples, e.g. a queue depth.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def mark_progress(self, stage):
+        with self._lock:
+            self._progress[stage] = time.time()
+
+    def expect_progress(self, stage, max_age):
+        """
+        Allows a stage to go max_age seconds without progress before it is
+        reported as stalled, for stages slower than the global limit.
+        """
+        with self._lock:
+            self._stall_after[stage] = max_age
+
+    def stalled_stages(self, max_age, now=None):
+        now = now or time.time()
+        with self._lock:
+            return {stage: now - last for stage, last in self._progress.items()
+                    if now - last > max(max_age, self._stall_after.get(stage, 0))}
+
+    def value(self, name, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            if key in self._gauges:
+                return self._gauges[key]
+            summary = self._summaries.get(key)
+            return (summary[0], summary[1]) if summary else None
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            summaries = {key: list(value) for key, value in self._summaries.items()}
+            progress = dict(self._progress)
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[self._key(name, labels)] = value
+            except Exception as e:
+                logging.debug(f"Metrics collector failed: {e}")
+
+        lines = []
+        for kind, samples in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({key[0] for key in samples}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+                for (sample_name, labels), value in sorted(samples.items()):
+                    if sample_name == name:
+                        lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+        for name in sorted({key[0] for key in summaries}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} summary")
+            for (sample_name, labels), (count, total, maximum) in sorted(summaries.items()):
+                if sample_name == name:
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{METRIC_PREFIX}{name}_max{_format_labels(labels)} {maximum}")
+        if progress:
+            lines.append(f"# TYPE {METRIC_PREFIX}stage_last_progress_timestamp_seconds gauge")
+            for stage, last in sorted(progress.items()):
+                lines.append(f'{METRIC_PREFIX}stage_last_progress_timestamp_seconds{{stage="{stage}"}} {last}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class MetricsServer:
+    """
+    Serves /metrics (Prometheus text format) and /health on a local port.
+    /health answers 503 when a stage has not reported progress for
+    stall_seconds.
+    """
+
+    def __init__(self, metrics=METRICS, host="127.0.0.1", port=9108, stall_seconds=900):
+        self.metrics = metrics
+        self.stall_seconds = stall_seconds
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    self._send(200, server.metrics.render(), "text/plain; version=0.0.4")
+                elif self.path.startswith("/health"):
+                    stalled = server.metrics.stalled_stages(server.stall_seconds)
+                    body = json.dumps({
+                        "status": "stalled" if stalled else "ok",
+                        "stalled": {stage: round(age, 1) for stage, age in stalled.items()}
+                    })
+                    self._send(503 if stalled else 200, body, "application/json")
+                else:
+                    self._send(404, "Not found\n", "text/plain")
+
+            def _send(self, status, body, content_type):
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Metrics server: {format % args}")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"Metrics endpoint listening on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
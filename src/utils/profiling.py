@@ -0,0 +1,197 @@
+import atexit
+import contextlib
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("profiler", "stage", "source", "started")
+
+    def __init__(self, profiler, stage, source):
+        self.profiler = profiler
+        self.stage = stage
+        self.source = source
+
+    def __enter__(self):
+        self.profiler._stage_stack().append(self.stage)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.profiler._stage_stack().pop()
+        self.profiler._record(self.stage, self.source, elapsed)
+        return False
+
+
+class Profiler:
+    """
+    Per-stage timing spans plus an optional sampling profiler.
+
+    Spans record count/total/max wall time per (stage, source). The sampler
+    periodically captures the stack of every thread and files it under the
+    innermost stage that thread is in, producing folded stacks that
+    flamegraph.pl / speedscope can read. When disabled, span() returns a
+    shared no-op context manager.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_interval = 0.0
+        self.output_dir = "/tmp/weather-lab-profile"
+        self.max_stack_depth = 64
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_stages = {}
+        self._spans = {}
+        self._samples = Counter()
+        self._sample_count = 0
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def configure(self, enabled=True, sample_interval=0.0, output_dir=None):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        if output_dir:
+            self.output_dir = output_dir
+        return self
+
+    def span(self, stage, source=None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, source)
+
+    def _stage_stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            alive = {thread.ident for thread in threading.enumerate()}
+            with self._lock:
+                # Threads that exited (e.g. per-poll executor threads) are forgotten as new ones come
+                for ident in [ident for ident in self._thread_stages if ident not in alive]:
+                    del self._thread_stages[ident]
+                self._thread_stages[threading.get_ident()] = stack
+        return stack
+
+    def _record(self, stage, source, elapsed):
+        key = (stage, source or "-")
+        with self._lock:
+            span = self._spans.get(key)
+            if span is None:
+                self._spans[key] = [1, elapsed, elapsed]
+            else:
+                span[0] += 1
+                span[1] += elapsed
+                if elapsed > span[2]:
+                    span[2] = elapsed
+
+    def start_sampler(self):
+        if not self.enabled or self.sample_interval <= 0 or self._sampler is not None:
+            return
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        logging.info(f"Sampling profiler running every {self.sample_interval * 1000:.0f} ms")
+
+    def stop_sampler(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+            self._sampler = None
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self._lock:
+                stages = {ident: stack[-1] if stack else "idle" for ident, stack in self._thread_stages.items()}
+            folded = []
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_stack_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                names.append(stages.get(ident, "idle"))
+                folded.append(";".join(reversed(names)))
+            del frames
+            with self._lock:
+                self._samples.update(folded)
+                self._sample_count += 1
+
+    def _snapshot(self, locked=True):
+        """
+        (spans, samples, sample count) copies. Unlocked, the copies are single
+        C-level dict copies, atomic under the GIL, for use in signal handlers:
+        the signal may arrive while the interrupted thread holds the lock.
+        """
+        if not locked:
+            return dict(self._spans), dict(self._samples), self._sample_count
+        with self._lock:
+            return dict(self._spans), dict(self._samples), self._sample_count
+
+    @staticmethod
+    def _table(spans):
+        spans = sorted(spans.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [f"{'stage':<12} {'source':<16} {'count':>10} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for (stage, source), (count, total, maximum) in spans:
+            lines.append(f"{stage:<12} {source:<16} {count:>10} {total:>10.3f} {total / count * 1000:>10.3f} {maximum * 1000:>10.3f}")
+        return "\n".join(lines)
+
+    def summary_table(self):
+        return self._table(self._snapshot()[0])
+
+    def dump(self, output_dir=None, locked=True):
+        """
+        Writes summary.txt and folded stacks (all stages in profile.folded and
+        one <stage>.folded file per stage) to the output directory. Signal
+        handlers pass locked=False, see _snapshot().
+        """
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        spans, samples, sample_count = self._snapshot(locked)
+        table = self._table(spans)
+        with open(os.path.join(output_dir, "summary.txt"), "w") as f:
+            f.write(table + "\n")
+            f.write(f"\nsamples: {sample_count} at {self.sample_interval * 1000:.1f} ms\n")
+        per_stage = {}
+        for stack, count in samples.items():
+            per_stage.setdefault(stack.split(";", 1)[0], []).append(f"{stack} {count}")
+        with open(os.path.join(output_dir, "profile.folded"), "w") as f:
+            f.write("\n".join(line for lines in per_stage.values() for line in lines) + "\n")
+        for stage, lines in per_stage.items():
+            with open(os.path.join(output_dir, f"{stage}.folded"), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        logging.info(f"Profile written to {output_dir}\n{table}")
+
+    def install_handlers(self):
+        """
+        Dumps the profile on exit, on SIGUSR1 (and keeps running) and on
+        SIGTERM (then terminates as before).
+        """
+        atexit.register(self.dump)
+
+        # Handlers run on the main thread, which may hold the lock where it was interrupted
+        def dump_and_continue(signum, frame):
+            self.dump(locked=False)
+
+        def dump_and_terminate(signum, frame):
+            self.dump(locked=False)
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, dump_and_continue)
+        signal.signal(signal.SIGTERM, dump_and_terminate)
+
+
+PROFILER = Profiler()
@@ -0,0 +1,261 @@
+import json
+import numpy as np
+
+NESTED_SEPARATOR = "."
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _flatten(record, prefix=""):
+    for key, value in record.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}{NESTED_SEPARATOR}")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def _column_from_values(values):
+    present = [value for value in values if not _is_missing(value)]
+    if present and len(present) == len(values) and all(type(value) is int for value in present):
+        return np.array(values, dtype=np.int64)
+    if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return np.array([np.nan if _is_missing(value) else value for value in values], dtype=float)
+    column = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        column[index] = value
+    return column
+
+
+def _holds_ints(values):
+    """Whether the present values are all ints, so a float column of them is integral."""
+    present = [value for value in values if not _is_missing(value)]
+    return bool(present) and all(type(value) is int for value in present)
+
+
+# Encoded in place of a value json cannot serialize, the row is then skipped
+UNENCODABLE = object()
+
+
+def _encode_value(value):
+    try:
+        return json.dumps(value)
+    except (TypeError, ValueError):
+        return UNENCODABLE
+
+
+def _encode_column(values, integral=False):
+    """
+    Encodes a whole column to JSON value strings in one pass. Integral float
+    columns are written as ints.
+
+    Returns:
+        list: JSON text per row, None where the value is missing and
+        UNENCODABLE where it cannot be serialized.
+    """
+    if values.dtype.kind == 'f':
+        finite = np.isfinite(values)
+        if integral:
+            return [str(int(value)) if ok else None for value, ok in zip(values.tolist(), finite.tolist())]
+        return [repr(value) if ok else None for value, ok in zip(values.tolist(), finite.tolist())]
+    if values.dtype.kind in 'iu':
+        return [str(value) for value in values.tolist()]
+    if values.dtype.kind == 'b':
+        return ['true' if value else 'false' for value in values.tolist()]
+    return [None if _is_missing(value) else _encode_value(value) for value in values.tolist()]
+
+
+class RecordBatch:
+    """
+    Columnar batch of observations: one NumPy array per field plus a row
+    validity mask. Numeric fields are float64 with NaN for missing values,
+    everything else is an object array with None for missing values. Nested
+    fields (e.g. enrichment vectors) are stored flattened as "parent.child".
+    Int fields are int64, or float64 when values are missing; the latter are
+    listed in `integral` and read back as ints by values(), to_records() and
+    encoded_rows(), so e.g. document ids match those of the record dicts.
+
+    Dicts are only materialized by to_records() for APIs that need them.
+    """
+
+    def __init__(self, columns=None, valid=None, source=None, integral=()):
+        self.columns = dict(columns or {})
+        length = len(next(iter(self.columns.values()))) if self.columns else 0
+        self.valid = np.ones(length, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        self.source = source
+        self.integral = set(integral)
+
+    @classmethod
+    def from_records(cls, records, source=None):
+        flat_records = [dict(_flatten(record)) for record in records]
+        names = []
+        seen = set()
+        for record in flat_records:
+            for name in record:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        batch = cls.from_columns({name: [record.get(name) for record in flat_records] for name in names}, source=source)
+        if not names:
+            batch.valid = np.ones(len(flat_records), dtype=bool)
+        return batch
+
+    @classmethod
+    def from_columns(cls, columns, source=None):
+        """Builds a batch from plain lists per (flattened) field, e.g. decoded JSON."""
+        columns = {name: list(values) for name, values in columns.items()}
+        batch = cls({name: _column_from_values(values) for name, values in columns.items()}, source=source)
+        batch.integral = {name for name, values in columns.items()
+                          if batch.columns[name].dtype.kind == 'f' and _holds_ints(values)}
+        return batch
+
+    def __len__(self):
+        return len(self.valid)
+
+    def count_valid(self):
+        return int(self.valid.sum())
+
+    def column(self, name):
+        return self.columns[name]
+
+    def values(self, name):
+        """Column values as Python objects, ints for an integral column (NaN stays NaN)."""
+        values = self.columns[name].tolist()
+        if name in self.integral:
+            return [int(value) if value == value else value for value in values]
+        return values
+
+    def set_column(self, name, values):
+        self.integral.discard(name)
+        if not isinstance(values, np.ndarray):
+            values = list(values)
+            if _holds_ints(values):
+                self.integral.add(name)
+            values = _column_from_values(values)
+        values = np.asarray(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column {name} has {len(values)} rows, batch has {len(self)}")
+        if values.dtype.kind != 'f':
+            self.integral.discard(name)
+        self.columns[name] = values
+
+    def invalidate(self, mask):
+        """Marks the rows where mask is True as invalid."""
+        self.valid &= ~np.asarray(mask, dtype=bool)
+
+    def assign_rows(self, indices, rows):
+        """
+        Writes per-row dicts (possibly nested) into the columns at the given
+        row indices, creating columns as needed.
+        """
+        for index, row in zip(indices, rows):
+            for name, value in _flatten(row):
+                column = self.columns.get(name)
+                if column is None:
+                    numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+                    column = np.full(len(self), np.nan) if numeric else np.full(len(self), None, dtype=object)
+                    self.columns[name] = column
+                    if type(value) is int:
+                        self.integral.add(name)
+                if column.dtype.kind in 'iu' and type(value) is not int:
+                    column = column.astype(float)
+                    self.columns[name] = column
+                    self.integral.add(name)
+                if column.dtype.kind == 'f' and not isinstance(value, (int, float)) and value is not None:
+                    values = self.values(name)
+                    column = np.empty(len(self), dtype=object)
+                    for position, item in enumerate(values):
+                        column[position] = None if _is_missing(item) else item
+                    self.columns[name] = column
+                if value is not None and type(value) is not int:
+                    self.integral.discard(name)
+                column[index] = np.nan if value is None and column.dtype.kind == 'f' else value
+
+    def drop_invalid(self):
+        """Removes the invalid rows in place."""
+        if not self.valid.all():
+            self.columns = {name: values[self.valid] for name, values in self.columns.items()}
+            self.valid = np.ones(int(self.valid.sum()), dtype=bool)
+
+    def compact(self):
+        """Returns a new batch that only holds the valid rows."""
+        if self.valid.all():
+            return self
+        return RecordBatch({name: values[self.valid] for name, values in self.columns.items()}, source=self.source,
+                           integral=self.integral)
+
+    def split(self, size):
+        """Returns batches of at most size rows, views of this one's columns."""
+        if len(self) <= size:
+            return [self]
+        return [RecordBatch({name: values[start:start + size] for name, values in self.columns.items()},
+                            valid=self.valid[start:start + size], source=self.source, integral=self.integral)
+                for start in range(0, len(self), size)]
+
+    def to_records(self):
+        records = []
+        names = list(self.columns)
+        values = [self.values(name) for name in names]
+        for row in np.flatnonzero(self.valid).tolist():
+            record = {}
+            for name, column in zip(names, values):
+                value = column[row]
+                if _is_missing(value):
+                    continue
+                if NESTED_SEPARATOR in name:
+                    parent, child = name.split(NESTED_SEPARATOR, 1)
+                    record.setdefault(parent, {})[child] = value
+                else:
+                    record[name] = value
+            records.append(record)
+        return records
+
+    def encoded_rows(self):
+        """
+        Yields (row index, JSON object text) for every valid row, built
+        column by column without materializing a dict per row. The text is
+        None for a row with a value that cannot be serialized.
+        """
+        top_level = []
+        nested = {}
+        for name in self.columns:
+            if NESTED_SEPARATOR in name:
+                parent, child = name.split(NESTED_SEPARATOR, 1)
+                if parent not in nested:
+                    nested[parent] = []
+                    top_level.append((parent, None))
+                nested[parent].append((child, name))
+            else:
+                top_level.append((name, name))
+        encoded = {name: _encode_column(values, name in self.integral) for name, values in self.columns.items()}
+        keys = {name: json.dumps(name) + ':' for name in list(self.columns) + list(nested)}
+        children = {parent: [(json.dumps(child) + ':', encoded[name]) for child, name in members]
+                    for parent, members in nested.items()}
+        fields = []
+        for name, column_name in top_level:
+            if column_name is None:
+                fields.append((keys[name], None, children[name]))
+            else:
+                fields.append((keys[name], encoded[column_name], None))
+
+        unencodable = set()
+        for name, values in encoded.items():
+            if self.columns[name].dtype.kind == 'O':
+                unencodable.update(row for row, value in enumerate(values) if value is UNENCODABLE)
+
+        for row in np.flatnonzero(self.valid).tolist():
+            if row in unencodable:
+                yield row, None
+                continue
+            parts = []
+            for key, column, members in fields:
+                if column is not None:
+                    value = column[row]
+                    if value is not None:
+                        parts.append(key + value)
+                    continue
+                inner = [child_key + child_column[row] for child_key, child_column in members if child_column[row] is not None]
+                if inner:
+                    parts.append(key + '{' + ','.join(inner) + '}')
+            yield row, '{' + ','.join(parts) + '}'
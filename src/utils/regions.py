@@ -0,0 +1,174 @@
+"""
+Regions of interest: the bounding boxes and polygons records are kept in.
+
+A regions file (REGIONS_FILE) is a JSON list of regions, each a bounding
+box [min_lat, min_lon, max_lat, max_lon] (min_lon > max_lon crosses the
+antimeridian) or a polygon of [lat, lon] vertices:
+
+    [
+        {"name": "north-sea", "bbox": [50.0, -5.0, 62.0, 10.0]},
+        {"name": "caribbean", "polygon": [[10, -85], [25, -85], [25, -60], [10, -60]]}
+    ]
+
+The regions are indexed on a grid of cells: points in a cell that no region
+touches are rejected and points in a cell inside a box are accepted by one
+lookup, only the points of the remaining cells are tested against the
+regions around them.
+"""
+import json
+import math
+import numpy as np
+
+CELL_DEGREES = 1.0
+# Cell states of the index
+OUTSIDE, INSIDE, PARTIAL = 0, 1, 2
+
+
+def _as_floats(values):
+    """Coordinates as a float array, NaN where a value is missing or not a number."""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        floats = np.full(len(values), np.nan)
+        for index, value in enumerate(values):
+            try:
+                floats[index] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return floats
+
+
+def _in_polygon(latitudes, longitudes, vertices):
+    """Even-odd rule point in polygon test of arrays of points, a pass per edge."""
+    inside = np.zeros(len(latitudes), dtype=bool)
+    lat_b, lon_b = vertices[-1]
+    for lat_a, lon_a in vertices:
+        crosses = (lat_a > latitudes) != (lat_b > latitudes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = lon_a + (latitudes - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+        inside ^= crosses & (longitudes < at)
+        lat_b, lon_b = lat_a, lon_a
+    return inside
+
+
+class Region:
+    def __init__(self, name, bbox=None, polygon=None):
+        if (bbox is None) == (polygon is None):
+            raise ValueError(f"Region {name} needs either a bbox or a polygon")
+        self.name = name
+        self.polygon = None
+        if polygon is not None:
+            self.polygon = np.asarray(polygon, dtype=float)
+            if self.polygon.ndim != 2 or self.polygon.shape[1] != 2 or len(self.polygon) < 3:
+                raise ValueError(f"Region {name}: a polygon is a list of at least three [lat, lon] vertices")
+            bbox = [self.polygon[:, 0].min(), self.polygon[:, 1].min(), self.polygon[:, 0].max(), self.polygon[:, 1].max()]
+        if len(bbox) != 4 or bbox[0] > bbox[2]:
+            raise ValueError(f"Region {name}: a bbox is [min_lat, min_lon, max_lat, max_lon]")
+        self.bbox = tuple(float(value) for value in bbox)
+
+    def _lon_ranges(self):
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+
+    def in_bbox(self, latitudes, longitudes):
+        min_lat, _, max_lat, _ = self.bbox
+        inside = np.zeros(len(latitudes), dtype=bool)
+        for west, east in self._lon_ranges():
+            inside |= (longitudes >= west) & (longitudes <= east)
+        return inside & (latitudes >= min_lat) & (latitudes <= max_lat)
+
+    def contains(self, latitudes, longitudes):
+        inside = self.in_bbox(latitudes, longitudes)
+        if self.polygon is not None and inside.any():
+            candidates = np.nonzero(inside)[0]
+            inside[candidates] = _in_polygon(latitudes[candidates], longitudes[candidates], self.polygon)
+        return inside
+
+
+class Regions:
+    def __init__(self, regions, cell_degrees=CELL_DEGREES):
+        self.regions = list(regions)
+        self.cell_degrees = cell_degrees
+        rows, columns = int(math.ceil(180.0 / cell_degrees)), int(math.ceil(360.0 / cell_degrees))
+        self._cells = np.full((rows, columns), OUTSIDE, dtype=np.int8)
+        south = np.arange(rows) * cell_degrees - 90.0
+        west = np.arange(columns) * cell_degrees - 180.0
+        for region in self.regions:
+            min_lat, _, max_lat, _ = region.bbox
+            row_touch = (south <= max_lat) & (south + cell_degrees >= min_lat)
+            row_inside = (south >= min_lat) & (south + cell_degrees <= max_lat)
+            for min_lon, max_lon in region._lon_ranges():
+                column_touch = (west <= max_lon) & (west + cell_degrees >= min_lon)
+                column_inside = (west >= min_lon) & (west + cell_degrees <= max_lon)
+                touched = row_touch[:, None] & column_touch[None, :]
+                self._cells[touched & (self._cells == OUTSIDE)] = PARTIAL
+                if region.polygon is None:
+                    self._cells[row_inside[:, None] & column_inside[None, :]] = INSIDE
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as regions_file:
+            entries = json.load(regions_file)
+        return cls(Region(entry.get('name', f"region-{index}"), bbox=entry.get('bbox'), polygon=entry.get('polygon'))
+                   for index, entry in enumerate(entries))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def contains(self, latitudes, longitudes):
+        """Whether each point lies in one of the regions; False where a coordinate is missing."""
+        latitudes, longitudes = _as_floats(latitudes), _as_floats(longitudes)
+        known = np.isfinite(latitudes) & np.isfinite(longitudes)
+        rows = np.clip(np.floor((np.where(known, latitudes, 0.0) + 90.0) / self.cell_degrees), 0, self._cells.shape[0] - 1).astype(np.int64)
+        columns = np.clip(np.floor((np.where(known, longitudes, 0.0) + 180.0) / self.cell_degrees), 0, self._cells.shape[1] - 1).astype(np.int64)
+        states = np.where(known, self._cells[rows, columns], OUTSIDE)
+        inside = states == INSIDE
+        partial = np.nonzero(states == PARTIAL)[0]
+        if len(partial):
+            hits = np.zeros(len(partial), dtype=bool)
+            for region in self.regions:
+                remaining = np.nonzero(~hits)[0]
+                if not len(remaining):
+                    break
+                points = partial[remaining]
+                hits[remaining] = region.contains(latitudes[points], longitudes[points])
+            inside[partial] = hits
+        return inside
+
+    def intersects(self, min_lat, min_lon, max_lat, max_lon):
+        """Whether a bounding box may hold points of a region (it overlaps a region's bounding box)."""
+        for region in self.regions:
+            r_min_lat, _, r_max_lat, _ = region.bbox
+            if min_lat > r_max_lat or max_lat < r_min_lat:
+                continue
+            for west, east in region._lon_ranges():
+                if min_lon <= east and max_lon >= west:
+                    return True
+        return False
+
+    def filter(self, records, latitude='latitude', longitude='longitude'):
+        """
+        Splits dicts by their coordinates in one pass.
+
+        Returns:
+            tuple: (records inside a region or without coordinates, number outside).
+        """
+        if not records:
+            return records, 0
+        latitudes = _as_floats([record.get(latitude) for record in records])
+        longitudes = _as_floats([record.get(longitude) for record in records])
+        keep = self.contains(latitudes, longitudes) | ~(np.isfinite(latitudes) & np.isfinite(longitudes))
+        kept = [record for record, inside in zip(records, keep.tolist()) if inside]
+        return kept, len(records) - len(kept)
+
+
+_loaded = {}
+
+
+def load_regions(path):
+    """The regions of a file, loaded and indexed once per process; None without a file."""
+    if not path:
+        return None
+    if path not in _loaded:
+        _loaded[path] = Regions.load(path)
+    return _loaded[path]
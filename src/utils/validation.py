@@ -0,0 +1,136 @@
+"""
+Validation of whole RecordBatches, before they are enriched.
+
+A batch is checked a column at a time:
+
+- required fields (coordinates and timestamp) must be present, and the
+  coordinates in range; rows that fail are dropped,
+- CMEMS quality flags: a "<field>_qc" column masks the values of <field>
+  whose flag is not one of GOOD_QC_FLAGS ("position_qc" masks the
+  coordinates, so those rows are dropped), and is removed afterwards,
+- measurements outside VALUE_RANGES are cleared, the rest of the row is kept.
+
+Dropped rows are counted in records_dropped_total and cleared values in
+values_dropped_total, per source and reason.
+"""
+import numpy as np
+from utils.metrics import METRICS
+
+REQUIRED_FIELDS = ('latitude', 'longitude', 'timestamp')
+ROW_RANGES = {
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0),
+}
+VALUE_RANGES = {
+    'temperature': (-90.0, 60.0),
+    'dewpoint': (-90.0, 60.0),
+    'pressure': (870.0, 1085.0),
+    'wind_dir': (0.0, 360.0),
+    'wind_speed': (0.0, 500.0),
+}
+# Copernicus in-situ flags: good, probably good, value changed, nominal value, interpolated
+GOOD_QC_FLAGS = (1, 2, 5, 7, 8)
+QC_SUFFIX = '_qc'
+# QC columns that flag other columns than their name says
+QC_FIELDS = {'position': ('latitude', 'longitude')}
+
+
+def _missing(values):
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype.kind == 'O':
+        return np.equal(values, None)
+    return np.zeros(len(values), dtype=bool)
+
+
+def _numeric(values):
+    """A column as floats, NaN where a value is missing or not a number."""
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        pass
+    numbers = np.full(len(values), np.nan)
+    for index, value in enumerate(values.tolist()):
+        try:
+            numbers[index] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return numbers
+
+
+def _clear(batch, name, mask):
+    values = batch.columns[name]
+    if values.dtype.kind in 'iub':
+        if values.dtype.kind in 'iu':
+            batch.integral.add(name)
+        values = batch.columns[name] = values.astype(float)
+    values[mask] = np.nan if values.dtype.kind == 'f' else None
+
+
+def in_range(field, value):
+    """Whether a single value lies in the range of its field (always, for fields without one)."""
+    bounds = VALUE_RANGES.get(field) or ROW_RANGES.get(field)
+    return bounds is None or bounds[0] <= value <= bounds[1]
+
+
+class Validator:
+    def __init__(self, required=REQUIRED_FIELDS, row_ranges=None, value_ranges=None, good_qc_flags=GOOD_QC_FLAGS):
+        self.required = tuple(required)
+        self.row_ranges = dict(ROW_RANGES if row_ranges is None else row_ranges)
+        self.value_ranges = dict(VALUE_RANGES if value_ranges is None else value_ranges)
+        self.good_qc_flags = np.asarray(good_qc_flags, dtype=float)
+
+    def validate(self, batch):
+        """Drops the invalid rows of a batch in place, and returns it."""
+        source = batch.source or 'unknown'
+        invalid = ~batch.valid
+        reasons = {}
+
+        def drop(mask, reason):
+            new = mask & ~invalid
+            if new.any():
+                reasons[reason] = reasons.get(reason, 0) + int(new.sum())
+                invalid[new] = True
+
+        drop(self._apply_qc(batch, source), 'bad_qc')
+        for name in self.required:
+            values = batch.columns.get(name)
+            drop(np.ones(len(batch), dtype=bool) if values is None else _missing(values), f"missing_{name}")
+        for name, (low, high) in self.row_ranges.items():
+            values = batch.columns.get(name)
+            if values is not None:
+                numbers = _numeric(values)
+                drop(~_missing(values) & ~((numbers >= low) & (numbers <= high)), f"{name}_out_of_range")
+        for name, (low, high) in self.value_ranges.items():
+            values = batch.columns.get(name)
+            if values is None:
+                continue
+            numbers = _numeric(values)
+            outside = ~_missing(values) & ~((numbers >= low) & (numbers <= high))
+            if outside.any():
+                _clear(batch, name, outside)
+                METRICS.inc('values_dropped_total', int(outside.sum()), source=source, reason='out_of_range')
+
+        for reason, count in reasons.items():
+            METRICS.inc('records_dropped_total', count, source=source, reason=reason)
+        batch.valid = ~invalid
+        batch.drop_invalid()
+        return batch
+
+    def _apply_qc(self, batch, source):
+        """Clears the values with bad QC flags and removes the QC columns; returns the rows with a bad required field."""
+        failed = np.zeros(len(batch), dtype=bool)
+        for qc_name in [name for name in batch.columns if name.endswith(QC_SUFFIX)]:
+            flags = _numeric(batch.columns.pop(qc_name))
+            # Missing flags and fill values say nothing about the value
+            bad = (flags >= 0) & ~np.isin(flags, self.good_qc_flags)
+            if not bad.any():
+                continue
+            base = qc_name[:-len(QC_SUFFIX)]
+            for name in QC_FIELDS.get(base, (base,)):
+                if name in self.required:
+                    failed |= bad
+                elif name in batch.columns:
+                    _clear(batch, name, bad)
+                    METRICS.inc('values_dropped_total', int(bad.sum()), source=source, reason='bad_qc')
+        return failed
@@ -0,0 +1,138 @@
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_elasticsearch import FakeElasticsearch
+from backfill import Backfill, Throttle
+from storage.elasticsearch import ElasticsearchStorage
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures', 'meteostat')
+MISSING_STATION = "03772"
+
+
+class FakeMeteostat:
+    """Serves the fixture station list and hourly files, all but MISSING_STATION's."""
+
+    def __init__(self):
+        with open(os.path.join(FIXTURES, 'stations.json')) as fixture:
+            self.stations = gzip.compress(fixture.read().encode())
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests.append(self.path)
+                if self.path.endswith('lite.json.gz'):
+                    body = fake.stations
+                else:
+                    station_id = self.path.rsplit('/', 1)[-1].split('.')[0]
+                    path = os.path.join(FIXTURES, 'hourly', f"{station_id}.csv")
+                    if station_id == MISSING_STATION or not os.path.exists(path):
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    with open(path, 'rb') as hourly:
+                        # The downloader skips a header line
+                        body = gzip.compress(b"date,hour\n" + hourly.read())
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fixture_rows(day):
+    count = 0
+    for name in os.listdir(os.path.join(FIXTURES, 'hourly')):
+        if not name.startswith(MISSING_STATION):
+            with open(os.path.join(FIXTURES, 'hourly', name)) as hourly:
+                count += sum(1 for line in hourly if line.startswith(day))
+    return count
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.meteostat = FakeMeteostat()
+        self.elasticsearch = FakeElasticsearch().start()
+        self.storage = ElasticsearchStorage(es_url=self.elasticsearch.url, retry_backoff=0.001)
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, 'meteostat_config.json'), 'w') as config_file:
+            json.dump({
+                "base_url": self.meteostat.url,
+                "stations_url": f"{self.meteostat.url}/stations/lite.json.gz",
+                "output_directory": self.directory.name,
+                "enrichment": {"light_intensity": False, "influence": False},
+            }, config_file)
+
+    def tearDown(self):
+        self.storage.executor.shutdown()
+        self.elasticsearch.stop()
+        self.meteostat.stop()
+        self.directory.cleanup()
+
+    def backfill(self):
+        return Backfill(datetime(2024, 5, 27), datetime(2024, 5, 28), sources=['meteostat'], storage=self.storage,
+                        config_dir=self.directory.name, workers=3, bulk_size=20,
+                        checkpoint_path=os.path.join(self.directory.name, 'backfill.log'))
+
+    def test_backfill_resumes_and_restores_index_settings(self):
+        self.storage.es.indices.create(index="weather_data-2024-05-27", settings={"index": {"refresh_interval": "5s"}})
+        self.assertEqual(self.backfill().run(), 1)
+        # Only the range is loaded, the live one day window does not apply
+        self.assertEqual(self.elasticsearch.indices, {
+            "weather_data-2024-05-27": fixture_rows("2024-05-27"),
+            "weather_data-2024-05-28": fixture_rows("2024-05-28"),
+        })
+        self.assertEqual(self.elasticsearch.settings, {
+            "weather_data-2024-05-27": {"refresh_interval": "5s"},
+            "weather_data-2024-05-28": {},
+        })
+        self.assertEqual(sorted(self.elasticsearch.refreshed), ["weather_data-2024-05-27", "weather_data-2024-05-28"])
+        # Downloads stay apart from the live source's
+        self.assertTrue(os.path.isdir(os.path.join(self.directory.name, 'backfill', 'meteostat')))
+
+        # A second run only retries the station that failed
+        del self.meteostat.requests[:]
+        self.assertEqual(self.backfill().run(), 1)
+        self.assertEqual([path for path in self.meteostat.requests if '/hourly/' in path],
+                         [f"/hourly/{MISSING_STATION}.csv.gz"])
+        self.assertEqual(self.elasticsearch.indices["weather_data-2024-05-27"], fixture_rows("2024-05-27"))
+
+    def test_partly_written_units_are_not_checkpointed(self):
+        # Every item is throttled, beyond the bulk retries
+        self.elasticsearch.failure_rate = 1.0
+        backfill = self.backfill()
+        stations = len(backfill.units())
+        self.assertEqual(backfill.run(), stations)
+        self.assertEqual(backfill.checkpoint.done, set())
+
+    def test_throttle(self):
+        throttle = Throttle(100)
+        started = time.monotonic()
+        for _ in range(3):
+            throttle.wait(10)
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import json
+import numpy as np
+
+from storage.bulk_serializer import BulkBodySerializer
+from utils.record_batch import RecordBatch
+
+
+class TestBulkBodySerializer(unittest.TestCase):
+    def setUp(self):
+        self.serializer = BulkBodySerializer(initial_capacity=64)
+        self.records = [
+            {"timestamp": "2024-06-01T23:59:00", "latitude": 52.3, "longitude": 4.76, "temperature": float("nan")},
+            {"timestamp": "2024-06-02T00:00:00", "latitude": -33.9, "longitude": 151.2, "pressure": np.float32(1013.25)},
+        ]
+
+    def parse(self, body):
+        lines = body.decode("utf-8").splitlines()
+        return [(json.loads(lines[i]), json.loads(lines[i + 1])) for i in range(0, len(lines), 2)]
+
+    def test_renders_daily_indices_and_ids(self):
+        body, count, _ = self.serializer.serialize(self.records)
+        documents = self.parse(body)
+        self.assertEqual(count, 2)
+        self.assertEqual(documents[0][0], {"index": {"_index": "weather_data-2024-06-01", "_id": "52.3-4.76-2024-06-01T23:59:00"}})
+        self.assertEqual(documents[1][0]["index"]["_index"], "weather_data-2024-06-02")
+        self.assertIsNone(documents[0][1]["temperature"])
+        self.assertAlmostEqual(documents[1][1]["pressure"], 1013.25)
+
+    def test_batches_match_records(self):
+        records = [{k: v for k, v in record.items() if k in ("timestamp", "latitude", "longitude")} for record in self.records]
+        batch_body, _, _ = self.serializer.serialize([RecordBatch.from_records(records)])
+        record_body, _, _ = self.serializer.serialize(records)
+        self.assertEqual(batch_body, record_body)
+
+    def test_int_columns_with_gaps_keep_record_ids(self):
+        records = [
+            {"timestamp": "2024-06-01T12:00:00", "latitude": 52, "longitude": 4, "visibility": 9999},
+            {"timestamp": "2024-06-01T12:00:00", "latitude": None, "longitude": 151},
+            {"timestamp": "2024-06-01T12:00:00", "latitude": -33, "longitude": 151},
+        ]
+        batch = RecordBatch.from_records(records)
+        batch.invalidate([False, True, False])
+        batch_body, _, _ = self.serializer.serialize([batch])
+        record_body, _, _ = self.serializer.serialize([records[0], records[2]])
+        self.assertEqual(batch_body, record_body)
+        self.assertEqual(self.parse(batch_body)[0][0]["index"]["_id"], "52-4-2024-06-01T12:00:00")
+
+    def test_skips_invalid_records_and_reuses_buffer(self):
+        body, count, _ = self.serializer.serialize(self.records + [{"timestamp": None, "latitude": 0.0, "longitude": 0.0}])
+        self.assertEqual(count, 2)
+        buffer = self.serializer._buffer
+        self.serializer.serialize(self.records[:1])
+        self.assertIs(self.serializer._buffer, buffer)
+        self.assertEqual(len(self.parse(body)), 2)
+
+    def test_unserializable_value_drops_only_its_row(self):
+        records = [dict(record, station_id=station) for record, station in zip(self.records, ["EHAM", {"YSSY"}])]
+        body, count, _ = self.serializer.serialize([RecordBatch.from_records(records)])
+        self.assertEqual(count, 1)
+        self.assertEqual([source["station_id"] for _, source in self.parse(body)], ["EHAM"])
+
+
+if __name__ == '__main__':
+    unittest.main()
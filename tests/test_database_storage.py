@@ -0,0 +1,127 @@
+import unittest
+import json
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from storage.database import DatabaseStorage, sqlite_path
+from utils.record_batch import RecordBatch
+
+
+def metar(count):
+    return [{
+        "source": "metar",
+        "station_id": f"S{i}",
+        "latitude": 50.0 + i,
+        "longitude": 4.0 + i,
+        "timestamp": f"2024-06-01T{i:02d}:00:00",
+        "temperature": 20.0 + i,
+        "influence": {"sun": 0.5, "moon": 0.25}
+    } for i in range(count)]
+
+
+class FailingBegin:
+    """Connection whose BEGIN fails, e.g. on a locked or read-only database."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, *args):
+        if sql == 'BEGIN':
+            raise sqlite3.OperationalError("database is locked")
+        return self.connection.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class TestDatabaseStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'lab.db')}"
+        self.storage = DatabaseStorage(self.url)
+
+    def tearDown(self):
+        self.storage.close_connection()
+        self.directory.cleanup()
+
+    def test_sqlite_path(self):
+        self.assertEqual(sqlite_path('sqlite:///data.db'), 'data.db')
+        self.assertEqual(sqlite_path('sqlite:////var/lib/lab.db'), '/var/lib/lab.db')
+        with self.assertRaises(ValueError):
+            sqlite_path('postgresql://localhost/lab')
+
+    def test_per_source_tables_with_indexes(self):
+        batch = RecordBatch.from_records([{"latitude": 1.0, "longitude": 2.0, "timestamp": "2024-06-01T00:00:00",
+                                           "bx": 1.5}], source="space_weather")
+        stats = self.storage._bulk_index_data_sync(metar(3) + [batch])
+        self.assertEqual(stats["records"], 4)
+        self.assertNotIn("geohash", batch.columns)
+
+        connection = sqlite3.connect(sqlite_path(self.url))
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        connection.close()
+        self.assertEqual(tables, {"records_metar", "records_space_weather"})
+        self.assertIn("records_metar_source_timestamp", indexes)
+        self.assertIn("records_metar_geohash", indexes)
+        self.assertIn("records_metar_key", indexes)
+
+    def test_time_window_and_bbox_queries(self):
+        self.storage._bulk_index_data_sync(metar(10))
+        window = self.storage.fetch_data(start="2024-06-01T03:00:00", end="2024-06-01T06:00:00")
+        self.assertEqual([record["station_id"] for record in window], ["S3", "S4", "S5"])
+        self.assertEqual(window[0]["influence.sun"], 0.5)
+
+        boxed = self.storage.fetch_data(bbox=(51.5, 5.5, 54.0, 8.0), sources=["metar"])
+        self.assertEqual([record["station_id"] for record in boxed], ["S2", "S3", "S4"])
+        self.assertEqual(self.storage.fetch_data(sources=["aircraft"]), [])
+
+    def test_new_fields_add_columns_across_flushes(self):
+        self.storage._bulk_index_data_sync(metar(2))
+        self.storage._bulk_index_data_sync([dict(metar(3)[2], visibility=10.0)])
+        reopened = DatabaseStorage(self.url)
+        self.assertIn("visibility", reopened.columns["records_metar"])
+        self.assertEqual(len(reopened.fetch_data()), 3)
+        reopened.close_connection()
+
+    def test_replayed_records_replace_their_rows(self):
+        self.storage._bulk_index_data_sync(metar(3))
+        self.storage._bulk_index_data_sync([dict(metar(1)[0], temperature=-1.0)] + metar(3)[1:])
+        records = self.storage.fetch_data()
+        self.assertEqual(len(records), 3)
+        self.assertEqual([record["temperature"] for record in records if record["station_id"] == "S0"], [-1.0])
+
+    def test_rolled_back_columns_are_forgotten(self):
+        self.storage._bulk_index_data_sync(metar(1))
+        # The visibility column is added, then a malformed batch in the same bulk rolls it back
+        malformed = RecordBatch({"latitude": np.array([1.0]), "longitude": np.array([1.0, 2.0]),
+                                 "timestamp": np.array(["2024-06-01T00:00:00"], dtype=object)}, source="metar")
+        added = RecordBatch.from_records([dict(metar(2)[1], visibility=10.0)], source="metar")
+        self.assertIsNone(self.storage._bulk_index_data_sync([added, malformed]))
+        self.assertNotIn("visibility", self.storage.columns["records_metar"])
+        stats = self.storage._bulk_index_data_sync([dict(metar(2)[1], visibility=10.0)])
+        self.assertEqual(stats["records"], 1)
+
+    def test_lists_are_stored_as_json(self):
+        record = dict(metar(1)[0], conjunctions={"planets": ["Venus-Mars", "Moon-Sun"], "t": 0.5})
+        self.storage._bulk_index_data_sync([RecordBatch.from_records([record], source="metar")])
+        stored = self.storage.fetch_data()[0]["conjunctions.planets"]
+        self.assertEqual(json.loads(stored), ["Venus-Mars", "Moon-Sun"])
+
+    def test_failed_begin_reports_its_own_error(self):
+        connection = self.storage.connection
+        self.storage.connection = FailingBegin(connection)
+        try:
+            with self.assertLogs(level='ERROR') as logs:
+                self.assertIsNone(self.storage._bulk_index_data_sync(metar(1)))
+        finally:
+            self.storage.connection = connection
+        self.assertIn("database is locked", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_elasticsearch import FakeElasticsearch
+from main import store_writer
+from storage.elasticsearch import ElasticsearchStorage
+
+
+def records(count):
+    return [{
+        "latitude": 52.0 + i * 0.001,
+        "longitude": 4.0,
+        "timestamp": "2024-06-01T12:00:00Z",
+        "temperature": 20.0
+    } for i in range(count)]
+
+
+class TestElasticsearchStorage(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeElasticsearch(seed=32).start()
+        self.storage = ElasticsearchStorage(es_url=self.fake.url, retry_backoff=0.001)
+
+    def tearDown(self):
+        self.storage.executor.shutdown()
+        self.fake.stop()
+
+    def test_bulk_index(self):
+        stats = self.storage._bulk_index_data_sync(records(50))
+        self.assertEqual(stats["records"], 50)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(self.fake.indices, {"weather_data-2024-06-01": 50})
+
+    def test_nothing_to_index_is_not_a_failure(self):
+        stats = self.storage._bulk_index_data_sync([{"latitude": 52.0, "longitude": 4.0, "timestamp": None}])
+        self.assertEqual((stats["records"], stats["failed"]), (0, 0))
+        self.assertEqual(self.fake.stats()["bulk_requests"], 0)
+
+    def test_retries_only_rejected_items(self):
+        self.fake.failure_rate = 0.3
+        stats = self.storage._bulk_index_data_sync(records(100))
+        sent = self.fake.stats()
+        self.assertGreater(stats["retries"], 0)
+        self.assertEqual(sent["docs_indexed"], 100 - stats["failed"])
+        self.assertLess(sent["docs_indexed"] + sent["docs_failed"], 100 * (stats["retries"] + 1))
+
+    def test_non_retryable_items_fail(self):
+        self.fake.failure_rate = 1.0
+        self.fake.failure_status = 400
+        stats = self.storage._bulk_index_data_sync(records(10))
+        self.assertEqual((stats["failed"], stats["retries"]), (10, 0))
+
+    def test_throttled_requests_give_up_after_max_retries(self):
+        self.fake.throttle_rate = 1.0
+        self.assertIsNone(self.storage._bulk_index_data_sync(records(10)))
+        self.assertEqual(self.fake.stats()["throttled_requests"], self.storage.max_retries + 1)
+
+    def test_writer_fails_on_unwritten_records(self):
+        write = store_writer(self.storage)
+        # Throttled items are still rejected after max_retries: the bulk has to be written again
+        self.fake.failure_rate = 1.0
+        with self.assertRaises(RuntimeError):
+            write(records(10))
+        # Items rejected for good are counted, sending them again cannot help
+        self.fake.failure_status = 400
+        write(records(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import signal
+import time
+import unittest
+
+from enrichers.enrichment_pool import CONTEXT, EnrichmentPool
+from utils.metrics import METRICS
+
+
+class TestEnrichmentPool(unittest.TestCase):
+    def test_batches_are_enriched_by_workers(self):
+        output = CONTEXT.Queue()
+        enriched_batches = (METRICS.value('enrich_batch_seconds', source='metar') or (0, 0))[0]
+        pool = EnrichmentPool(output, workers=2, batch_size=2).start()
+        try:
+            records = [{
+                "latitude": 52.0 + i,
+                "longitude": 4.0,
+                "timestamp": "2024-06-01T12:00:00",
+                "temperature": 20.0 + i
+            } for i in range(5)]
+            self.assertEqual(pool.submit(records, 'metar'), 5)
+            batches = [output.get(timeout=120) for _ in range(3)]
+        finally:
+            pool.stop()
+
+        self.assertEqual(pool.pending(), 0)
+        # The workers' enrichment timings reach this process's registry
+        self.assertEqual(METRICS.value('enrich_batch_seconds', source='metar')[0] - enriched_batches, 3)
+        self.assertEqual(sorted(len(batch) for batch in batches), [1, 2, 2])
+        self.assertEqual({batch.source for batch in batches}, {'metar'})
+        enriched = [record for batch in batches for record in batch.to_records()]
+        self.assertEqual(sorted(record["temperature"] for record in enriched), [20.0, 21.0, 22.0, 23.0, 24.0])
+        for record in enriched:
+            self.assertIn("light_intensity", record)
+            self.assertIn("total_influence", record)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGKILL'), "needs SIGKILL")
+    def test_dead_worker_is_accounted_for_and_replaced(self):
+        output = CONTEXT.Queue()
+        pool = EnrichmentPool(output, workers=1, batch_size=10)
+        pool.check_interval = 0.05
+        pool.start()
+        dropped = METRICS.value('records_dropped_total', source='aircraft', reason='enrichment_worker_died') or 0
+        record = {"latitude": 52.0, "longitude": 4.0, "timestamp": "2024-06-01T12:00:00"}
+        try:
+            pool.submit([record] * 3, 'aircraft')
+            deadline = time.monotonic() + 60
+            while not pool._current[0].value and time.monotonic() < deadline:
+                time.sleep(0.001)
+            os.kill(pool._processes[0].pid, signal.SIGKILL)
+            while pool.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(pool.pending(), 0)
+            self.assertEqual(METRICS.value('records_dropped_total', source='aircraft', reason='enrichment_worker_died') - dropped, 3)
+
+            # The replacement enriches what comes next
+            pool.submit([record], 'aircraft')
+            self.assertEqual(len(output.get(timeout=120)), 1)
+        finally:
+            pool.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
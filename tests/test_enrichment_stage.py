@@ -0,0 +1,115 @@
+import json
+import os
+import queue
+import tempfile
+import unittest
+
+from data_sources.metar_data import MetarDataSource
+from enrichers.enrichment_stage import EnrichmentStage, resolve_plan
+from utils.record_batch import RecordBatch
+
+EPHEMERIS = 'de421.bsp'
+
+METARS = """<response><data>
+<METAR><station_id>EHAM</station_id><observation_time>2024-06-01T12:00:00Z</observation_time>
+<latitude>52.3</latitude><longitude>4.76</longitude><temp_c>18.0</temp_c></METAR>
+<METAR><station_id>YSSY</station_id><observation_time>2024-06-01T12:00:00Z</observation_time>
+<latitude>-33.9</latitude><longitude>151.2</longitude><temp_c>12.5</temp_c></METAR>
+<METAR><station_id>BAD</station_id><latitude>123.0</latitude><longitude>0</longitude></METAR>
+</data></response>"""
+
+
+def records():
+    return [
+        {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:00", "bz": 1.0},
+        {"latitude": 52.4, "longitude": 4.8, "timestamp": "2024-06-01T12:01:00", "bz": 2.0},
+    ]
+
+
+class TestEnrichmentPlans(unittest.TestCase):
+    def test_defaults_enrich_everything(self):
+        self.assertEqual(resolve_plan(None), {'light_intensity': {}, 'influence': {}})
+        self.assertEqual(resolve_plan({'light_intensity': False})['light_intensity'], None)
+
+    def test_invalid_plans(self):
+        for plan in ({'constellations': True},
+                     {'influence': {'precision': 3}},
+                     {'influence': {'mode': 'approximate'}},
+                     {'light_intensity': {'mode': 'exact'}},
+                     {'light_intensity': 'fast'},
+                     {'influence': {'bodies': ['Sun', 'Pluto']}}):
+            with self.assertRaises(ValueError, msg=plan):
+                resolve_plan(plan)
+
+    def test_light_intensity_only(self):
+        stage = EnrichmentStage({'metar': {'light_intensity': {'mode': 'fast'}, 'influence': False}})
+        enriched = stage.enrich(records(), 'metar').to_records()
+        self.assertGreater(enriched[0]['light_intensity'], 0.5)
+        self.assertNotIn('total_influence', enriched[0])
+
+    def test_sources_with_the_same_settings_share_an_enricher(self):
+        plan = {'influence': {'mode': 'grid', 'grid_degrees': 5}}
+        stage = EnrichmentStage({'metar': plan, 'aircraft': plan, 'cmems': {'influence': {'mode': 'grid'}}})
+        self.assertIs(stage.enricher('metar'), stage.enricher('aircraft'))
+        self.assertIsNot(stage.enricher('metar'), stage.enricher('cmems'))
+        self.assertEqual(stage.enricher('metar').grid_degrees, 5)
+
+    def test_shipped_plans(self):
+        config_dir = os.path.join(os.path.dirname(__file__), '..', 'src', 'config')
+        plans = {}
+        for name in ('metar', 'aircraft', 'cmems', 'meteostat', 'space_weather'):
+            with open(os.path.join(config_dir, f'{name}_config.json')) as config_file:
+                plans[name] = json.load(config_file)['enrichment']
+        stage = EnrichmentStage(plans)
+        meteostat = stage.enricher('meteostat')
+        self.assertEqual((meteostat.influence_mode, meteostat.grid_bucket_seconds, meteostat.grid_cache_size), ('grid', 3600, 32))
+        # Everything else keeps the exact fields, and every source the conjunctions
+        self.assertEqual(stage.enricher('space_weather').influence_mode, 'batch')
+        for name in ('metar', 'aircraft', 'cmems'):
+            self.assertEqual(stage.enricher(name).influence_mode, 'exact', name)
+        self.assertTrue(all(stage.plan(name)['influence'].get('conjunctions', True) for name in plans))
+        # The high-volume sources opt into the analytic light intensity
+        self.assertEqual([name for name in plans if stage.plan(name)['light_intensity'].get('mode') == 'fast'],
+                         ['metar', 'meteostat'])
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_once_per_location_and_bucket_with_selected_bodies(self):
+        stage = EnrichmentStage({'space_weather': {
+            'light_intensity': False,
+            'influence': {'mode': 'batch', 'bucket_seconds': 60, 'bodies': ['Sun', 'moon'], 'conjunctions': False},
+        }})
+        # A later reading at the first position, in the same minute
+        batch = records() + [dict(records()[0], timestamp="2024-06-01T12:00:40", bz=3.0)]
+        enriched = stage.enrich(batch, 'space_weather').to_records()
+        self.assertNotIn('light_intensity', enriched[0])
+        self.assertEqual(set(enriched[0]) - set(records()[0]), {'Sun', 'Moon', 'total_influence'})
+        # Shared within the position and minute, and the total leaves out the Sun
+        self.assertEqual(enriched[0]['Moon'], enriched[2]['Moon'])
+        self.assertNotEqual(enriched[0]['Moon'], enriched[1]['Moon'])
+        self.assertEqual(enriched[0]['total_influence']['t'], enriched[0]['Moon']['t'])
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_source_enriches_with_its_plan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, 'metar_config.json')
+            with open(config_path, 'w') as config_file:
+                json.dump({'url': 'http://localhost/metars', 'enrichment': {
+                    'influence': {'mode': 'grid', 'grid_degrees': 5, 'bodies': ['Jupiter', 'Saturn']}}}, config_file)
+            output = queue.Queue()
+            source = MetarDataSource(config_path=config_path, queue=output)
+            source.parse_data(METARS)
+
+        batch = output.get_nowait()
+        self.assertTrue(output.empty())
+        self.assertIsInstance(batch, RecordBatch)
+        enriched = batch.to_records()
+        self.assertEqual([record['station_id'] for record in enriched], ['EHAM', 'YSSY'])
+        for record in enriched:
+            self.assertIn('light_intensity', record)
+            self.assertIn('Jupiter', record)
+            self.assertNotIn('Moon', record)
+            self.assertIn('conjunctions', record)
+
+
+if __name__ == '__main__':
+    unittest.main()
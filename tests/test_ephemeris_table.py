@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from enrichers.ephemeris_table import MAX_POSITION_ERROR_KM, EphemerisTable, build_table, skyfield_times
+from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.record_batch import RecordBatch
+
+EPHEMERIS = 'de421.bsp'
+START = float(np.datetime64('2024-06-01T00:00:00', 's').astype(np.int64))
+
+
+@unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+class TestEphemerisTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'ephemeris.tbl')
+        build_table(cls.path, START, START + 86400, step=60)
+        cls.enricher = SolarSystemInfluence(ephemeris_table=cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_position_error_against_skyfield(self):
+        table = EphemerisTable(self.path)
+        self.assertEqual(table.bodies, self.enricher.planet_names)
+        seconds = START + np.random.default_rng(3).uniform(0, 86400, 300)
+        positions = table.positions_at(seconds)
+        origin = self.enricher.earth.at(skyfield_times(self.enricher.ts, seconds))
+        for index, body in enumerate(table.bodies):
+            reference = origin.observe(self.enricher.planets[body]).position.km.T
+            self.assertLess(np.abs(positions[:, index] - reference).max(), MAX_POSITION_ERROR_KM, body)
+
+    def test_times_outside_the_table(self):
+        table = EphemerisTable(self.path)
+        self.assertEqual(table.covers([START - 1, START, START + 86400, START + 86401]).tolist(),
+                         [False, True, True, False])
+        with self.assertRaises(ValueError):
+            table.positions_at([START + 86401])
+
+    def test_not_a_table(self):
+        path = os.path.join(self.directory.name, 'other.tbl')
+        with open(path, 'wb') as other:
+            other.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            EphemerisTable(path)
+
+    def test_enrich_batch_matches_skyfield(self):
+        records = [
+            {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:30"},
+            {"latitude": -33.9, "longitude": 151.2, "timestamp": "2024-06-01T23:59:59Z"},
+            # Outside the table, enriched through skyfield
+            {"latitude": 10.0, "longitude": -60.0, "timestamp": "2024-06-03T06:00:00"},
+        ]
+        batch = self.enricher.enrich_batch(RecordBatch.from_records(records))
+        enriched = batch.to_records()
+        for record, result in zip(records, enriched):
+            expected = self.enricher.get_influence_at_location(
+                dict(record, timestamp=record["timestamp"].rstrip("Z")))
+            self.assertEqual(result["conjunctions"]["planets"], expected["conjunctions"]["planets"])
+            for name in self.enricher.output_names + ['total_influence']:
+                # Up to the aberration of light, and the light time skyfield applies to the Earth's own centre
+                for axis in "xyzt":
+                    self.assertAlmostEqual(result[name][axis], expected[name][axis], delta=expected[name]["t"] * 2e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import time
+
+from storage.fanout import FanOut, Sink
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+
+
+class Recorder:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.bulks = []
+
+    def write(self, records):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("sink down")
+        self.bulks.append(records)
+
+
+def bulks(count, size=3):
+    return [[{"station_id": f"S{i}-{j}"} for j in range(size)] for i in range(count)]
+
+
+class TestFanOut(unittest.TestCase):
+    def test_slow_dropping_sink_does_not_hold_up_others(self):
+        fast, slow = Recorder(), Recorder(delay=0.2)
+        fanout = FanOut([Sink('fast-store', fast.write, buffer=20),
+                         Sink('slow-agent', slow.write, buffer=1, policy='drop')]).start()
+        started = time.monotonic()
+
+        async def flush_all():
+            for records in bulks(10):
+                await fanout.bulk_index_data(records)
+        asyncio.run(flush_all())
+        self.assertLess(time.monotonic() - started, 0.2)
+        fanout.stop()
+
+        self.assertEqual(len(fast.bulks), 10)
+        self.assertLess(len(slow.bulks), 10)
+        self.assertEqual(METRICS.value('sink_dropped_records_total', sink='slow-agent'), 3 * (10 - len(slow.bulks)))
+        self.assertEqual(METRICS.value('sink_records_total', sink='fast-store'), 30)
+        lag_count, _ = METRICS.value('sink_lag_seconds', sink='fast-store')
+        self.assertEqual(lag_count, 10)
+
+    def test_blocking_sink_applies_backpressure(self):
+        store = Recorder(delay=0.05)
+        fanout = FanOut([Sink('blocking-store', store.write, buffer=1, concurrency=1)]).start()
+        started = time.monotonic()
+        for records in bulks(5):
+            fanout.put(records)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        fanout.stop()
+        self.assertEqual(len(store.bulks), 5)
+        self.assertEqual(fanout.pending(), 0)
+
+    def test_failed_writes_are_counted(self):
+        fanout = FanOut([Sink('broken-store', Recorder(fail=True).write)]).start()
+        fanout.put([RecordBatch.from_records([{"a": 1.0}, {"a": 2.0}])])
+        fanout.stop()
+        self.assertEqual(METRICS.value('sink_errors_total', sink='broken-store'), 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Sink('store', Recorder().write, policy='spill')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage.flowiseai import FlowiseAIStorage
+from utils.record_batch import RecordBatch
+
+
+class FakeFlowise:
+    """Records the batches POSTed to it; answers with the queued statuses first, then 200."""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.batches = []
+        self.requests = 0
+        self.authorization = None
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(fake.delay)
+                with fake.lock:
+                    fake.requests += 1
+                    fake.authorization = self.headers.get('Authorization')
+                    status = fake.statuses.pop(0) if fake.statuses else 200
+                    if status == 200:
+                        fake.batches.append(body)
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v1/prediction/flow"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def records(count):
+    return [{"station_id": f"S{i}", "temperature": 20.0 + i} for i in range(count)]
+
+
+class TestFlowiseAIStorage(unittest.TestCase):
+    def setUp(self):
+        self.fake = None
+
+    def tearDown(self):
+        if self.fake:
+            self.fake.stop()
+
+    def test_records_are_sent_in_batches(self):
+        self.fake = FakeFlowise()
+        storage = FlowiseAIStorage(self.fake.url, api_key='secret', batch_size=10, concurrency=2)
+        storage.add(records(15) + [RecordBatch.from_records(records(10), source='metar')])
+        storage.close()
+        sent = [record for batch in self.fake.batches for record in batch]
+        self.assertEqual(len(sent), 25)
+        self.assertTrue(all(len(batch) <= 10 for batch in self.fake.batches))
+        self.assertEqual(self.fake.authorization, 'Bearer secret')
+
+    def test_retries_throttled_and_failed_requests(self):
+        self.fake = FakeFlowise(statuses=[429, 503])
+        storage = FlowiseAIStorage(self.fake.url, batch_size=5, concurrency=1, retry_backoff=0.001)
+        storage.send_batch_data(records(5))
+        self.assertEqual((self.fake.requests, len(self.fake.batches)), (3, 1))
+
+    def test_client_errors_are_not_retried(self):
+        self.fake = FakeFlowise(statuses=[400])
+        storage = FlowiseAIStorage(self.fake.url, concurrency=1, retry_backoff=0.001)
+        with self.assertRaises(Exception):
+            storage.send_batch_data(records(1))
+        self.assertEqual(self.fake.requests, 1)
+
+    def test_full_buffer_drops_oldest_without_blocking(self):
+        self.fake = FakeFlowise(delay=0.2)
+        storage = FlowiseAIStorage(self.fake.url, batch_size=5, concurrency=1, buffer_size=10)
+        started = time.monotonic()
+        dropped = sum(storage.add(records(10)) for _ in range(5))
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertGreater(dropped, 0)
+        self.assertLessEqual(storage.pending(), 15)
+        storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from utils import geohash
+
+
+class TestGeohash(unittest.TestCase):
+    def test_encode_matches_reference_hashes(self):
+        hashes = geohash.encode([57.64911, 42.6, float('nan')], [10.40744, -5.6, 4.0], precision=11)
+        self.assertEqual(hashes.tolist(), ['u4pruydqqvj', 'ezs42e44yx9', None])
+        self.assertEqual(geohash.encode([42.6], [-5.6], precision=5).tolist(), ['ezs42'])
+
+    def test_cover_contains_every_point_in_the_box(self):
+        prefixes = geohash.cover(51.9, 3.9, 52.6, 5.2)
+        self.assertLessEqual(len(prefixes), 32)
+        points = geohash.encode([51.9, 52.0, 52.6, 52.3], [3.9, 5.2, 5.2, 4.5], precision=7)
+        for point in points:
+            self.assertTrue(any(point.startswith(prefix) for prefix in prefixes), point)
+
+    def test_cover_rejects_antimeridian_boxes(self):
+        with self.assertRaises(ValueError):
+            geohash.cover(0, 170, 10, -170)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from import_time import IMPORT_BUDGET_SECONDS, measure_import, total_seconds, heavy_imports, parse_importtime
+
+
+class TestImportTime(unittest.TestCase):
+    def test_parse_importtime(self):
+        output = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |     utils.metrics\n"
+                  "import time:      2000 |       2120 | main\n")
+        self.assertEqual(parse_importtime(output), [('utils.metrics', 0.00012, 0.00012, 2), ('main', 0.002, 0.00212, 0)])
+
+    def test_main_import_budget(self):
+        entries = measure_import('main')
+        self.assertEqual(heavy_imports(entries), [])
+        self.assertLess(total_seconds(entries, 'main'), IMPORT_BUDGET_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+
+from data_sources.inactive_stations import InactiveStations
+
+
+class TestInactiveStations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'inactive_stations.log')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reprobe_schedule(self):
+        stations = InactiveStations(self.path, retry_seconds=100, max_retry_seconds=300)
+        self.assertTrue(stations.due('A', now=0))
+        stations.mark_failed('A', now=1000)
+        self.assertFalse(stations.due('A', now=1099))
+        self.assertTrue(stations.due('A', now=1100))
+        stations.mark_failed('A', now=1100)
+        self.assertEqual(stations.next_probe('A'), 1300)
+        stations.mark_failed('A', now=1300)
+        stations.mark_failed('A', now=1600)
+        # Capped at max_retry_seconds
+        self.assertEqual(stations.next_probe('A'), 1900)
+        stations.mark_active('A')
+        self.assertTrue(stations.due('A', now=1601))
+        self.assertNotIn('A', stations)
+
+    def test_changes_are_written_on_flush(self):
+        stations = InactiveStations(self.path)
+        stations.mark_failed('A', now=10)
+        stations.mark_failed('B', now=20)
+        stations.mark_failed('B', now=30)
+        self.assertFalse(os.path.exists(self.path))
+        stations.flush()
+        stations.mark_active('A')
+        stations.flush()
+        with open(self.path, 'a') as log_file:
+            log_file.write('{"id": "C", "fail')
+
+        reloaded = InactiveStations(self.path)
+        self.assertEqual(reloaded.stations, {'B': (2, 30)})
+        reloaded.compact()
+        with open(self.path) as log_file:
+            self.assertEqual([json.loads(line) for line in log_file], [{'id': 'B', 'failures': 2, 'last_failure': 30}])
+
+    def test_legacy_list_is_imported(self):
+        legacy = os.path.join(self.directory.name, 'inactive_stations.json')
+        with open(legacy, 'w') as legacy_file:
+            json.dump(['A', 'B'], legacy_file)
+        stations = InactiveStations(self.path, legacy_path=legacy)
+        self.assertEqual(sorted(stations.stations), ['A', 'B'])
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(sorted(InactiveStations(self.path).stations), ['A', 'B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import unittest
+
+import numpy as np
+
+from enrichers.influence_grid import InfluenceGrid, grid_nodes
+from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+
+EPHEMERIS = 'de421.bsp'
+
+
+class TestInfluenceGrid(unittest.TestCase):
+    def test_interpolation(self):
+        latitudes, longitudes = grid_nodes(90)
+        self.assertEqual(latitudes.tolist(), [-90.0, 0.0, 90.0])
+        self.assertEqual(longitudes.tolist(), [-180.0, -90.0, 0.0, 90.0, 180.0])
+        # A field linear in latitude and longitude is interpolated exactly
+        field = latitudes[:, None, None, None] + 2 * longitudes[None, :, None, None] + np.zeros((1, 1, 1, 3))
+        grid = InfluenceGrid(0.0, 90, field, np.zeros((3, 5, 1)))
+        vectors, separations = grid.interpolate([45.0, -10.0, 0.0], [45.0, 170.0, -180.0], [0.0, 0.0, 0.0])
+        self.assertEqual(vectors.shape, (3, 1, 3))
+        self.assertEqual(separations.shape, (3, 1))
+        np.testing.assert_allclose(vectors[:, 0, 0], [135.0, 330.0, -360.0])
+
+    def test_records_are_rotated_to_the_bucket_time(self):
+        field = np.zeros((3, 5, 1, 3))
+        field[:, 2] = 1.0  # longitude 0
+        grid = InfluenceGrid(0.0, 90, field, np.zeros((3, 5, 1)))
+        # Six sidereal hours later, longitude -90 faces where longitude 0 did
+        seconds = 90 / (360.98564736629 / 86400.0)
+        vectors, _ = grid.interpolate([0.0], [-90.0], [seconds])
+        self.assertAlmostEqual(vectors[0, 0, 0], 1.0)
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_grid_enrichment_matches_exact(self):
+        enricher = SolarSystemInfluence(influence_mode='grid', grid_degrees=2.5)
+        exact = SolarSystemInfluence(influence_mode='exact')
+        records = [
+            {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:05"},
+            {"latitude": -33.9, "longitude": 151.2, "timestamp": "2024-06-01T12:00:55Z"},
+            {"latitude": 71.0, "longitude": -179.9, "timestamp": "2024-06-01T12:01:30"},
+            {"latitude": 0.0, "longitude": 0.0, "timestamp": "not a time"},
+        ]
+        batch = enricher.enrich_batch(RecordBatch.from_records(records))
+        enriched = batch.to_records()
+
+        self.assertEqual(len(enricher._grids), 2)
+        errors = [grid.error for grid in enricher._grids.values()]
+        # The reported interpolation error at 2.5 degrees
+        self.assertTrue(all(0 < error < 1e-3 for error in errors))
+        for record, result in zip(records[:3], enriched):
+            expected = exact.get_influence_at_location(dict(record, timestamp=record["timestamp"].rstrip("Z")))
+            self.assertEqual(result["conjunctions"]["planets"], expected["conjunctions"]["planets"])
+            for name in exact.output_names + ['total_influence']:
+                difference = np.linalg.norm([result[name][axis] - expected[name][axis] for axis in "xyz"])
+                # Interpolation, plus the aberration of light (about 1e-4) the grid leaves out
+                self.assertLess(difference, expected[name]["t"] * (max(errors) + 3e-4), name)
+        # Without a time the record is enriched as before (an empty influence)
+        self.assertNotIn("total_influence", enriched[3])
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_hourly_batches_build_each_grid_once(self):
+        enricher = SolarSystemInfluence(influence_mode='grid', grid_degrees=30, grid_bucket_seconds=3600)
+        enricher.grid_error_samples = 4
+        enricher.grid_cache_size = 4
+        # Two days of hourly rows, in no particular order, more buckets than the cache holds
+        hours = [hour for _ in range(2) for hour in range(48)]
+        batch = RecordBatch.from_records([{"latitude": 52.3, "longitude": 4.76,
+                                           "timestamp": f"2024-06-{1 + hour // 24:02d}T{hour % 24:02d}:00:00"}
+                                          for hour in hours[::-1]])
+
+        misses = METRICS.value('enricher_cache_misses_total', cache='influence_grid') or 0
+        enricher.enrich_batch(batch, light_intensity=False)
+        self.assertEqual(METRICS.value('enricher_cache_misses_total', cache='influence_grid') - misses, 48)
+        # The cap holds
+        self.assertEqual(len(enricher._grids), 4)
+
+if __name__ == '__main__':
+    unittest.main()
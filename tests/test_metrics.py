@@ -0,0 +1,63 @@
+import unittest
+import json
+import time
+import urllib.request
+import urllib.error
+
+from utils.metrics import Metrics, MetricsServer
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        metrics = Metrics()
+        metrics.inc('records_parsed_total', 3, source='metar')
+        metrics.inc('records_parsed_total', source='metar')
+        metrics.observe('fetch_seconds', 0.5, source='metar')
+        metrics.observe('fetch_seconds', 1.5, source='metar')
+        metrics.register_collector(lambda: [('queue_depth', {}, 7)])
+        text = metrics.render()
+        self.assertIn('# TYPE weather_lab_records_parsed_total counter', text)
+        self.assertIn('weather_lab_records_parsed_total{source="metar"} 4', text)
+        self.assertIn('weather_lab_fetch_seconds_count{source="metar"} 2', text)
+        self.assertIn('weather_lab_fetch_seconds_sum{source="metar"} 2.0', text)
+        self.assertIn('weather_lab_queue_depth 7', text)
+
+    def test_deltas_are_merged(self):
+        worker, parent = Metrics(), Metrics()
+        parent.inc('enricher_cache_hits_total', 2, cache='influence_grid')
+        worker.inc('enricher_cache_hits_total', 3, cache='influence_grid')
+        worker.observe('enrich_batch_seconds', 0.5, source='metar')
+        parent.merge(worker.take_deltas())
+        worker.observe('enrich_batch_seconds', 1.5, source='metar')
+        parent.merge(worker.take_deltas())
+        self.assertEqual(parent.value('enricher_cache_hits_total', cache='influence_grid'), 5)
+        self.assertEqual(parent.value('enrich_batch_seconds', source='metar'), (2, 2.0))
+
+    def test_stalled_stages(self):
+        metrics = Metrics()
+        metrics.mark_progress('source:metar')
+        self.assertEqual(metrics.stalled_stages(60), {})
+        self.assertIn('source:metar', metrics.stalled_stages(60, now=time.time() + 120))
+        metrics.expect_progress('source:metar', 3600)
+        self.assertEqual(metrics.stalled_stages(60, now=time.time() + 120), {})
+
+    def test_health_endpoint(self):
+        metrics = Metrics()
+        server = MetricsServer(metrics, port=0, stall_seconds=60).start()
+        try:
+            url = f"http://127.0.0.1:{server.port}"
+            metrics.mark_progress('indexer')
+            with urllib.request.urlopen(f"{url}/health") as response:
+                self.assertEqual(json.load(response)['status'], 'ok')
+            metrics._progress['indexer'] -= 120
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f"{url}/health")
+            self.assertEqual(context.exception.code, 503)
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                self.assertIn(b'stage_last_progress_timestamp_seconds{stage="indexer"}', response.read())
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+
+from utils.profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_disabled_spans_are_no_ops(self):
+        profiler = Profiler()
+        with profiler.span('parse', 'metar'):
+            pass
+        self.assertEqual(profiler._spans, {})
+
+    def test_spans_and_folded_stacks(self):
+        profiler = Profiler().configure(sample_interval=0.001)
+        profiler.start_sampler()
+        try:
+            with profiler.span('enrich', 'metar'):
+                deadline = time.perf_counter() + 0.05
+                while time.perf_counter() < deadline:
+                    pass
+        finally:
+            profiler.stop_sampler()
+
+        count, total, _ = profiler._spans[('enrich', 'metar')]
+        self.assertEqual(count, 1)
+        self.assertGreaterEqual(total, 0.05)
+        self.assertIn('enrich', profiler.summary_table())
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler.dump(output_dir)
+            with open(os.path.join(output_dir, 'enrich.folded')) as f:
+                line = f.readline()
+            self.assertTrue(line.startswith('enrich;'))
+            self.assertTrue(line.rstrip().rsplit(' ', 1)[1].isdigit())
+            self.assertTrue(os.path.exists(os.path.join(output_dir, 'summary.txt')))
+
+    def test_dump_from_a_signal_handler_while_the_lock_is_held(self):
+        profiler = Profiler().configure()
+        with profiler.span('parse', 'metar'):
+            pass
+        with tempfile.TemporaryDirectory() as output_dir, profiler._lock:
+            # What a handler does when the signal interrupts _record on the same thread
+            profiler.dump(output_dir, locked=False)
+            with open(os.path.join(output_dir, 'summary.txt')) as f:
+                self.assertIn('parse', f.read())
+
+    def test_exited_threads_are_forgotten(self):
+        profiler = Profiler().configure()
+
+        def poll():
+            with profiler.span('fetch', 'metar'):
+                pass
+        for _ in range(3):
+            thread = threading.Thread(target=poll)
+            thread.start()
+            thread.join()
+        # Only the last poll thread's stack is left, the earlier ones were pruned on registration
+        self.assertLessEqual(len(profiler._thread_stages), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
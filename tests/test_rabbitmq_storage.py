@@ -0,0 +1,140 @@
+import unittest
+import math
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_elasticsearch import FakeElasticsearch
+from fake_rabbitmq import FakeRabbitMQ
+from main import WeatherLab
+from storage.elasticsearch import ElasticsearchStorage
+from storage.rabbitmq import RabbitMQStorage, decode_batch, encode_batch
+from utils.record_batch import RecordBatch
+
+
+def records(count, offset=0):
+    return [{
+        "latitude": 52.0 + (offset + i) * 0.001,
+        "longitude": 4.0,
+        "timestamp": "2024-06-01T12:00:00",
+        "station_id": f"S{offset + i}",
+        "temperature": 20.0 if i % 2 else None,
+        "wind": {"speed": offset + i, "dir": 90}
+    } for i in range(count)]
+
+
+class TestBatchEncoding(unittest.TestCase):
+    def test_round_trip_keeps_valid_rows(self):
+        batch = RecordBatch.from_records(records(4), source='metar')
+        batch.invalidate([False, True, False, False])
+        decoded = decode_batch(encode_batch(batch))
+        self.assertEqual(decoded.source, 'metar')
+        self.assertEqual(decoded.to_records(), batch.to_records())
+        self.assertTrue(math.isnan(decoded.column('temperature')[0]))
+        self.assertEqual(decoded.column('wind.speed').dtype.kind, 'i')
+
+    def test_columnar_body_is_smaller_than_records(self):
+        batch = RecordBatch.from_records(records(200), source='metar')
+        self.assertLess(len(encode_batch(batch)), len(repr(batch.to_records())) / 5)
+
+
+class TestRabbitMQStorage(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeRabbitMQ(idle_timeout=0.2)
+
+    def storage(self, **kwargs):
+        return RabbitMQStorage(connect=self.broker.connect, retry_delay=0, **kwargs)
+
+    def consume_all(self, handler, consumers=1, prefetch_count=4, **kwargs):
+        storages = [self.storage(prefetch_count=prefetch_count, **kwargs) for _ in range(consumers)]
+        threads = [threading.Thread(target=storage.consume, args=(handler,)) for storage in storages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        for storage in storages:
+            storage.close()
+
+    def test_submit_publishes_confirmed_batches(self):
+        publisher = self.storage(batch_size=10)
+        self.assertEqual(publisher.submit(records(25), 'metar'), 25)
+        self.assertTrue(publisher.channel.confirming)
+        stats = self.broker.stats()
+        self.assertEqual((stats["published"], stats["declares"], stats["depth"]), (3, 3, 3))
+
+    def test_publish_reconnects(self):
+        publisher = self.storage()
+        self.broker.publish_failures = 1
+        publisher.publish_batch(RecordBatch.from_records(records(3), source='metar'))
+        self.assertEqual(self.broker.depth('weather_records'), 1)
+
+    def test_workers_share_the_queue(self):
+        self.storage(batch_size=5).submit(records(100), 'metar')
+        seen = []
+        lock = threading.Lock()
+
+        def handler(batch):
+            with lock:
+                seen.extend(batch.column('station_id').tolist())
+
+        self.consume_all(handler, consumers=3, prefetch_count=2)
+        self.assertEqual(sorted(seen), sorted(f"S{i}" for i in range(100)))
+        stats = self.broker.stats()
+        self.assertEqual((stats["acked"], stats["depth"]), (20, 0))
+
+    def test_failed_batch_is_retried_until_it_succeeds(self):
+        self.storage(batch_size=5).submit(records(10), 'metar')
+        attempts = []
+
+        def handler(batch):
+            attempts.append(batch.column('station_id')[0])
+            # Fails twice, e.g. while Elasticsearch is down
+            if batch.column('station_id')[0] == 'S5' and attempts.count('S5') <= 2:
+                raise ValueError("bulk request failed")
+
+        self.consume_all(handler, retry_seconds=0.01)
+        self.assertEqual(attempts.count('S0'), 1)
+        self.assertEqual(attempts.count('S5'), 3)
+        stats = self.broker.stats()
+        self.assertEqual((stats["acked"], stats["dead_lettered"], stats["depth"]), (4, 2, 0))
+
+    def test_batch_is_parked_after_max_attempts(self):
+        self.storage(batch_size=5).submit(records(10), 'metar')
+        attempts = []
+
+        def handler(batch):
+            attempts.append(batch.column('station_id')[0])
+            if batch.column('station_id')[0] == 'S5':
+                raise ValueError("bulk request failed")
+
+        self.consume_all(handler, retry_seconds=0.01, max_attempts=3)
+        self.assertEqual(attempts.count('S5'), 3)
+        self.assertEqual(self.broker.depth('weather_records'), 0)
+        parked = self.broker.queues['weather_records.dead']
+        self.assertEqual(len(parked), 1)
+        self.assertEqual(decode_batch(parked[0][0]).column('station_id')[0], 'S5')
+        self.assertEqual(parked[0][1].headers['attempts'], 3)
+
+
+class TestDistributedWeatherLab(unittest.TestCase):
+    def test_worker_enriches_and_indexes_published_batches(self):
+        broker = FakeRabbitMQ(idle_timeout=0.5)
+        fake_es = FakeElasticsearch().start()
+        try:
+            RabbitMQStorage(connect=broker.connect, batch_size=4).submit(records(10), 'metar')
+            storage = ElasticsearchStorage(es_url=fake_es.url)
+            worker = WeatherLab(elasticsearch_storage=storage, mode='worker',
+                                broker=RabbitMQStorage(connect=broker.connect))
+            self.assertEqual(worker.data_sources, {})
+            worker.run_worker()
+            storage.executor.shutdown()
+        finally:
+            fake_es.stop()
+        self.assertEqual(fake_es.indices, {"weather_data-2024-06-01": 10})
+        self.assertEqual(broker.stats()["acked"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import json
+import numpy as np
+
+from utils.record_batch import RecordBatch
+
+
+class TestRecordBatch(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            {"timestamp": "2024-06-01T12:00:00", "latitude": 52.3, "longitude": 4.76, "station_id": "EHAM", "source": "metar"},
+            {"timestamp": "2024-06-02T00:30:00", "latitude": -33.9, "longitude": 151.2, "temperature": 12.5, "source": "metar"},
+        ]
+
+    def test_round_trip(self):
+        batch = RecordBatch.from_records(self.records, source="metar")
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.column("latitude").dtype, np.float64)
+        self.assertEqual(batch.to_records(), self.records)
+
+    def test_invalid_rows_are_not_materialized(self):
+        batch = RecordBatch.from_records(self.records)
+        batch.invalidate(batch.column("latitude") < 0)
+        self.assertEqual(batch.count_valid(), 1)
+        self.assertEqual(batch.to_records(), self.records[:1])
+        self.assertEqual(len(batch.compact()), 1)
+
+    def test_int_columns_with_gaps_stay_ints(self):
+        records = [{"latitude": 52, "visibility": 9999}, {"latitude": 53}]
+        batch = RecordBatch.from_records(records)
+        self.assertEqual(batch.column("visibility").dtype, np.float64)
+        self.assertEqual(batch.values("visibility")[0], 9999)
+        self.assertIsInstance(batch.values("visibility")[0], int)
+        self.assertEqual([json.loads(text) for _, text in batch.encoded_rows()], records)
+        self.assertEqual(batch.split(1)[0].to_records(), records[:1])
+        batch.assign_rows([1], [{"visibility": 2.5}])
+        self.assertEqual(batch.values("visibility"), [9999.0, 2.5])
+
+    def test_nested_rows_encode_as_json(self):
+        batch = RecordBatch.from_records(self.records)
+        batch.assign_rows([0, 1], [
+            {"Sun": {"x": 1e-5, "t": 2.0}, "conjunctions": {"planets": ["Venus-Mars"], "t": 0.5}},
+            {"Sun": {"x": None, "t": 1.0}, "conjunctions": {"planets": [], "t": 0.0}},
+        ])
+        encoded = [json.loads(text) for _, text in batch.encoded_rows()]
+        self.assertEqual(encoded, batch.to_records())
+        self.assertEqual(encoded[0]["Sun"], {"x": 1e-5, "t": 2.0})
+        self.assertEqual(encoded[1]["Sun"], {"t": 1.0})
+        self.assertNotIn("station_id", encoded[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
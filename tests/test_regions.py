@@ -0,0 +1,67 @@
+import json
+import os
+import queue
+import tempfile
+import unittest
+
+import numpy as np
+
+from config import Config
+from data_sources.metar_data import MetarDataSource
+from utils.metrics import METRICS
+from utils.regions import Region, Regions
+
+METARS = """<response><data>
+<METAR><station_id>EHAM</station_id><observation_time>2024-06-01T12:00:00Z</observation_time>
+<latitude>52.3</latitude><longitude>4.76</longitude><temp_c>18.0</temp_c></METAR>
+<METAR><station_id>YSSY</station_id><observation_time>2024-06-01T12:00:00Z</observation_time>
+<latitude>-33.9</latitude><longitude>151.2</longitude><temp_c>12.5</temp_c></METAR>
+</data></response>"""
+
+
+class TestRegions(unittest.TestCase):
+    def setUp(self):
+        self.regions = Regions([
+            Region('north-sea', bbox=[50.0, -5.0, 62.0, 10.0]),
+            Region('pacific', bbox=[-20.0, 170.0, 10.0, -170.0]),
+            Region('triangle', polygon=[[10.0, -80.0], [30.0, -80.0], [10.0, -60.0]]),
+        ], cell_degrees=2.0)
+
+    def test_contains(self):
+        inside = self.regions.contains([52.3, 0.0, 0.0, 15.0, 25.0, -33.9, None], [4.76, 179.0, -175.0, -75.0, -65.0, 151.2, 4.0])
+        self.assertEqual(inside.tolist(), [True, True, True, True, False, False, False])
+
+    def test_index_matches_the_regions(self):
+        rng = np.random.default_rng(0)
+        latitudes, longitudes = rng.uniform(-90, 90, 20000), rng.uniform(-180, 180, 20000)
+        expected = np.zeros(len(latitudes), dtype=bool)
+        for region in self.regions.regions:
+            expected |= region.contains(latitudes, longitudes)
+        np.testing.assert_array_equal(self.regions.contains(latitudes, longitudes), expected)
+        self.assertTrue(self.regions.intersects(55.0, 8.0, 70.0, 20.0))
+        self.assertFalse(self.regions.intersects(-60.0, 0.0, -50.0, 20.0))
+
+    def test_source_drops_records_outside(self):
+        with tempfile.TemporaryDirectory() as directory:
+            regions_path = os.path.join(directory, 'regions.json')
+            with open(regions_path, 'w') as regions_file:
+                json.dump([{"name": "europe", "bbox": [35.0, -10.0, 60.0, 20.0]}], regions_file)
+            config_path = os.path.join(directory, 'metar_config.json')
+            with open(config_path, 'w') as config_file:
+                json.dump({'url': 'http://localhost/metars',
+                           'enrichment': {'light_intensity': False, 'influence': False}}, config_file)
+            original, Config.REGIONS_FILE = Config.REGIONS_FILE, regions_path
+            try:
+                output = queue.Queue()
+                source = MetarDataSource(config_path=config_path, queue=output)
+            finally:
+                Config.REGIONS_FILE = original
+
+        dropped = METRICS.value('records_dropped_total', source='metar', reason='out_of_region') or 0
+        source.parse_data(METARS)
+        self.assertEqual([record['station_id'] for record in output.get_nowait().to_records()], ['EHAM'])
+        self.assertEqual(METRICS.value('records_dropped_total', source='metar', reason='out_of_region'), dropped + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from data_sources import registry
+from data_sources.base import DataSource
+from data_sources.scheduler import Scheduler
+
+
+class CountingSource(DataSource):
+    def __init__(self, poll_interval, fail=False):
+        self.load_schedule({'poll_interval': poll_interval})
+        self.polls = 0
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def poll(self):
+        with self.lock:
+            self.polls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        if self.fail:
+            raise RuntimeError("feed unavailable")
+
+
+class TestRegistry(unittest.TestCase):
+    def test_discover_and_skip_disabled(self):
+        with tempfile.TemporaryDirectory() as config_dir:
+            with open(os.path.join(config_dir, 'metar_config.json'), 'w') as f:
+                json.dump({"enabled": False, "url": "http://localhost/metars.xml.gz"}, f)
+            with open(os.path.join(config_dir, 'unknown_config.json'), 'w') as f:
+                json.dump({}, f)
+            discovered = registry.discover(config_dir)
+            self.assertEqual(list(discovered), ['metar'])
+            self.assertEqual(discovered['metar'][0], registry.DATA_SOURCES['metar'])
+            self.assertEqual(registry.load_sources(config_dir, queue=None), {})
+
+
+class TestScheduler(unittest.TestCase):
+    def test_polls_on_interval_without_overlap(self):
+        frequent = CountingSource(0.02)
+        once = CountingSource(0)
+        failing = CountingSource(0.02, fail=True)
+        scheduler = Scheduler({'frequent': frequent, 'once': once, 'failing': failing}, max_workers=2).start()
+        time.sleep(0.3)
+        scheduler.stop(wait=True)
+        self.assertGreaterEqual(frequent.polls, 4)
+        self.assertEqual(frequent.max_active, 1)
+        self.assertEqual(once.polls, 1)
+        self.assertGreaterEqual(failing.polls, 4)
+
+    def test_idle_after_one_shot_sources(self):
+        scheduler = Scheduler({'once': CountingSource(0)}).start()
+        deadline = time.monotonic() + 2
+        while not scheduler.idle() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(scheduler.idle())
+        scheduler.stop()
+
+    def test_stop_while_submitting(self):
+        pool = concurrent.futures.ThreadPoolExecutor
+        errors = []
+        scheduler = Scheduler({'once': CountingSource(0)})
+
+        class StoppingExecutor(pool):
+            def submit(self, fn, *args):
+                # stop() from another thread, while the scheduler is about to submit a poll
+                stopper = threading.Thread(target=scheduler.stop)
+                stopper.start()
+                stopper.join(0.2)
+                return super().submit(fn, *args)
+
+        with mock.patch.object(concurrent.futures, 'ThreadPoolExecutor', StoppingExecutor), \
+                mock.patch.object(threading, 'excepthook', errors.append):
+            scheduler.start()
+            scheduler._thread.join(2)
+        self.assertFalse(scheduler._thread.is_alive())
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
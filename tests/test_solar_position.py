@@ -0,0 +1,68 @@
+import os
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from enrichers import solar_position
+from enrichers.solar_system_influence import SolarSystemInfluence
+from utils.record_batch import RecordBatch
+
+EPHEMERIS = 'de421.bsp'
+
+
+class TestSolarPosition(unittest.TestCase):
+    def test_epoch_seconds(self):
+        seconds = solar_position.epoch_seconds(
+            ["2024-06-01T12:00:00Z", "2024-06-01T12:00:00+00:00", "2024-06-01", "not a time", None])
+        expected = datetime(2024, 6, 1, 12).timestamp() - datetime(1970, 1, 1, 0).timestamp()
+        self.assertEqual(seconds[0], expected)
+        self.assertEqual(seconds[1], expected)
+        self.assertEqual(seconds[2], expected - 12 * 3600)
+        self.assertTrue(np.isnan(seconds[3:]).all())
+
+    def test_invalid_rows_are_dark(self):
+        intensity = solar_position.light_intensity([52.0, np.nan, 52.0], [4.0, 4.0, 4.0],
+                                                   ["2024-06-21T12:00:00", "2024-06-21T12:00:00", "bad"])
+        self.assertGreater(intensity[0], 0.6)
+        self.assertEqual(intensity[1:].tolist(), [0.0, 0.0])
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_error_against_skyfield(self):
+        """The fast path stays within the documented error of the skyfield path."""
+        from skyfield.api import wgs84
+
+        rng = np.random.default_rng(7)
+        count = 200
+        latitudes = rng.uniform(-89, 89, count)
+        longitudes = rng.uniform(-180, 180, count)
+        start, end = np.datetime64('1950-01-01T00:00:00'), np.datetime64('2050-01-01T00:00:00')
+        times = start + (rng.uniform(0, 1, count) * (end - start).astype(np.int64)).astype('timedelta64[s]')
+
+        enricher = SolarSystemInfluence(light_mode='skyfield')
+        fast = solar_position.solar_altitude(latitudes, longitudes, solar_position.epoch_seconds(times))
+        errors = []
+        for latitude, longitude, time, altitude in zip(latitudes, longitudes, times.tolist(), fast):
+            observer = enricher.planets['earth'] + wgs84.latlon(latitude, longitude)
+            reference = observer.at(enricher.skyfield_time(time)).observe(enricher.planets['sun']).apparent().altaz()[0].degrees
+            errors.append(abs(reference - altitude))
+        self.assertLess(max(errors), solar_position.MAX_ALTITUDE_ERROR_DEGREES)
+
+        # And so light_intensity, through both enricher modes
+        records = [{"latitude": float(latitude), "longitude": float(longitude), "timestamp": str(time)}
+                   for latitude, longitude, time in zip(latitudes[:20], longitudes[:20], times[:20])]
+        fast_enricher = SolarSystemInfluence(light_mode='fast')
+        batch = RecordBatch.from_records(records)
+        fast_enricher.enrich_batch(batch)
+        for record, intensity in zip(records, batch.column('light_intensity')):
+            self.assertAlmostEqual(intensity, enricher.get_light_intensity_at_location(record),
+                                   delta=solar_position.MAX_ALTITUDE_ERROR_DEGREES / 90)
+            self.assertEqual(intensity, fast_enricher.get_light_intensity_at_location(record))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            SolarSystemInfluence(light_mode='exact')
+
+
+if __name__ == '__main__':
+    unittest.main()
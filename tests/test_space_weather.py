@@ -0,0 +1,84 @@
+import json
+import os
+import queue
+import tempfile
+import unittest
+
+from data_sources.space_weather_data import SpaceWeatherDataSource, parse_ace_lines
+from utils.record_batch import RecordBatch
+
+EPHEMERIS = 'de421.bsp'
+CONFIG = os.path.join(os.path.dirname(__file__), '..', 'src', 'config', 'space_weather_config.json')
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures', 'ace-magnetometer.txt')
+
+HEADER = """:Data_list: ace_mag_1m.txt
+# YR MO DA  HHMM    Day     Day    S     Bx      By      Bz      Bt     Lat.   Long.
+#------------------------------------------------------------------------------------
+"""
+LINES = [
+    "2024 06 01  1000   60462  36000    0    -5.9    -4.7    -1.3     7.6     7.4    49.9",
+    "2024 06 01  1001   60462  36060    0    -4.7    -3.2     3.1     6.4   -14.1   266.6",
+    "2024 06 01  1002   60462  36120    9  -999.9  -999.9  -999.9  -999.9  -999.9  -999.9",
+]
+NEXT = "2024 06 01  1003   60462  36180    0     6.0    -4.9    -5.8     9.6    17.6   145.1"
+
+
+class TestAceParser(unittest.TestCase):
+    def test_decodes_lines(self):
+        records, keys, dropped = parse_ace_lines(LINES + ["2024 02 30  1000   60462  36000    0  1  1  1  1  1  1",
+                                                          "2024 06 01  1004 truncated"])
+        self.assertEqual(dropped, 3)
+        self.assertEqual(keys, ["2024 06 01  1000", "2024 06 01  1001", "2024 06 01  1002"])
+        self.assertEqual(records[0], {
+            "time": "2024-06-01T10:00:00", "status": 0, "bx": -5.9, "by": -4.7, "bz": -1.3, "bt": 7.6,
+            "latitude": 7.4, "longitude": 49.9 - 180, "location": f"7.4,{49.9 - 180}",
+        })
+        self.assertEqual(records[1]["time"], "2024-06-01T10:01:00")
+
+    def test_fixture(self):
+        with open(FIXTURE) as fixture:
+            lines = [line for line in fixture.read().splitlines() if line[:1].isdigit()]
+        records, keys, dropped = parse_ace_lines(lines)
+        self.assertEqual(len(records) + dropped, len(lines))
+        self.assertEqual(len(keys), len(lines))
+
+
+class TestIncrementalPolls(unittest.TestCase):
+    def test_only_new_lines_are_emitted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, 'space_weather_config.json')
+            with open(config_path, 'w') as config_file:
+                json.dump({'url': 'http://localhost/ace', 'enrichment': {'light_intensity': False, 'influence': False}},
+                          config_file)
+            output = queue.Queue()
+            source = SpaceWeatherDataSource(config_path=config_path, queue=output)
+
+        source.parse_data(HEADER + "\n".join(LINES))
+        first = output.get_nowait().to_records()
+        self.assertEqual([record["timestamp"] for record in first], ["2024-06-01T10:00:00", "2024-06-01T10:01:00"])
+        self.assertEqual(source.last_time_key, "2024 06 01  1002")
+
+        # Nothing new, then one new line in a window that has rolled on
+        source.parse_data(HEADER + "\n".join(LINES))
+        self.assertTrue(output.empty())
+        source.parse_data(HEADER + "\n".join(LINES[1:] + [NEXT]))
+        second = output.get_nowait().to_records()
+        self.assertEqual([record["timestamp"] for record in second], ["2024-06-01T10:03:00"])
+        self.assertEqual(second[0]["source"], "space_weather")
+
+    @unittest.skipUnless(os.path.exists(EPHEMERIS), "needs the de421 ephemeris")
+    def test_shipped_config_enriches_a_poll_as_one_batch(self):
+        output = queue.Queue()
+        source = SpaceWeatherDataSource(config_path=CONFIG, queue=output)
+        self.assertEqual(source.enrichment_stage.enricher('space_weather').influence_mode, 'batch')
+        source.parse_data(HEADER + "\n".join(LINES + [NEXT]))
+        batch = output.get_nowait()
+        self.assertTrue(output.empty())
+        self.assertIsInstance(batch, RecordBatch)
+        records = batch.to_records()
+        self.assertEqual(len(records), 3)
+        self.assertTrue(all('total_influence' in record for record in records))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_elasticsearch import FakeElasticsearch
+from main import WeatherLab
+from storage.elasticsearch import ElasticsearchStorage
+from storage.fanout import FanOut, Sink
+from storage.spool import Spool
+
+
+def bulk(start, count=5):
+    return [{
+        "source": "metar",
+        "station_id": f"S{start + i}",
+        "latitude": 52.0 + (start + i) * 0.001,
+        "longitude": 4.0,
+        "timestamp": "2024-06-01T12:00:00"
+    } for i in range(count)]
+
+
+def stations(spool, sequences=None):
+    return [station for _, batch in spool.replay(sequences) for station in batch.column('station_id').tolist()]
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unacknowledged_bulks_are_replayed_after_restart(self):
+        spool = Spool(self.path)
+        first = spool.append(bulk(0))
+        second = spool.append(bulk(5))
+        third = spool.append(bulk(10))
+        spool.ack(third)
+        spool.ack(first)
+        spool.close()
+
+        reopened = Spool(self.path)
+        self.assertEqual(reopened.committed, first[-1])
+        # Acks beyond the first gap are not checkpointed, so delivery is at least once
+        self.assertEqual(stations(reopened), [f"S{i}" for i in range(5, 15)])
+        reopened.ack(second)
+        self.assertEqual(reopened.append(bulk(15)), [third[-1] + 1])
+        reopened.close()
+
+    def test_torn_entry_ends_the_segment(self):
+        spool = Spool(self.path)
+        spool.append(bulk(0))
+        spool.append(bulk(5))
+        spool.close()
+        segment = glob.glob(os.path.join(self.path, '*.seg'))[0]
+        with open(segment, 'r+b') as segment_file:
+            segment_file.truncate(os.path.getsize(segment) - 3)
+        self.assertEqual(stations(Spool(self.path)), [f"S{i}" for i in range(5)])
+
+    def test_writing_resumes_after_a_torn_first_entry(self):
+        spool = Spool(self.path, fsync_interval=0)
+        spool.append(bulk(0))
+        spool.close()
+        spool = Spool(self.path, fsync_interval=0)
+        spool.append(bulk(5))
+        spool.close()
+        # The crash tore the first entry of the second segment
+        torn = sorted(glob.glob(os.path.join(self.path, '*.seg')))[-1]
+        with open(torn, 'r+b') as segment_file:
+            segment_file.truncate(10)
+
+        spool = Spool(self.path, fsync_interval=0)
+        self.assertEqual(spool.append(bulk(10)), [2])
+        spool.close()
+        spool = Spool(self.path, fsync_interval=0)
+        self.assertEqual(stations(spool), [f"S{i}" for i in range(5)] + [f"S{i}" for i in range(10, 15)])
+        self.assertEqual(len(spool._segments), len(set(spool._segments)))
+        spool.ack([1, 2])
+        spool.close()
+        self.assertEqual(Spool(self.path).pending(), 0)
+
+    def test_acknowledged_segments_are_deleted(self):
+        spool = Spool(self.path, segment_bytes=1, fsync_interval=0)
+        sequences = [spool.append(bulk(i * 5)) for i in range(4)]
+        self.assertEqual(len(glob.glob(os.path.join(self.path, '*.seg'))), 4)
+        for entry in sequences:
+            spool.ack(entry)
+        self.assertEqual(len(glob.glob(os.path.join(self.path, '*.seg'))), 1)
+        self.assertEqual(spool.pending(), 0)
+
+    def test_retention_evicts_the_oldest_segments(self):
+        spool = Spool(self.path, segment_bytes=1, max_bytes=1)
+        for i in range(4):
+            spool.append(bulk(i * 5))
+        self.assertEqual(stations(spool), [f"S{i}" for i in range(15, 20)])
+        self.assertEqual(spool.committed, 3)
+
+    def test_failed_entries_are_read_back(self):
+        spool = Spool(self.path)
+        spool.append(bulk(0))
+        failed = spool.append(bulk(5))
+        spool.nack(failed, ['sqlite'])
+        self.assertEqual(spool.take_failed(), {frozenset(['sqlite']): failed})
+        self.assertEqual(spool.take_failed(), {})
+        self.assertEqual(stations(spool, failed), [f"S{i}" for i in range(5, 10)])
+
+
+class TestSpooledWeatherLab(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('CMEMS_USERNAME', 'test_username')
+        os.environ.setdefault('CMEMS_PASSWORD', 'test_password')
+
+    def run_lab(self, storage, spool, records=()):
+        weather_lab = WeatherLab(elasticsearch_storage=storage)
+        weather_lab.data_sources = {}
+        weather_lab.idle_check_seconds = 0.05
+        weather_lab.spool = spool
+        for record in records:
+            weather_lab.queue.put(record)
+        asyncio.run(weather_lab.run())
+        storage.executor.shutdown()
+
+    def test_outage_becomes_a_backlog(self):
+        with tempfile.TemporaryDirectory() as path:
+            down = FakeElasticsearch(throttle_rate=1.0).start()
+            try:
+                self.run_lab(ElasticsearchStorage(es_url=down.url, max_retries=0), Spool(path), bulk(0, 20))
+            finally:
+                down.stop()
+            self.assertEqual(down.indices, {})
+
+            up = FakeElasticsearch().start()
+            try:
+                self.run_lab(ElasticsearchStorage(es_url=up.url), Spool(path))
+            finally:
+                up.stop()
+            self.assertEqual(up.indices, {"weather_data-2024-06-01": 20})
+            self.assertEqual(Spool(path).pending(), 0)
+
+    def test_failed_bulks_are_retried_in_the_failed_sinks_only(self):
+        written = {'store': [], 'flaky': [], 'agent': []}
+        down = [True]
+
+        def writer(name):
+            def write(records):
+                if name == 'flaky' and down[0]:
+                    raise ConnectionError("flaky is down")
+                written[name].append(records)
+            return write
+
+        with tempfile.TemporaryDirectory() as path:
+            weather_lab = WeatherLab(elasticsearch_storage=MagicMock())
+            weather_lab.spool = Spool(path)
+            weather_lab.spool_retry_seconds = 0
+            weather_lab.sinks = FanOut([Sink('store', writer('store')), Sink('flaky', writer('flaky')),
+                                        Sink('agent', writer('agent'), policy='drop')]).start()
+
+            async def flush_and_retry():
+                weather_lab.bulk_records = bulk(0)
+                await weather_lab.flush()
+                while weather_lab.sinks.pending() or not weather_lab.spool._failed:
+                    time.sleep(0.01)
+                down[0] = False
+                await weather_lab.retry_spooled()
+            asyncio.run(flush_and_retry())
+            weather_lab.sinks.stop()
+            self.assertEqual({name: len(bulks) for name, bulks in written.items()}, {'store': 1, 'flaky': 1, 'agent': 1})
+            self.assertEqual(weather_lab.spool.pending(), 0)
+            weather_lab.spool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
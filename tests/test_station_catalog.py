@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from data_sources.meteostat_data import MeteostatDataSource
+from data_sources.station_catalog import StationCatalog, distances_km
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures', 'meteostat', 'stations.json')
+
+
+class FakeStationList:
+    """Serves a gzipped station list with an ETag, answering 304 to a matching If-None-Match."""
+
+    def __init__(self, stations):
+        self.body = gzip.compress(json.dumps(stations).encode())
+        self.statuses = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.headers.get('If-None-Match') == '"v1"':
+                    fake.statuses.append(304)
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                fake.statuses.append(200)
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(fake.body)))
+                self.end_headers()
+                self.wfile.write(fake.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/stations/lite.json.gz"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def random_catalog(count=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = np.degrees(np.arcsin(rng.uniform(-1, 1, count)))
+    longitudes = rng.uniform(-180, 180, count)
+    return StationCatalog([f"{i:05d}" for i in range(count)], latitudes, longitudes,
+                          np.zeros(count), ["name"] * count, ["XX"] * count)
+
+
+class TestStationCatalog(unittest.TestCase):
+    def test_from_station_list(self):
+        with open(FIXTURE) as fixture:
+            stations = json.load(fixture)
+        catalog = StationCatalog.from_stations(stations + [{"id": "nowhere", "location": {}}])
+        self.assertEqual(len(catalog), len(stations))
+        station = catalog.get("10637")
+        self.assertEqual((station.name, station.country, station.elevation, station.location),
+                         ("Frankfurt/Main", "DE", 111.0, "50.05,8.6"))
+        self.assertIsNone(catalog.get("nowhere"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stations.npz')
+            catalog.save(path)
+            loaded = StationCatalog.load(path)
+        self.assertEqual(loaded.ids, catalog.ids)
+        self.assertEqual(loaded.get("10637").location, station.location)
+
+    def test_spatial_queries_match_a_full_scan(self):
+        catalog = random_catalog()
+        for latitude, longitude in ((52.3, 4.76), (89.5, 0.0), (-10.0, 179.9), (65.0, -179.5)):
+            distances = distances_km(latitude, longitude, catalog.latitudes, catalog.longitudes)
+            nearest = catalog.nearest(latitude, longitude, 25)
+            np.testing.assert_allclose(distances[nearest], np.sort(distances)[:25])
+            within = catalog.within_radius(latitude, longitude, 2000)
+            self.assertEqual(within.tolist(), np.nonzero(distances <= 2000)[0].tolist())
+        # A box across the antimeridian
+        box = catalog.within_bbox(40, 170, 60, -170)
+        latitudes, longitudes = catalog.latitudes, catalog.longitudes
+        expected = (latitudes >= 40) & (latitudes <= 60) & ((longitudes >= 170) | (longitudes <= -170))
+        self.assertEqual(box.tolist(), np.nonzero(expected)[0].tolist())
+
+
+class TestCachedCatalog(unittest.TestCase):
+    def setUp(self):
+        with open(FIXTURE) as fixture:
+            self.fake = FakeStationList(json.load(fixture))
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.fake.stop()
+        self.directory.cleanup()
+
+    def source(self, **config):
+        config_path = os.path.join(self.directory.name, 'meteostat_config.json')
+        with open(config_path, 'w') as config_file:
+            json.dump(dict(config, stations_url=self.fake.url, output_directory=self.directory.name), config_file)
+        return MeteostatDataSource(config_path=config_path, queue=None)
+
+    def test_catalog_is_cached_and_revalidated(self):
+        stations = self.source().fetch_station_list()
+        self.assertEqual(len(stations), 6)
+        # A new source within the TTL loads the cache file
+        self.assertEqual(len(self.source().fetch_station_list()), 6)
+        self.assertEqual(self.fake.statuses, [200])
+        # Past the TTL the catalog is revalidated, and kept when unchanged
+        self.assertEqual(len(self.source(station_catalog_ttl=0).fetch_station_list()), 6)
+        self.assertEqual(self.fake.statuses, [200, 304])
+
+    def test_station_selection(self):
+        region = self.source(station_region=[50, 0, 55, 10]).fetch_station_list()
+        self.assertEqual(sorted(station.id for station in region), ["06240", "10637"])
+        nearest = self.source(nearest_stations={"latitude": 52.3, "longitude": 4.76, "count": 2}).fetch_station_list()
+        self.assertEqual(nearest[0].id, "06240")
+        self.assertEqual(len(nearest), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from utils.helpers import validate_data
+from utils.metrics import METRICS
+from utils.record_batch import RecordBatch
+from utils.validation import Validator
+
+
+def dropped(source, reason):
+    return METRICS.value('records_dropped_total', source=source, reason=reason) or 0
+
+
+class TestValidation(unittest.TestCase):
+    def test_rows_and_values(self):
+        records = [
+            {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:00", "temperature": 18.0, "pressure": 1013.0},
+            {"latitude": 123.0, "longitude": 4.76, "timestamp": "2024-06-01T12:00:00"},
+            {"latitude": 52.3, "longitude": 4.76, "temperature": 18.0},
+            {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:00", "temperature": 99.0, "pressure": 400.0},
+        ]
+        before = dropped('test', 'latitude_out_of_range'), dropped('test', 'missing_timestamp')
+        batch = Validator().validate(RecordBatch.from_records(records, source='test'))
+        self.assertEqual(batch.to_records(), [
+            records[0],
+            {"latitude": 52.3, "longitude": 4.76, "timestamp": "2024-06-01T12:00:00"},
+        ])
+        self.assertEqual((dropped('test', 'latitude_out_of_range'), dropped('test', 'missing_timestamp')),
+                         (before[0] + 1, before[1] + 1))
+
+    def test_qc_flags(self):
+        records = [
+            {"latitude": "42.0", "longitude": "-30.0", "timestamp": "2024-06-01T00:00:00",
+             "temperature": "12.5", "temperature_qc": "1.0", "salinity": "34.5", "salinity_qc": "4.0", "position_qc": 1},
+            {"latitude": "42.1", "longitude": "-30.1", "timestamp": "2024-06-01T01:00:00",
+             "temperature": "12.6", "temperature_qc": "8.0", "salinity": "34.6", "salinity_qc": "-127", "position_qc": 4},
+            {"latitude": "42.2", "longitude": "-30.2", "timestamp": "2024-06-01T02:00:00",
+             "temperature": "12.7", "temperature_qc": "3.0", "salinity": "34.7", "salinity_qc": "2.0", "position_qc": 1},
+        ]
+        validated = validate_data(records, source='cmems')
+        self.assertEqual([record["timestamp"] for record in validated], ["2024-06-01T00:00:00", "2024-06-01T02:00:00"])
+        self.assertEqual(validated[0], {"latitude": "42.0", "longitude": "-30.0", "timestamp": "2024-06-01T00:00:00",
+                                        "temperature": "12.5"})
+        self.assertEqual(validated[1]["salinity"], "34.7")
+        self.assertNotIn("temperature", validated[1])
+
+    def test_everything_invalid(self):
+        batch = Validator().validate(RecordBatch.from_records([{"station_id": "X"}], source='test'))
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.to_records(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
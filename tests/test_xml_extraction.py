@@ -0,0 +1,52 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from utils.helpers import element_to_dict, utc_isoformat
+
+# Two entries in the layout of the aviationweather.gov METAR cache, with nested and repeated children
+METAR_XML = """<response version="1.3"><data num_results="2">
+<METAR><raw_text>EHAM 011155Z 24012KT 10SM FEW250 A2992</raw_text><station_id>EHAM</station_id>
+<observation_time>2024-06-01T11:55:00Z</observation_time><latitude>52.3086</latitude><longitude>4.7639</longitude>
+<temp_c>17.0</temp_c><wind_dir_degrees>240</wind_dir_degrees><visibility_statute_mi>10+</visibility_statute_mi>
+<quality_control_flags><auto_station>TRUE</auto_station></quality_control_flags>
+<sky_condition sky_cover="FEW" cloud_base_ft_agl="25000"/><sky_condition sky_cover="BKN" cloud_base_ft_agl="4500"/>
+<flight_category>VFR</flight_category><elevation_m>-3</elevation_m></METAR>
+<METAR><raw_text>YSSY 011200Z VRB03KT CAVOK</raw_text><station_id>YSSY</station_id>
+<observation_time>2024-06-01T12:00:00Z</observation_time><latitude>-33.9461</latitude><longitude>151.1772</longitude>
+<temp_c>12.5</temp_c><wind_dir_degrees>VRB</wind_dir_degrees>
+<sky_condition sky_cover="CAVOK"/><elevation_m>6</elevation_m></METAR>
+</data></response>"""
+
+
+class TestXmlExtraction(unittest.TestCase):
+    def test_first_of_repeated_tags_wins(self):
+        element = ET.fromstring("<METAR><temp_c>1.0</temp_c><sky_condition/><temp_c>2.0</temp_c></METAR>")
+        self.assertEqual(element_to_dict(element)['temp_c'], element.find('temp_c').text)
+
+    def test_matches_find_on_a_feed(self):
+        metars = list(ET.fromstring(METAR_XML).iter('METAR'))
+        self.assertEqual(len(metars), 2)
+        for metar in metars:
+            fields = element_to_dict(metar)
+            for child in metar:
+                self.assertEqual(fields[child.tag], metar.find(child.tag).text)
+
+    def test_utc_isoformat(self):
+        accepted = {
+            "2024-06-01T12:05:00Z": "2024-06-01T12:05:00",
+            "2024-06-01T12:05:00": "2024-06-01T12:05:00",
+            "2024-06-01 12:05:00": "2024-06-01T12:05:00",
+            "2024-06-01T12:05": "2024-06-01T12:05:00",
+            "2024-06-01T12:05:00.250Z": "2024-06-01T12:05:00.250000",
+            "2024-06-01T14:05:00+02:00": "2024-06-01T12:05:00",
+            "2024-06-01T00:30:00-01:00": "2024-06-01T01:30:00",
+        }
+        for value, expected in accepted.items():
+            self.assertEqual(utc_isoformat(value), expected, value)
+        for value in ("2024-06-01", "20240601", "2024-06-01 noon", "06/01/2024 12:05", ""):
+            with self.assertRaises(ValueError, msg=value):
+                utc_isoformat(value)
+
+
+if __name__ == '__main__':
+    unittest.main()